@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 import json
 import hashlib # Import hashlib for cache key generation
 from langchain.chains import LLMChain
@@ -8,6 +8,11 @@ from slais.utils.logging_utils import logger
 from slais import config # For MAX_CONTENT_CHARS_FOR_LLM
 from langchain_core.callbacks.base import BaseCallbackHandler # 新增导入
 from agents.cache.cache_manager import CacheManager # Import CacheManager
+from agents.token_budget import TokenBudget
+from agents.llm_scheduler import PRIORITY_NORMAL, get_scheduler
+
+# 流式输出回调：每收到一段新输出时以截至目前的完整文本调用一次
+StreamCallback = Callable[[str], None]
 
 class BaseAgent(ABC):
     @abstractmethod
@@ -23,10 +28,18 @@ class ResearchAgent(BaseAgent):
     研究智能体的基类，封装了与LLM交互的通用逻辑。
     Base class for research agents, encapsulating common logic for LLM interaction.
     """
+    # 请求在进程级调度器中的优先级（数值越小越优先），关键路径上的智能体覆盖此值
+    llm_priority = PRIORITY_NORMAL
+
     def __init__(self, llm_client: Any, provider_name: str = "unknown"): # provider_name can be used for specific logic if needed
         self.llm_client = llm_client
         self.provider_name = provider_name
         self.cache_manager = CacheManager() # Instantiate CacheManager
+        # 按模型上下文窗口计算的Token预算，用于在发送前把提示词控制在窗口以内
+        self.model_name = getattr(llm_client, "model_name", None) or config.settings.OPENAI_API_MODEL
+        self.token_budget = TokenBudget(self.model_name)
+        # 所有请求经进程级调度器发出，按模型共享并发数、RPM/TPM限制，并统一处理重试
+        self.scheduler = get_scheduler()
 
     @abstractmethod
     def _build_chain(self, prompt_template_str: str) -> Any: # 返回类型可以是 LCEL 链
@@ -40,7 +53,7 @@ class ResearchAgent(BaseAgent):
 
     def _truncate_content(self, text: str, max_chars: int) -> str:
         """
-        截断内容到指定的字符数。
+        截断内容到指定的字符数。发送给LLM的内容不再按字符预先截断，而是由 _fit_to_context_window 按模型上下文窗口的Token预算截断。
         Truncates content to a specified number of characters.
         """
         if len(text) > max_chars:
@@ -78,12 +91,41 @@ class ResearchAgent(BaseAgent):
         }
         return json.dumps(key_data, sort_keys=True, ensure_ascii=False)
 
+    @staticmethod
+    def _emit_stream(stream_callback: Optional[StreamCallback], text: str) -> None:
+        """调用流式输出回调；回调（如界面渲染）出错不影响分析本身。"""
+        if stream_callback is None:
+            return
+        try:
+            stream_callback(text)
+        except Exception as e:
+            logger.debug(f"流式输出回调出错: {e}")
+
+    def _fit_to_context_window(self, prompt_template_str: str, input_data: Dict[str, Any], content_key: str) -> Dict[str, Any]:
+        """
+        按Token计算提示模板和其他变量占用后剩余的预算，必要时在章节边界截断 content_key 对应的内容。
+        返回（可能）替换了该字段的新字典，不修改原字典。
+        """
+        content = input_data.get(content_key)
+        if not isinstance(content, str) or not content:
+            return input_data
+        budget = self.token_budget
+        reserved = budget.count(prompt_template_str) + sum(
+            budget.count(str(value)) for key, value in input_data.items() if key != content_key
+        )
+        fitted = budget.truncate(content, budget.prompt_budget - reserved)
+        if fitted is content:
+            return input_data
+        return {**input_data, content_key: fitted}
+
     async def _invoke_llm_analysis(
         self,
         prompt_template_str: str,
         input_data: Dict[str, Any], # 包含所有模板变量的字典，包括截断后的内容
         callbacks: Optional[List[BaseCallbackHandler]] = None,
-        cache_content_key: str = "content" # 指定用于生成缓存哈希的内容字段
+        cache_content_key: str = "content", # 指定用于生成缓存哈希的内容字段
+        stream_callback: Optional[StreamCallback] = None,
+        cache_if: Optional[Callable[[str], bool]] = None
     ) -> str:
         """
         通用的LLM分析执行方法，使用LCEL链并包含缓存逻辑。
@@ -96,10 +138,16 @@ class ResearchAgent(BaseAgent):
                                默认为 "content"，但对于 DeepAnalysisAgent 可能需要传入多个字段的组合或特定字段。
                                为了简化，这里假设有一个主要的内容字段用于哈希。
                                更复杂的哈希可以基于整个 input_data (排除回调)。
+            stream_callback: 提供时改用 astream 流式调用，每收到一段输出就以累计文本调用一次；
+                             缓存命中时立即以完整结果调用一次。
+            cache_if: 可选，返回 False 的结果（如无法解析的回答）不写入缓存，再次请求时重新调用LLM。
 
         Returns:
             LLM生成的文本内容或错误信息字符串。
         """
+        # 先把内容控制在模型上下文窗口以内，缓存键基于实际发送的内容
+        input_data = self._fit_to_context_window(prompt_template_str, input_data, cache_content_key)
+
         # 准备用于生成缓存键的 kwargs，这里我们传递整个 input_data
         # 但需要确保 content_for_hash 是从 input_data 中正确提取的
         content_for_hash = input_data.get(cache_content_key, "")
@@ -115,19 +163,42 @@ class ResearchAgent(BaseAgent):
         cached_result = self.cache_manager.get(cache_key)
         if cached_result is not None:
             logger.info(f"缓存命中，提示: {prompt_template_str[:50]}...")
+            self._emit_stream(stream_callback, cached_result)
             return cached_result
 
         logger.info(f"缓存未命中，执行LLM分析，提示: {prompt_template_str[:50]}...")
         chain = self._build_chain(prompt_template_str) # 子类实现此方法返回 LCEL 链
 
+        async def call_llm() -> str:
+            if stream_callback is None:
+                response = await chain.ainvoke(
+                    input_data,
+                    config={"callbacks": callbacks}
+                )
+                return response.content if hasattr(response, 'content') else str(response)
+            text = ""
+            async for chunk in chain.astream(input_data, config={"callbacks": callbacks}):
+                delta = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if isinstance(delta, str) and delta:
+                    text += delta
+                    self._emit_stream(stream_callback, text)
+            return text
+
+        # 发出前估算提示Token数，用于调度器的TPM限制（Token数按内容哈希缓存，不会重复编码）
+        estimated_tokens = self.token_budget.count(prompt_template_str) + sum(
+            self.token_budget.count(str(value)) for value in input_data.values()
+        )
         try:
-            response = await chain.ainvoke(
-                input_data,
-                config={"callbacks": callbacks}
+            response_text = await self.scheduler.submit(
+                self.model_name,
+                call_llm,
+                priority=self.llm_priority,
+                estimated_tokens=estimated_tokens,
+                label=type(self).__name__
             )
-            
-            response_text = response.content if hasattr(response, 'content') else str(response)
-            
+            if cache_if is not None and not cache_if(response_text):
+                logger.warning(f"结果不符合预期，不写入缓存，提示: {prompt_template_str[:50]}...")
+                return response_text
             self.cache_manager.set(cache_key, response_text)
             logger.info(f"结果已缓存，提示: {prompt_template_str[:50]}...")
             return response_text
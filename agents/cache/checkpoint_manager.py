@@ -0,0 +1,112 @@
+import sqlite3
+import json
+from pathlib import Path
+from typing import Any, Optional, Tuple
+from slais import config
+from slais.utils.logging_utils import logger
+
+class CheckpointManager:
+    """
+    按文献（PDF内容哈希 + DOI）保存流程各阶段的输出，
+    使中断的运行可以通过 --resume 只重新执行缺失或失败的阶段。
+    """
+    def __init__(self):
+        self.db_path = Path(config.settings.CACHE_DIR) / "pipeline_checkpoints.db"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = None
+        self.create_tables()
+        logger.debug(f"CheckpointManager initialized. Database path: {self.db_path}")
+
+    def connect(self):
+        """连接到SQLite数据库"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path)
+            logger.debug("Connected to checkpoint database")
+        return self.conn
+
+    def close(self):
+        """关闭数据库连接"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            logger.debug("Closed checkpoint database connection")
+
+    def create_tables(self):
+        """创建必要的表"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stage_checkpoints (
+                pdf_sha256 TEXT,
+                doi TEXT,
+                stage TEXT,
+                status TEXT,
+                output TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (pdf_sha256, doi, stage)
+            )
+        ''')
+        conn.commit()
+
+    def get_stage(self, pdf_sha256: str, doi: str, stage: str) -> Optional[Tuple[Any, str]]:
+        """
+        读取某个阶段的检查点。
+
+        Returns:
+            (阶段输出, 状态)，不存在或无法解析时返回 None
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT output, status FROM stage_checkpoints WHERE pdf_sha256 = ? AND doi = ? AND stage = ?",
+            (pdf_sha256, doi or "", stage)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(row[0]), row[1]
+        except (TypeError, json.JSONDecodeError) as e:
+            logger.warning(f"阶段 {stage} 的检查点数据无法解析，将重新执行: {e}")
+            return None
+
+    def set_stage(self, pdf_sha256: str, doi: str, stage: str, output: Any, status: str):
+        """保存某个阶段的输出和状态"""
+        try:
+            output_json = json.dumps(output, ensure_ascii=False, default=str)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"阶段 {stage} 的输出无法序列化，跳过保存检查点: {e}")
+            return
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO stage_checkpoints (pdf_sha256, doi, stage, status, output)
+            VALUES (?, ?, ?, ?, ?)
+        """, (pdf_sha256, doi or "", stage, status, output_json))
+        conn.commit()
+        logger.debug(f"已保存阶段 {stage} 的检查点 (状态: {status})")
+
+    def clear(self, pdf_sha256: str, doi: str):
+        """删除某篇文献的全部检查点"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM stage_checkpoints WHERE pdf_sha256 = ? AND doi = ?", (pdf_sha256, doi or ""))
+        conn.commit()
+
+
+class PaperCheckpoint:
+    """绑定到单篇文献的检查点视图，供 StageScheduler 使用。"""
+    def __init__(self, manager: CheckpointManager, pdf_sha256: str, doi: str):
+        self.manager = manager
+        self.pdf_sha256 = pdf_sha256
+        self.doi = doi or ""
+
+    def load(self, stage: str) -> Optional[Tuple[Any, str]]:
+        return self.manager.get_stage(self.pdf_sha256, self.doi, stage)
+
+    def save(self, stage: str, output: Any, status: str):
+        self.manager.set_stage(self.pdf_sha256, self.doi, stage, output, status)
+
+    def close(self):
+        """关闭该文献的检查点所用的数据库连接"""
+        self.manager.close()
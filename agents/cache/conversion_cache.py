@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+from slais import config
+from slais.pdf_utils import CONVERSION_PROFILES, conversion_version
+from slais.utils.logging_utils import logger
+
+class ConversionCache:
+    """
+    以PDF内容的SHA-256、转换配置档和转换版本为键的PDF转换结果缓存。
+    每个条目保存 Markdown、图片目录和内容列表，与PDF文件名无关；
+    命中时把条目复制到本次运行的输出目录 (paper_output_dir(pdf_path)/<stem>_markdown，按内容哈希区分同名文献)。
+    """
+    MARKDOWN_FILE = "document.md"
+    CONTENT_LIST_FILE = "content_list.json"
+    META_FILE = "meta.json"
+
+    def __init__(self):
+        self.cache_dir = Path(config.settings.CACHE_DIR) / "pdf_conversions"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.version = conversion_version()
+        logger.debug(f"ConversionCache initialized. Cache directory: {self.cache_dir}, version: {self.version}")
+
+    def _entry_dir(self, pdf_sha256: str, profile: str) -> Path:
+        return self.cache_dir / f"{pdf_sha256}_{profile}_v{self.version}"
+
+    def find(self, pdf_sha256: str, profile: str) -> Optional[Path]:
+        """
+        查找可用的缓存条目。产物是所请求配置档超集的条目同样可用（如 debug 条目可满足 standard 请求）。
+
+        Returns:
+            条目目录，未命中时返回 None
+        """
+        wanted = CONVERSION_PROFILES[profile]
+        candidates = [profile] + [
+            name for name, options in CONVERSION_PROFILES.items()
+            if name != profile and all(options[k] or not v for k, v in wanted.items())
+        ]
+        for name in candidates:
+            entry = self._entry_dir(pdf_sha256, name)
+            if (entry / self.MARKDOWN_FILE).is_file():
+                logger.info(f"PDF转换缓存命中: {entry.name}")
+                return entry
+        logger.info(f"PDF转换缓存未命中: {pdf_sha256[:12]}... (配置档 {profile})")
+        return None
+
+    def store(self, pdf_sha256: str, profile: str, markdown_dir: Path, stem: str, source_name: str = "") -> Optional[Path]:
+        """
+        把一次转换的产物保存为缓存条目。先写入临时目录再整体改名，避免并发写入时出现不完整的条目。
+
+        Args:
+            markdown_dir: 转换输出目录 (<stem>_markdown)
+            stem: 转换输出文件名前缀
+            source_name: 原PDF文件名，仅记录在元数据中
+        """
+        entry = self._entry_dir(pdf_sha256, profile)
+        if (entry / self.MARKDOWN_FILE).is_file():
+            return entry
+
+        markdown_dir = Path(markdown_dir)
+        tmp_entry = self.cache_dir / f".tmp_{uuid.uuid4().hex}"
+        try:
+            tmp_entry.mkdir(parents=True)
+            shutil.copy2(markdown_dir / f"{stem}.md", tmp_entry / self.MARKDOWN_FILE)
+            images_dir = markdown_dir / config.settings.PDF_IMAGES_SUBDIR
+            if images_dir.is_dir():
+                shutil.copytree(images_dir, tmp_entry / config.settings.PDF_IMAGES_SUBDIR)
+            content_list = markdown_dir / f"{stem}_content_list.json"
+            if content_list.is_file():
+                shutil.copy2(content_list, tmp_entry / self.CONTENT_LIST_FILE)
+            with open(tmp_entry / self.META_FILE, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "pdf_sha256": pdf_sha256,
+                    "profile": profile,
+                    "version": self.version,
+                    "source_name": source_name,
+                    "timestamp": time.time(),
+                }, f, ensure_ascii=False, indent=2)
+            os.rename(tmp_entry, entry)
+            logger.info(f"PDF转换结果已写入缓存: {entry}")
+            return entry
+        except OSError as e:
+            if (entry / self.MARKDOWN_FILE).is_file():
+                # 其他任务已写入同一条目
+                return entry
+            logger.error(f"写入PDF转换缓存失败: {e}")
+            return None
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    def materialize(self, entry: Path, markdown_dir: Path, stem: str) -> Path:
+        """
+        把缓存条目复制到输出目录，文件名使用本次运行的 stem。
+
+        Returns:
+            输出目录中的 Markdown 文件路径
+        """
+        markdown_dir = Path(markdown_dir)
+        markdown_dir.mkdir(parents=True, exist_ok=True)
+        md_file_path = markdown_dir / f"{stem}.md"
+        shutil.copy2(entry / self.MARKDOWN_FILE, md_file_path)
+
+        images_dir = markdown_dir / config.settings.PDF_IMAGES_SUBDIR
+        shutil.rmtree(images_dir, ignore_errors=True)
+        cached_images = entry / config.settings.PDF_IMAGES_SUBDIR
+        if cached_images.is_dir():
+            shutil.copytree(cached_images, images_dir)
+        else:
+            images_dir.mkdir(parents=True, exist_ok=True)
+
+        if (entry / self.CONTENT_LIST_FILE).is_file():
+            shutil.copy2(entry / self.CONTENT_LIST_FILE, markdown_dir / f"{stem}_content_list.json")
+        logger.info(f"已从缓存恢复PDF转换结果到: {markdown_dir}")
+        return md_file_path
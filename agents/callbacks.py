@@ -4,29 +4,70 @@ from langchain_core.outputs import LLMResult
 from slais.utils.logging_utils import logger
 import tiktoken # 用于在API未提供token数时的备用计算
 import os
+from functools import lru_cache
 
 def load_model_costs_from_env():
     """
     从环境变量加载模型价格配置，格式如：
-    MODEL_COSTS=qwen-turbo:0.0003:0.0006,gpt-4:0.03:0.06
-    各项分别为: 模型名:prompt单价:completion单价（每1000token，单位元）
+    MODEL_COSTS=qwen-turbo:0.0003:0.0006,gpt-4o:0.0025:0.01:0.00125
+    各项分别为: 模型名:prompt单价:completion单价[:缓存命中的prompt单价]（每1000token，单位元）
+    未给出缓存命中单价时按 prompt 单价乘以 CACHED_PROMPT_COST_RATIO 计算。
     """
     env_val = os.environ.get("MODEL_COSTS", "")
     costs = {}
     if env_val:
         for item in env_val.split(","):
             parts = item.strip().split(":")
-            if len(parts) == 3:
-                model, prompt, completion = parts
+            if len(parts) in (3, 4):
+                model, prompt, completion = parts[:3]
                 try:
                     costs[model.strip()] = {
                         "prompt": float(prompt) / 1000,
                         "completion": float(completion) / 1000
                     }
+                    if len(parts) == 4:
+                        costs[model.strip()]["cached_prompt"] = float(parts[3]) / 1000
                 except Exception:
                     continue
     return costs
 
+
+def load_cached_prompt_cost_ratio() -> float:
+    """缓存命中的提示Token相对普通提示Token的价格比例（CACHED_PROMPT_COST_RATIO，默认0.5）。"""
+    try:
+        return float(os.environ.get("CACHED_PROMPT_COST_RATIO", "0.5"))
+    except ValueError:
+        return 0.5
+
+
+def cached_prompt_tokens(token_usage: Dict[str, Any]) -> int:
+    """
+    读取服务端提示词前缀缓存命中的Token数：OpenAI 兼容接口为 prompt_tokens_details.cached_tokens，
+    DeepSeek 为 prompt_cache_hit_tokens；未报告时为0。
+    """
+    details = token_usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens") if isinstance(details, dict) else None
+    return int(cached or token_usage.get("prompt_cache_hit_tokens") or 0)
+
+def token_usage_from_result(response: LLMResult) -> Optional[Dict[str, Any]]:
+    """
+    读取一次LLM调用的Token用量。非流式调用在 llm_output['token_usage'] 中报告；
+    流式调用 (astream) 没有 llm_output，改为从消息的 usage_metadata 转换为同样的格式。
+    """
+    if response.llm_output and 'token_usage' in response.llm_output:
+        return response.llm_output['token_usage']
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return {
+                    "prompt_tokens": usage.get("input_tokens", 0),
+                    "completion_tokens": usage.get("output_tokens", 0),
+                    "prompt_tokens_details": {"cached_tokens": details.get("cache_read", 0)},
+                }
+    return None
+
 # 优先从环境变量加载模型价格，否则用默认
 MODEL_COST_PER_TOKEN = load_model_costs_from_env()
 if not MODEL_COST_PER_TOKEN:
@@ -37,6 +78,42 @@ if not MODEL_COST_PER_TOKEN:
         # 根据需要添加更多模型
     }
 
+CACHED_PROMPT_COST_RATIO = load_cached_prompt_cost_ratio()
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str):
+    """
+    获取模型的 tiktoken 编码器（按模型名缓存，供Token统计和 agents.token_budget 共用）。
+    未知模型依次尝试基础模型名和 cl100k_base；编码表无法加载（如离线环境）时返回 None。
+    """
+    try:
+        # 尝试为指定模型获取tiktoken编码器
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        pass
+    except Exception as e:
+        logger.warning(f"加载模型 '{model_name}' 的Tiktoken编码器失败: {e}。Token数将使用近似估算。")
+        return None
+    # 尝试移除可能的后缀，如 -instruct 或 -preview
+    base_model_name = model_name.split('-')[0]
+    try:
+        tokenizer = tiktoken.encoding_for_model(base_model_name)
+        logger.warning(
+            f"模型 '{model_name}' 的Tiktoken编码器未找到，但找到了基础模型 '{base_model_name}' 的编码器。"
+        )
+        return tokenizer
+    except Exception:
+        pass
+    logger.warning(
+        f"模型 '{model_name}' 或基础模型 '{base_model_name}' 的Tiktoken编码器未找到。 "
+        f"将使用 'cl100k_base' 作为备用。Token数可能为近似值。"
+    )
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"加载 'cl100k_base' 编码器失败: {e}。Token数将使用近似估算。")
+        return None
+
 class TokenUsageCallbackHandler(BaseCallbackHandler):
     """回调处理器，用于跟踪Token使用量和估算成本。"""
 
@@ -45,25 +122,11 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         self.model_name = model_name
         self.total_prompt_tokens = 0
         self.total_completion_tokens = 0
+        self.total_cached_prompt_tokens = 0
         self.total_cost = 0.0
+        self.total_cache_savings = 0.0
         self._current_tiktoken_prompt_tokens = 0 # 用于临时存储当前调用的tiktoken估算值
-        try:
-            # 尝试为指定模型获取tiktoken编码器
-            self.tokenizer = tiktoken.encoding_for_model(self.model_name)
-        except KeyError:
-            # 尝试移除可能的后缀，如 -instruct 或 -preview
-            base_model_name = self.model_name.split('-')[0]
-            try:
-                self.tokenizer = tiktoken.encoding_for_model(base_model_name)
-                logger.warning(
-                    f"模型 '{self.model_name}' 的Tiktoken编码器未找到，但找到了基础模型 '{base_model_name}' 的编码器。"
-                )
-            except KeyError:
-                logger.warning(
-                    f"模型 '{self.model_name}' 或基础模型 '{base_model_name}' 的Tiktoken编码器未找到。 "
-                    f"将使用 'cl100k_base' 作为备用。Token数可能为近似值。"
-                )
-                self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = get_tokenizer(self.model_name)
 
     def on_llm_start(
         self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
@@ -71,7 +134,7 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         """LLM运行开始时调用。使用tiktoken估算并记录完整输入提示的Token数。
         'prompts' 参数列表中的字符串是已完全渲染的提示，包括所有替换的变量（如文献全文内容）。
         """
-        if prompts:
+        if prompts and self.tokenizer is not None:
             try:
                 # prompts 列表包含了发送给LLM的完整请求字符串
                 self._current_tiktoken_prompt_tokens = sum(len(self.tokenizer.encode(p)) for p in prompts)
@@ -87,17 +150,18 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
                 self._current_tiktoken_prompt_tokens = 0
         else:
             self._current_tiktoken_prompt_tokens = 0
-            logger.debug("LLM调用开始，但未提供提示内容给回调函数。")
+            logger.debug("LLM调用开始，但未提供提示内容给回调函数或编码器不可用。")
 
     def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
         """LLM运行结束时调用，收集Token使用信息。"""
         prompt_tokens_api = 0
         completion_tokens_api = 0
         
-        if response.llm_output and 'token_usage' in response.llm_output:
-            token_usage = response.llm_output['token_usage']
+        token_usage = token_usage_from_result(response)
+        if token_usage is not None:
             prompt_tokens_api = token_usage.get('prompt_tokens', 0)
             completion_tokens_api = token_usage.get('completion_tokens', 0)
+            cached_tokens_api = min(cached_prompt_tokens(token_usage), prompt_tokens_api or 0)
 
             # 如果API未提供prompt_tokens，但我们通过tiktoken估算了，可以记录这一点
             if prompt_tokens_api == 0 and self._current_tiktoken_prompt_tokens > 0:
@@ -109,13 +173,16 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
 
             self.total_prompt_tokens += prompt_tokens_api
             self.total_completion_tokens += completion_tokens_api
+            self.total_cached_prompt_tokens += cached_tokens_api
             
-            cost = self._calculate_cost(prompt_tokens_api, completion_tokens_api)
+            cost = self._calculate_cost(prompt_tokens_api, completion_tokens_api, cached_tokens_api)
             self.total_cost += cost
+            if cached_tokens_api:
+                self.total_cache_savings += self._calculate_cost(prompt_tokens_api, completion_tokens_api) - cost
             
             logger.info(
                 f"LLM调用完成。 "
-                f"提示Token (API报告): {prompt_tokens_api}, "
+                f"提示Token (API报告): {prompt_tokens_api} (其中缓存命中 {cached_tokens_api}), "
                 f"补全Token (API报告): {completion_tokens_api}, "
                 f"本次调用成本: ￥{cost:.6f}"
             )
@@ -149,8 +216,8 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         # 重置当前调用的tiktoken估算值
         self._current_tiktoken_prompt_tokens = 0
 
-    def _calculate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
-        """根据模型和Token数量计算成本。"""
+    def _calculate_cost(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """根据模型和Token数量计算成本。cached_tokens 为提示Token中命中服务端前缀缓存的部分，按缓存单价计。"""
         cost_info = MODEL_COST_PER_TOKEN.get(self.model_name)
         
         # 如果精确模型名称未找到，尝试匹配基础模型 (例如 "gpt-4" 匹配 "gpt-4-turbo")
@@ -162,7 +229,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
                     break
         
         if cost_info:
-            prompt_cost = prompt_tokens * cost_info.get("prompt", 0)
+            prompt_price = cost_info.get("prompt", 0)
+            cached_price = cost_info.get("cached_prompt", prompt_price * CACHED_PROMPT_COST_RATIO)
+            prompt_cost = (prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
             completion_cost = completion_tokens * cost_info.get("completion", 0)
             return prompt_cost + completion_cost
         else:
@@ -175,7 +244,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
             "total_prompt_tokens": self.total_prompt_tokens,
             "total_completion_tokens": self.total_completion_tokens,
             "total_tokens": self.total_prompt_tokens + self.total_completion_tokens,
+            "total_cached_prompt_tokens": self.total_cached_prompt_tokens,
             "total_cost": self.total_cost,
+            "cache_savings": self.total_cache_savings,
         }
 
     def log_total_usage(self) -> None:
@@ -183,8 +254,8 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         usage = self.get_total_usage_and_cost()
         logger.info(
             f"总Token使用情况: "
-            f"提示Token: {usage['total_prompt_tokens']}, "
+            f"提示Token: {usage['total_prompt_tokens']} (其中缓存命中 {usage['total_cached_prompt_tokens']}), "
             f"补全Token: {usage['total_completion_tokens']}, "
             f"总Token: {usage['total_tokens']}. "
-            f"估算总成本: ￥{usage['total_cost']:.6f}"
+            f"估算总成本: ￥{usage['total_cost']:.6f} (前缀缓存节省 ￥{usage['cache_savings']:.6f})"
         )
@@ -335,8 +335,19 @@ def generate_enhanced_report(results: dict, pdf_filename_stem: str) -> str:
     md_content.append("<details open>")
     md_content.append("<summary>点击展开/折叠</summary>")
     md_content.append("")
+    image_stats = results.get("image_analysis_stats")
+    if image_stats and image_stats.get("images"):
+        md_content.append(
+            f"<p>共分析 {image_stats['images']} 张图片，失败 {image_stats['failed']} 张（其中超时 {image_stats.get('timed_out', 0)} 张）；"
+            f"缓存命中 {image_stats.get('cache_hits', 0)} 张，重复图片 {image_stats.get('duplicates', 0)} 张，"
+            f"筛选跳过 {image_stats.get('skipped', 0)} 张，仅依据图注 {image_stats.get('caption_only', 0)} 张；"
+            f"请求 {image_stats['attempts']} 次（重试 {image_stats['retries']} 次，限流 {image_stats['rate_limited']} 次）；"
+            f"单图耗时 平均 {image_stats['latency_avg']} 秒 / P95 {image_stats['latency_p95']} 秒。</p>"
+        )
+        md_content.append("")
+    skipped_images = [img for img in image_analysis or [] if isinstance(img, dict) and img.get("skipped")]
     if image_analysis and isinstance(image_analysis, list):
-        for idx, img in enumerate(image_analysis):
+        for idx, img in enumerate(img for img in image_analysis if not img.get("skipped")):
             img_path = img.get("image_path", "")
             desc = img.get("description", "")
             rel_img_path = img_path
@@ -356,11 +367,21 @@ def generate_enhanced_report(results: dict, pdf_filename_stem: str) -> str:
             md_content.append("")
             md_content.append(f"![图片{idx+1}]({rel_img_path})")
             md_content.append("")
+            if img.get("duplicate_of"):
+                md_content.append(f"*与 `{Path(img['duplicate_of']).name}` 为重复图片，复用其描述。*")
+                md_content.append("")
             md_content.append(f"**结构化描述：**\n{desc}")
             md_content.append("</details>")
             md_content.append("")
     else:
         md_content.append("<p>未检测到图片或图片内容分析结果。</p>")
+    if skipped_images:
+        md_content.append("**以下图片经本地筛选判定为图标、标志或小图，未调用图片模型：**")
+        md_content.append("")
+        for img in skipped_images:
+            reasons = "；".join(img.get("skip_reasons") or [])
+            md_content.append(f"- `{Path(img.get('image_path', '')).name}`：{reasons}")
+        md_content.append("")
     md_content.append("</details>")
     md_content.append("")
     md_content.append("\n---\n")
@@ -1,101 +1,465 @@
 import asyncio
 import base64
+import hashlib
+import json
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import openai
+
+from slais import config
 from slais.utils.logging_utils import logger # 导入 logger
+from slais.utils.image_utils import (
+    find_duplicate_images, image_fingerprint, image_pixels, prepare_image_for_upload, score_image_relevance
+)
 from langchain_core.messages import HumanMessage # 导入 HumanMessage
-from agents.prompts import IMAGE_ANALYSIS_BASE_PROMPT # 导入图片分析基础提示词
+from agents.cache.cache_manager import CacheManager
+from agents.json_utils import parse_llm_json
+from agents.llm_scheduler import PRIORITY_NORMAL, RETRYABLE_ERRORS, get_scheduler, retry_delay
+from agents.prompts import (  # 导入图片分析基础提示词
+    IMAGE_ANALYSIS_BASE_PROMPT, IMAGE_ANALYSIS_PACK_INSTRUCTIONS, IMAGE_ANALYSIS_PROMPT_VERSION
+)
+
+class ImageAnalysisTimeout(Exception):
+    """单张图片（或一次打包请求）的分析超过时限。"""
+
+
+@dataclass
+class _ImageJob:
+    """已读取并编码、等待请求图片模型的图片。"""
+    image_path: str
+    cache_key: Optional[str]
+    image_url: str
+    original_bytes: int
+    upload_bytes: int
+    pixels: int
+    caption: Optional[str] = None
+    image_context: Optional[str] = None
+
 
 class ImageAnalysisAgent:
     """
     智能体：分析PDF转化后提取的图片，输出结构化描述。
+    图片LLM请求经进程级调度器 (agents.llm_scheduler) 的独立通道 (<模型名>:vision) 发出，受图片的并发数和每分钟请求数限制，
+    被限流或超时的请求按 Retry-After 或指数退避重试；限制对批处理中的所有文献合并生效。
+    分析结果按图片内容哈希、模型、温度和提示词版本缓存，命中时不发出请求。
+    上传前在线程中把图片缩放到长边上限并转码为目标格式（见 slais.utils.image_utils）。
+    按感知哈希识别重复图片（同一图片的不同分辨率、重复的标志等），每组只分析一张。
+    按尺寸、宽高比、像素熵和是否有图注估计图片相关性，图标、期刊标志等低分图片被跳过或延后分析。
+    每张图片的提示词使用其自身的图注和正文中的相关段落；图注足够详细时可不调用图片模型。
+    IMAGE_PACK_SIZE 大于1时把多张图片打包为一次请求，适用于按请求数限流的服务商。
+    analyze_images_iter 按完成顺序逐张产出结果；超过 IMAGE_ANALYSIS_DEADLINE 的图片记为超时而不阻塞其余结果。
     """
 
-    def __init__(self, llm_client):
+    # 图片请求在调度器中的优先级
+    llm_priority = PRIORITY_NORMAL
+
+    def __init__(self, llm_client, max_concurrency: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None, max_retries: Optional[int] = None):
         self.llm = llm_client
+        self.max_concurrency = max_concurrency or config.settings.IMAGE_LLM_MAX_CONCURRENCY
+        rpm = config.settings.IMAGE_LLM_RPM if requests_per_minute is None else requests_per_minute
+        self.max_retries = config.settings.IMAGE_LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base_delay = config.settings.IMAGE_LLM_RETRY_BASE_DELAY
+        self.request_timeout = config.settings.IMAGE_LLM_REQUEST_TIMEOUT
+        self.model_name = getattr(llm_client, "model_name", None) or config.settings.IMAGE_LLM_API_MODEL
+        # 图片请求使用独立的调度通道：同一多模态模型同时用于文本和图片时，图片的限制不会覆盖文本请求的限制
+        self.lane_name = f"{self.model_name}:vision"
+        self.scheduler = get_scheduler()
+        self.scheduler.configure(self.lane_name, max_concurrency=self.max_concurrency, requests_per_minute=rpm)
+        self.cache_manager = CacheManager() if config.settings.IMAGE_ANALYSIS_CACHE_ENABLED else None
+        self.upload_max_edge = config.settings.IMAGE_UPLOAD_MAX_EDGE
+        self.upload_format = config.settings.IMAGE_UPLOAD_FORMAT
+        self.upload_quality = config.settings.IMAGE_UPLOAD_QUALITY
+        self.dedup_max_distance = config.settings.IMAGE_DEDUP_MAX_DISTANCE if config.settings.IMAGE_DEDUP_ENABLED else None
+        self.filter_mode = config.settings.IMAGE_FILTER_MODE
+        self.time_limit = config.settings.IMAGE_ANALYSIS_DEADLINE
+
+    def _cache_key(self, image_bytes: bytes) -> str:
+        """图片分析缓存键：图片内容哈希 + 图片模型 + 温度 + 提示词版本 + 上传预处理参数。"""
+        return json.dumps({
+            "task": "image_analysis",
+            "image_sha256": hashlib.sha256(image_bytes).hexdigest(),
+            "model": self.model_name,
+            "temperature": getattr(self.llm, "temperature", config.settings.IMAGE_LLM_TEMPERATURE),
+            "prompt_version": IMAGE_ANALYSIS_PROMPT_VERSION,
+            "upload": [self.upload_max_edge, self.upload_format, self.upload_quality],
+        }, sort_keys=True)
+
+    def _encode_for_upload(self, image_bytes: bytes):
+        """缩放、转码并编码为 data URL（同步，在线程中执行）。返回 (data URL, 上传字节数, 上传图片像素数)。"""
+        payload, mime_type = prepare_image_for_upload(
+            image_bytes, self.upload_max_edge, self.upload_format, self.upload_quality
+        )
+        return (
+            f"data:{mime_type};base64,{base64.b64encode(payload).decode('utf-8')}",
+            len(payload),
+            image_pixels(payload),
+        )
 
-    async def analyze_images(self, image_paths: List[str], context: Optional[str] = None, callbacks=None) -> List[Dict[str, Any]]:
+    async def analyze_images(self, image_paths: List[str], context: Optional[str] = None, callbacks=None,
+                             captions: Optional[Dict[str, str]] = None,
+                             image_contexts: Optional[Dict[str, str]] = None,
+                             time_limit: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         对图片列表进行内容分析，返回结构化描述。
         Args:
             image_paths: 图片文件路径列表 (应为绝对路径或LLM可访问的URL)
-            context: 可选，图片所在文档的上下文文本
+            context: 可选，图片所在文档的上下文文本，仅用于既无图注也无相关段落的图片
             callbacks: LLM回调
+            captions: 可选，图片路径 -> 图注，用于相关性筛选和提示词
+            image_contexts: 可选，图片路径 -> 正文中的相关段落
+            time_limit: 可选，单张图片（或一次打包请求）从首次请求起含重试的时限（秒），
+                默认取 IMAGE_ANALYSIS_DEADLINE，0 表示不限
         Returns:
-            每张图片的结构化描述列表
+            与 image_paths 顺序一致的结构化描述列表。每项另含 latency_seconds（含重试的耗时）、attempts（请求次数）、
+            rate_limited（被限流次数）、cached（是否来自缓存）、original_bytes / upload_bytes（原图与上传大小）、
+            duplicate_of（重复图片所复用描述的代表图片路径）、relevance_score、skipped / skip_reasons（被筛选跳过）、
+            low_priority（延后分析）、caption_only（仅依据图注，未调用图片模型）、pack_size（打包请求的图片数）、
+            timed_out（超过时限）和 failed，可用 summarize_image_analysis 汇总。
         """
-        results = []
+        results = [None] * len(image_paths)
+        async for index, result in self._iter_results(image_paths, context, callbacks, captions, image_contexts, time_limit):
+            results[index] = result
+        return results
+
+    async def analyze_images_iter(self, image_paths: List[str], context: Optional[str] = None, callbacks=None,
+                                  captions: Optional[Dict[str, str]] = None,
+                                  image_contexts: Optional[Dict[str, str]] = None,
+                                  time_limit: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        与 analyze_images 相同，但按完成顺序逐张产出结果，调用方无需等待最慢的图片即可处理已完成的结果。
+        被跳过、缓存命中和仅依据图注的图片最先产出；重复图片随其代表图片一起产出；超过时限的图片产出 timed_out 结果。
+        """
+        async for _, result in self._iter_results(image_paths, context, callbacks, captions, image_contexts, time_limit):
+            yield result
+
+    async def _iter_results(self, image_paths: List[str], context: Optional[str], callbacks,
+                            captions: Optional[Dict[str, str]], image_contexts: Optional[Dict[str, str]],
+                            time_limit: Optional[float]) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """按完成顺序产出 (图片下标, 结果)，结束时记录汇总日志。"""
         if not image_paths:
-            return results
+            return
+        captions = captions or {}
+        image_contexts = image_contexts or {}
+        time_limit = self.time_limit if time_limit is None else time_limit
+
+        # 同一路径出现多次时视为重复图片
+        first_index = {}
+        for i, image_path in enumerate(image_paths):
+            first_index.setdefault(image_path, i)
+        representatives = list(range(len(image_paths)))
+        relevance = [None] * len(image_paths)
+        if self.dedup_max_distance is not None or self.filter_mode != "off":
+            representatives, relevance = await asyncio.to_thread(self._inspect_images, image_paths, captions)
+        representatives = [representatives[first_index[image_path]] for image_path in image_paths]
+        low_scores = {
+            i for i, item in enumerate(relevance)
+            if item and self.filter_mode != "off" and item[0] < config.settings.IMAGE_FILTER_MIN_SCORE
+        }
+        skipped = low_scores if self.filter_mode == "skip" else set()
+        deferred = low_scores - skipped
+        duplicates = {}
+        for i, rep in enumerate(representatives):
+            if rep != i and i not in skipped:
+                duplicates.setdefault(rep, []).append(i)
+
+        results = []
+
+        def finish(i: int, result: Dict[str, Any]) -> List[Tuple[int, Dict[str, Any]]]:
+            """补充相关性字段；重复图片复用其代表图片的描述。"""
+            finished = [(i, result)]
+            for dup in duplicates.get(i, []):
+                finished.append((dup, _image_result(
+                    image_paths[dup], result["description"], failed=result["failed"], duplicate_of=image_paths[i]
+                )))
+            for index, item in finished:
+                if relevance[index]:
+                    item["relevance_score"] = relevance[index][0]
+                if index in deferred:
+                    item["low_priority"] = True
+                results.append(item)
+            return finished
 
-        # 可选：分批并发处理，避免LLM API超载
-        async def analyze_single_image(image_path):
+        for i in sorted(skipped):
+            reasons = relevance[i][1] + ([] if image_paths[i] in captions else ["无图注"])
+            result = _image_result(image_paths[i], f"未分析：{'；'.join(reasons)}")
+            result.update(skipped=True, skip_reasons=reasons)
+            for item in finish(i, result):
+                yield item
+
+        # 先分析相关性高的图片，defer 模式下低分图片在其后分析
+        unique = sorted({representatives[i] for i in range(len(image_paths)) if i not in skipped})
+        for batch in ([i for i in unique if i not in deferred], [i for i in unique if i in deferred]):
+            prepared = await asyncio.gather(*(
+                self._prepare(image_paths[i], captions.get(image_paths[i]), image_contexts.get(image_paths[i]))
+                for i in batch
+            ))
+            index_of = {image_paths[i]: i for i in batch}
+            for item in prepared:
+                if isinstance(item, dict):
+                    for pair in finish(index_of[item["image_path"]], item):
+                        yield pair
+            jobs = [item for item in prepared if isinstance(item, _ImageJob)]
+            tasks = [
+                asyncio.ensure_future(self._analyze_pack(pack, context, callbacks, time_limit))
+                for pack in self._plan_packs(jobs)
+            ]
             try:
-                # 尝试读取图片并转换为 base64
-                try:
-                    with open(image_path, "rb") as f:
-                        image_base64 = base64.b64encode(f.read()).decode("utf-8")
-                    # 假设图片是JPEG格式，如果需要支持其他格式，需要检测文件类型
-                    image_url = f"data:image/jpeg;base64,{image_base64}"
-                except Exception as e:
-                    logger.error(f"读取或编码图片文件失败: {image_path} - {e}")
-                    return {
-                        "image_path": image_path,
-                        "description": f"图片读取或编码失败: {e}"
-                    }
-
-                # 构建符合 LangChain HumanMessage 多模态输入格式的 content
-                message_content = [
-                    {
-                        "type": "text",
-                        "text": self._build_prompt(image_path, context)
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": image_url
-                        }
-                    }
-                ]
+                for next_done in asyncio.as_completed(tasks):
+                    for result in await next_done:
+                        for pair in finish(index_of[result["image_path"]], result):
+                            yield pair
+            finally:
+                # 调用方提前停止迭代时取消尚未完成的请求
+                for task in tasks:
+                    task.cancel()
+
+        summary = summarize_image_analysis(results)
+        logger.info(
+            f"图片分析完成: {summary['succeeded']}/{summary['images']} 张成功，请求 {summary['attempts']} 次"
+            f"（限流 {summary['rate_limited']} 次，缓存命中 {summary['cache_hits']} 张，重复 {summary['duplicates']} 张，"
+            f"筛选跳过 {summary['skipped']} 张，超时 {summary['timed_out']} 张），单图平均耗时 {summary['latency_avg']} 秒，"
+            f"最长 {summary['latency_max']} 秒，上传 {summary['upload_bytes'] / 1024:.0f} KB（原图 {summary['original_bytes'] / 1024:.0f} KB）"
+        )
+
+    async def _prepare(self, image_path: str, caption: Optional[str], image_context: Optional[str]):
+        """
+        请求前的准备：图注足够详细、缓存命中或读取失败时直接返回结果字典，否则返回待请求的 _ImageJob。
+        """
+        caption_only_min_chars = config.settings.IMAGE_CAPTION_ONLY_MIN_CHARS
+        if caption_only_min_chars and caption and len(caption) >= caption_only_min_chars:
+            logger.debug(f"图注足够详细，不调用图片模型: {image_path}")
+            result = _image_result(image_path, f"（依据图注，未调用图片模型）\n{caption}")
+            result["caption_only"] = True
+            return result
+        try:
+            image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
+        except Exception as e:
+            logger.error(f"读取图片文件失败: {image_path} - {e}")
+            return _image_result(image_path, f"图片读取或编码失败: {e}", failed=True)
+
+        cache_key = self._cache_key(image_bytes) if self.cache_manager else None
+        if cache_key:
+            cached_description = self.cache_manager.get(cache_key)
+            if cached_description is not None:
+                logger.debug(f"图片分析缓存命中: {image_path}")
+                return _image_result(image_path, cached_description, cached=True, original_bytes=len(image_bytes))
+
+        try:
+            image_url, upload_bytes, pixels = await asyncio.to_thread(self._encode_for_upload, image_bytes)
+        except Exception as e:
+            logger.error(f"编码图片失败: {image_path} - {e}")
+            return _image_result(image_path, f"图片读取或编码失败: {e}", failed=True)
+        return _ImageJob(image_path, cache_key, image_url, len(image_bytes), upload_bytes, pixels, caption, image_context)
+
+    def _plan_packs(self, jobs: List[_ImageJob]) -> List[List[_ImageJob]]:
+        """按顺序把待请求的图片分组：每组最多 IMAGE_PACK_SIZE 张，且总像素不超过 IMAGE_PACK_MAX_PIXELS。"""
+        pack_size = config.settings.IMAGE_PACK_SIZE
+        max_pixels = config.settings.IMAGE_PACK_MAX_PIXELS
+        packs, current, current_pixels = [], [], 0
+        for job in jobs:
+            if current and (len(current) >= pack_size or (max_pixels and current_pixels + job.pixels > max_pixels)):
+                packs.append(current)
+                current, current_pixels = [], 0
+            current.append(job)
+            current_pixels += job.pixels
+        if current:
+            packs.append(current)
+        return packs
+
+    async def _analyze_one(self, job: _ImageJob, context: Optional[str], callbacks,
+                           time_limit: float = 0) -> Dict[str, Any]:
+        """单张图片一次请求。"""
+        # 构建符合 LangChain HumanMessage 多模态输入格式的 content
+        human_message = HumanMessage(content=[
+            {"type": "text", "text": self._build_prompt(job.image_path, context, job.caption, job.image_context)},
+            {"type": "image_url", "image_url": {"url": job.image_url}},
+        ])
+        stats = {"attempts": 0, "rate_limited": 0}
+        start = time.monotonic()
+        try:
+            response = await self._invoke_with_retry(human_message, job.image_path, callbacks, stats, time_limit)
+            # 提取响应文本
+            description = response.content if hasattr(response, 'content') else str(response)
+            failed = False
+            if job.cache_key:
+                self.cache_manager.set(job.cache_key, description)
+        except ImageAnalysisTimeout as e:
+            logger.warning(f"图片分析超过时限，放弃该图片: {job.image_path} - {e}")
+            result = _image_result(
+                job.image_path, f"图片分析超时: {e}", failed=True,
+                latency_seconds=round(time.monotonic() - start, 3),
+                attempts=stats["attempts"], rate_limited=stats["rate_limited"],
+                original_bytes=job.original_bytes, upload_bytes=job.upload_bytes,
+            )
+            result["timed_out"] = True
+            return result
+        except Exception as e:
+            logger.error(f"分析图片时发生错误: {job.image_path} - {e}")
+            import traceback
+            logger.debug(f"错误详情 (Traceback): {traceback.format_exc()}")
+            description = f"图片解析失败: {e}"
+            failed = True
+        return _image_result(
+            job.image_path, description, failed=failed,
+            latency_seconds=round(time.monotonic() - start, 3),
+            attempts=stats["attempts"], rate_limited=stats["rate_limited"],
+            original_bytes=job.original_bytes, upload_bytes=job.upload_bytes,
+        )
+
+    async def _analyze_pack(self, jobs: List[_ImageJob], context: Optional[str], callbacks,
+                            time_limit: float = 0) -> List[Dict[str, Any]]:
+        """
+        多张图片打包为一次请求，要求模型按编号返回各图片描述的JSON数组（只有一张时即为单图请求）。
+        未能解析出描述的图片改为单独请求；请求本身失败（重试用尽或超时）时整组记为失败，不再放大请求量。
+        """
+        if len(jobs) == 1:
+            return [await self._analyze_one(jobs[0], context, callbacks, time_limit)]
+        content = [{"type": "text", "text": self._build_pack_prompt(jobs, context)}]
+        for number, job in enumerate(jobs, 1):
+            content.append({"type": "text", "text": f"图片{number}:"})
+            content.append({"type": "image_url", "image_url": {"url": job.image_url}})
+        label = f"{len(jobs)} 张打包图片 ({Path(jobs[0].image_path).name} 等)"
+        stats = {"attempts": 0, "rate_limited": 0}
+        start = time.monotonic()
+        try:
+            response = await self._invoke_with_retry(HumanMessage(content=content), label, callbacks, stats, time_limit)
+            response_text = response.content if hasattr(response, 'content') else str(response)
+            descriptions = _parse_pack_response(response_text, len(jobs))
+            error = None
+        except Exception as e:
+            logger.error(f"分析{label}时发生错误: {e}")
+            descriptions, error = {}, e
+        latency = round(time.monotonic() - start, 3)
 
-                # 创建 HumanMessage 对象
-                human_message = HumanMessage(content=message_content)
-
-                # 调用 LLM
-                logger.debug(f"调用 LLM 分析图片: {image_path}")
-                response = await self.llm.ainvoke(
-                    [human_message], # ainvoke 期望一个消息列表
-                    config={"callbacks": callbacks} if callbacks else None
-                )
-
-                # 提取响应文本
-                response_text = response.content if hasattr(response, 'content') else str(response)
-
-                return {
-                    "image_path": image_path,
-                    "description": response_text
-                }
-            except Exception as e:
-                logger.error(f"分析图片时发生错误: {image_path} - {e}")
-                import traceback
-                logger.debug(f"错误详情 (Traceback): {traceback.format_exc()}")
-                return {
-                    "image_path": image_path,
-                    "description": f"图片解析失败: {e}"
-                }
-
-        tasks = [analyze_single_image(img) for img in image_paths]
-        results = await asyncio.gather(*tasks)
+        results, unparsed = [], []
+        for number, job in enumerate(jobs, 1):
+            description = descriptions.get(number)
+            if description is None and error is None:
+                unparsed.append(job)
+                continue
+            if description is not None and job.cache_key:
+                self.cache_manager.set(job.cache_key, description)
+            result = _image_result(
+                job.image_path, description if description is not None else f"图片解析失败: {error}",
+                failed=description is None, latency_seconds=latency,
+                attempts=stats["attempts"], rate_limited=stats["rate_limited"],
+                original_bytes=job.original_bytes, upload_bytes=job.upload_bytes,
+            )
+            result["pack_size"] = len(jobs)
+            if isinstance(error, ImageAnalysisTimeout):
+                result["timed_out"] = True
+            results.append(result)
+        if unparsed:
+            logger.warning(f"{label}中有 {len(unparsed)} 张图片未能从合并回答中解析出描述，改为单独请求。")
+            results.extend(await asyncio.gather(*(
+                self._analyze_one(job, context, callbacks, time_limit) for job in unparsed
+            )))
         return results
 
-    def _build_prompt(self, image_path: str, context: Optional[str]) -> str:
+    def _inspect_images(self, image_paths: List[str], captions: Dict[str, str]):
         """
-        构建图片内容分析的提示词。
+        解码每张图片一次，计算感知哈希和相关性得分（同步，在线程中执行）。
+
+        Returns:
+            (每张图片的代表图片下标, 每张图片的 (相关性得分, 未达标项) 或 None)
+            筛选模式为 skip 时，低分图片不参与去重。
+        """
+        fingerprints = []
+        for image_path in image_paths:
+            try:
+                fingerprints.append(image_fingerprint(Path(image_path).read_bytes()))
+            except OSError:
+                fingerprints.append(None)
+
+        relevance = [
+            score_image_relevance(
+                fp, has_caption=image_path in captions,
+                min_size=config.settings.IMAGE_FILTER_MIN_SIZE,
+                max_aspect=config.settings.IMAGE_FILTER_MAX_ASPECT,
+                min_entropy=config.settings.IMAGE_FILTER_MIN_ENTROPY,
+            ) if fp else None
+            for image_path, fp in zip(image_paths, fingerprints)
+        ]
+
+        representatives = list(range(len(image_paths)))
+        if self.dedup_max_distance is not None:
+            if self.filter_mode == "skip":
+                min_score = config.settings.IMAGE_FILTER_MIN_SCORE
+                fingerprints = [
+                    None if item and item[0] < min_score else fp for fp, item in zip(fingerprints, relevance)
+                ]
+            representatives = find_duplicate_images(fingerprints, self.dedup_max_distance)
+            duplicates = sum(1 for i, rep in enumerate(representatives) if rep != i)
+            if duplicates:
+                logger.info(f"图片去重: {len(image_paths)} 张图片中有 {duplicates} 张重复，复用代表图片的分析结果。")
+        return representatives, relevance
+
+    async def _invoke_with_retry(self, message: HumanMessage, image_path: str, callbacks, stats: Dict[str, int],
+                                 time_limit: float = 0):
+        """
+        在调度器的并发和速率限制下调用图片LLM，可重试的错误按 Retry-After 或指数退避（带抖动）重试。
+        退避等待期间释放名额，让其他请求继续进行；被限流时该模型的新请求暂停到 Retry-After 之后。
+        time_limit 大于0时，从首次发出请求起（不含排队等待并发名额的时间）超过该秒数即抛出 ImageAnalysisTimeout。
+        """
+        deadline = None
+        for attempt in range(self.max_retries + 1):
+            async with self.scheduler.slot(self.lane_name, self.llm_priority):
+                timeout = self.request_timeout
+                if time_limit:
+                    if deadline is None:
+                        deadline = time.monotonic() + time_limit
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        raise ImageAnalysisTimeout(f"超过 {time_limit:g} 秒时限")
+                stats["attempts"] += 1
+                logger.debug(f"调用 LLM 分析图片: {image_path} (第 {attempt + 1} 次)")
+                try:
+                    return await asyncio.wait_for(
+                        self.llm.ainvoke(
+                            [message], # ainvoke 期望一个消息列表
+                            config={"callbacks": callbacks} if callbacks else None
+                        ),
+                        timeout
+                    )
+                except RETRYABLE_ERRORS as e:
+                    delay = self._retry_delay(e, attempt)
+                    if isinstance(e, openai.RateLimitError):
+                        stats["rate_limited"] += 1
+                        self.scheduler.report_rate_limit(self.lane_name, delay)
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise ImageAnalysisTimeout(f"超过 {time_limit:g} 秒时限") from e
+                    if attempt >= self.max_retries:
+                        raise
+                    if deadline is not None and time.monotonic() + delay >= deadline:
+                        raise ImageAnalysisTimeout(f"超过 {time_limit:g} 秒时限") from e
+                    logger.warning(
+                        f"图片分析请求失败 ({type(e).__name__})，{delay:.2f} 秒后重试 "
+                        f"(尝试 {attempt + 1}/{self.max_retries + 1}): {image_path}"
+                    )
+                    self.scheduler.report_retry(self.lane_name)
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """服务端给出 Retry-After 时按其等待，否则使用带 ±25% 抖动的指数退避。"""
+        return retry_delay(error, attempt, self.retry_base_delay)
+
+    def _build_prompt(self, image_path: str, context: Optional[str], caption: Optional[str] = None,
+                      image_context: Optional[str] = None) -> str:
+        """
+        构建图片内容分析的提示词。优先使用图片自身的图注和正文中引用它的段落，
+        两者都没有时才退回到文档开头的上下文。
         """
         prompt = IMAGE_ANALYSIS_BASE_PROMPT # 使用导入的基础提示词
 
-        if context:
+        if caption:
+            prompt += f"\n【图注】\n{caption}\n"
+        if image_context:
+            prompt += f"\n【正文中的相关段落】\n{image_context}\n"
+        elif context and not caption:
             # 截断上下文以避免过长的提示
             max_context_chars = 2000 # 限制上下文长度
             truncated_context = context[:max_context_chars] + "..." if len(context) > max_context_chars else context
@@ -107,3 +471,111 @@ class ImageAnalysisAgent:
         # 基础提示词已经包含了结尾部分，无需再次添加
         # prompt += "请用简洁的学术语言输出结构化描述。"
         return prompt
+
+    def _build_pack_prompt(self, jobs: List[_ImageJob], context: Optional[str]) -> str:
+        """
+        构建多图打包请求的提示词：基础提示词 + 输出格式要求 + 各图片的图注与相关段落。
+        有图片既无图注也无相关段落时，附一次文档开头的上下文。
+        """
+        prompt = IMAGE_ANALYSIS_BASE_PROMPT + IMAGE_ANALYSIS_PACK_INSTRUCTIONS.format(count=len(jobs))
+        if context and any(not job.caption and not job.image_context for job in jobs):
+            max_context_chars = 2000
+            truncated_context = context[:max_context_chars] + "..." if len(context) > max_context_chars else context
+            prompt += f"\n【上下文】\n{truncated_context}\n"
+        for number, job in enumerate(jobs, 1):
+            sections = []
+            if job.caption:
+                sections.append(f"【图注】{job.caption}")
+            if job.image_context:
+                sections.append(f"【正文中的相关段落】\n{job.image_context}")
+            if sections:
+                prompt += f"\n【图片{number}】\n" + "\n".join(sections) + "\n"
+        return prompt
+
+
+def _image_result(image_path: str, description: str, failed: bool = False, cached: bool = False,
+                  latency_seconds: float = 0.0, attempts: int = 0, rate_limited: int = 0,
+                  original_bytes: int = 0, upload_bytes: int = 0,
+                  duplicate_of: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "image_path": image_path,
+        "description": description,
+        "latency_seconds": latency_seconds,
+        "attempts": attempts,
+        "rate_limited": rate_limited,
+        "cached": cached,
+        "original_bytes": original_bytes,
+        "upload_bytes": upload_bytes,
+        "duplicate_of": duplicate_of,
+        "failed": failed,
+    }
+
+
+def _parse_pack_response(response_text: str, count: int) -> Dict[int, str]:
+    """把多图请求的JSON回答解析为 图片编号(1起) -> 描述；无法解析时返回空字典。"""
+    try:
+        parsed = parse_llm_json(response_text)
+    except ValueError:
+        logger.warning(f"多图请求的回答不是有效JSON: {response_text[:200]}")
+        return {}
+    if isinstance(parsed, dict):
+        parsed = [{"index": key, "description": value} for key, value in parsed.items()]
+    descriptions = {}
+    for position, item in enumerate(parsed if isinstance(parsed, list) else [], 1):
+        if not isinstance(item, dict):
+            continue
+        try:
+            number = int(item.get("index", position))
+        except (TypeError, ValueError):
+            number = position
+        description = item.get("description")
+        if isinstance(description, dict):
+            description = "\n".join(f"**{key}**: {value}" for key, value in description.items())
+        if 1 <= number <= count and isinstance(description, str) and description.strip():
+            descriptions[number] = description.strip()
+    return descriptions
+
+
+def summarize_image_analysis(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    汇总图片分析的请求统计：成功/失败张数、请求与限流次数、缓存命中数以及单图耗时分布。
+    耗时分布只统计实际发出请求的图片；从检查点恢复的旧结果缺少统计字段时按0计。
+    """
+    uploaded = [r for r in results if (r.get("attempts") or 0) > 0]
+    latencies = sorted(r.get("latency_seconds") or 0.0 for r in uploaded)
+    # 打包请求的请求次数记在组内每张图片上，按组大小折算，使合计等于实际请求数
+    def requests(r: Dict[str, Any], key: str) -> float:
+        return (r.get(key) or 0) / (r.get("pack_size") or 1)
+
+    attempts = round(sum(requests(r, "attempts") for r in results))
+    failed = sum(1 for r in results if r.get("failed"))
+    skipped = sum(1 for r in results if r.get("skipped"))
+
+    def percentile(q: float) -> float:
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2)
+
+    return {
+        "images": len(results),
+        "succeeded": len(results) - failed - skipped,
+        "failed": failed,
+        "skipped": skipped,
+        "low_priority": sum(1 for r in results if r.get("low_priority")),
+        "attempts": attempts,
+        "retries": round(sum(max(0, (r.get("attempts") or 0) - 1) / (r.get("pack_size") or 1) for r in results)),
+        "rate_limited": round(sum(requests(r, "rate_limited") for r in results)),
+        "packed": sum(1 for r in results if (r.get("pack_size") or 1) > 1),
+        "timed_out": sum(1 for r in results if r.get("timed_out")),
+        "cache_hits": sum(1 for r in results if r.get("cached")),
+        "duplicates": sum(1 for r in results if r.get("duplicate_of")),
+        "caption_only": sum(1 for r in results if r.get("caption_only")),
+        "cache_misses": len(uploaded),
+        # 原图与上传大小都只统计实际发出请求的图片，两者可直接比较压缩效果
+        "original_bytes": sum(r.get("original_bytes") or 0 for r in uploaded),
+        "upload_bytes": sum(r.get("upload_bytes") or 0 for r in uploaded),
+        "latency_avg": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "latency_p50": percentile(0.5),
+        "latency_p95": percentile(0.95),
+        "latency_max": round(latencies[-1], 2) if latencies else 0.0,
+    }
@@ -0,0 +1,25 @@
+import json
+from typing import Any
+
+
+def parse_llm_json(text: str) -> Any:
+    """
+    解析LLM返回的JSON：去掉 ```json 代码块标记；若前后带有说明文字，则截取第一个 [ 或 { 到最后一个 ] 或 } 之间的内容。
+
+    Raises:
+        json.JSONDecodeError: 无法解析
+    """
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned[3:]
+        if cleaned.rstrip().endswith("```"):
+            cleaned = cleaned.rstrip()[:-3]
+        cleaned = cleaned.strip()
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        starts = [i for i in (cleaned.find("["), cleaned.find("{")) if i >= 0]
+        end = max(cleaned.rfind("]"), cleaned.rfind("}"))
+        if not starts or end <= min(starts):
+            raise
+        return json.loads(cleaned[min(starts):end + 1])
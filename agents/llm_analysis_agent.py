@@ -1,3 +1,4 @@
+import asyncio
 import json
 import re
 import logging
@@ -7,7 +8,8 @@ from langchain.prompts import PromptTemplate
 from langchain_core.exceptions import OutputParserException
 from langchain_core.callbacks.base import BaseCallbackHandler
 
-from agents.base_agent import ResearchAgent as BaseResearchAgent
+from agents.base_agent import ResearchAgent as BaseResearchAgent, StreamCallback
+from agents.llm_scheduler import PRIORITY_CRITICAL, PRIORITY_HIGH
 from slais.utils.logging_utils import logger
 import agents.prompts as prompts
 from agents.prompts import (
@@ -17,9 +19,13 @@ from agents.prompts import (
     BATCH_ANSWER_GENERATION_PROMPT,
     STORYTELLING_PROMPT, # 导入 STORYTELLING_PROMPT
     MINDMAP_PROMPT, # 导入 MINDMAP_PROMPT
+    COMBINED_ANALYSIS_PROMPT,
+    CHUNK_SUMMARY_PROMPT,
     DEEP_ANALYSIS_PROMPT # 导入 DEEP_ANALYSIS_PROMPT
 )
 from slais import config
+from agents.json_utils import parse_llm_json
+from slais.utils.markdown_utils import chunk_markdown
 
 # 辅助函数，用于在MindMapAgent生成失败时提供默认的Mermaid图
 def generate_default_mindmap_on_error(error_message: str) -> str:
@@ -48,21 +54,22 @@ class MethodologyAnalysisAgent(BaseResearchAgent):
         self, 
         content: str, 
         callbacks: Optional[List[BaseCallbackHandler]] = None,
-        image_analysis: str = ""  # 添加图像分析参数，默认为空字符串
+        image_analysis: str = "",  # 添加图像分析参数，默认为空字符串
+        stream_callback: Optional[StreamCallback] = None  # 流式输出回调，接收截至目前的累计文本
     ) -> Union[Dict[str, Any], str]:
         try:
             logger.info(f"分析文献方法，内容长度: {len(content)} 字符")
-            truncated_content = self._truncate_content(content, max_chars=config.settings.MAX_CONTENT_CHARS_FOR_LLM)
             chain = self._build_chain(METHODOLOGY_ANALYSIS_PROMPT)
             # 传递图像分析内容
             input_data = {
-                "content": truncated_content,
+                "content": content,
                 "image_analysis": image_analysis
             }
             response_text = await super()._invoke_llm_analysis(
                 METHODOLOGY_ANALYSIS_PROMPT,
                 input_data,
-                callbacks
+                callbacks,
+                stream_callback=stream_callback
             )
             # _invoke_llm_analysis 已经处理了 .content 和基本错误
             # 此处可以添加特定于此 Agent 的后处理或错误处理
@@ -98,21 +105,22 @@ class InnovationExtractionAgent(BaseResearchAgent):
         self, 
         content: str, 
         callbacks: Optional[List[BaseCallbackHandler]] = None,
-        image_analysis: str = ""  # 添加图像分析参数，默认为空字符串
+        image_analysis: str = "",  # 添加图像分析参数，默认为空字符串
+        stream_callback: Optional[StreamCallback] = None  # 流式输出回调，接收截至目前的累计文本
     ) -> Union[Dict[str, Any], str]:
         try:
             logger.info(f"提取创新点，内容长度: {len(content)} 字符")
-            truncated_content = self._truncate_content(content, max_chars=config.settings.MAX_CONTENT_CHARS_FOR_LLM)
             chain = self._build_chain(INNOVATION_EXTRACTION_PROMPT)
             # 传递图像分析内容
             input_data = {
-                "content": truncated_content,
+                "content": content,
                 "image_analysis": image_analysis
             }
             response_text = await super()._invoke_llm_analysis(
                 INNOVATION_EXTRACTION_PROMPT,
                 input_data,
-                callbacks
+                callbacks,
+                stream_callback=stream_callback
             )
             if response_text.startswith("错误："):
                 return response_text
@@ -133,6 +141,9 @@ class InnovationExtractionAgent(BaseResearchAgent):
         return await self.extract_innovations(content, callbacks, image_analysis)
 
 class QAGenerationAgent(BaseResearchAgent):
+    # 问题和答案位于问答对阶段的关键路径上
+    llm_priority = PRIORITY_HIGH
+
     def __init__(self, llm_client: Any):
         super().__init__(llm_client, provider_name="openai")
 
@@ -160,9 +171,8 @@ class QAGenerationAgent(BaseResearchAgent):
     ) -> List[str]:
         logger.info(f"生成问题，内容长度: {len(content)} 字符 (传递给分析前)")
         try:
-            truncated_content = self._truncate_content(content, max_chars=config.settings.MAX_CONTENT_CHARS_FOR_LLM)
             input_data = {
-                "content": truncated_content,
+                "content": content,
                 "num_questions": config.settings.MAX_QUESTIONS_TO_GENERATE,
                 "image_analysis": image_analysis
             }
@@ -195,94 +205,124 @@ class QAGenerationAgent(BaseResearchAgent):
     ) -> List[Dict[str, str]]:
         """
         根据文献内容和问题列表批量生成答案。
+        问题按 QA_ANSWER_SHARD_SIZE 分组并行请求，回答按编号（其次按问题原文）对应回各问题；
+        缺失或无法解析的问题重新组成分组再次请求，最多 QA_ANSWER_MAX_RETRIES 轮，仍缺失的问题返回错误说明。
         """
         if not questions:
             logger.info("没有问题需要回答。")
             return []
 
         logger.info(f"批量生成答案，共 {len(questions)} 个问题。内容长度: {len(content)} 字符 (传递给分析前)")
-        truncated_content = self._truncate_content(content, max_chars=config.settings.MAX_CONTENT_CHARS_FOR_LLM)
-        questions_json_list_string = json.dumps(questions, ensure_ascii=False)
+        shard_size = config.settings.QA_ANSWER_SHARD_SIZE or len(questions)
+        max_retries = config.settings.QA_ANSWER_MAX_RETRIES
+
+        answers: Dict[int, str] = {}
+        errors: Dict[int, str] = {}
+        pending = list(range(len(questions)))
+        for attempt in range(max_retries + 1):
+            shards = [pending[i:i + shard_size] for i in range(0, len(pending), shard_size)]
+            results = await asyncio.gather(
+                *(self._answer_shard(questions, shard, content, image_analysis, callbacks) for shard in shards),
+                return_exceptions=True
+            )
+            for shard, result in zip(shards, results):
+                if isinstance(result, Exception):
+                    logger.error(f"生成答案时发生意外错误: {result}")
+                    errors.update({index: f"错误：生成答案时发生意外 ({result})" for index in shard})
+                    continue
+                shard_answers, error = result
+                answers.update(shard_answers)
+                if error:
+                    errors.update({index: error for index in shard if index not in shard_answers})
+            pending = [index for index in pending if index not in answers]
+            if not pending:
+                break
+            if attempt < max_retries:
+                logger.warning(f"{len(pending)} 个问题未得到可解析的答案，重新请求 (第 {attempt + 1}/{max_retries} 轮)。")
+
+        if pending:
+            logger.warning(f"{len(pending)} 个问题在 {max_retries + 1} 轮请求后仍未得到答案。")
+        qa_pairs = [
+            {
+                "question": question,
+                "answer": answers.get(index) or errors.get(index) or "错误：未能从LLM响应中找到此问题的答案。"
+            }
+            for index, question in enumerate(questions)
+        ]
+        logger.info(f"成功生成 {len(answers)}/{len(questions)} 个问答对 (每组最多 {shard_size} 个问题)。")
+        return qa_pairs
+
+    async def _answer_shard(
+        self,
+        questions: List[str],
+        indices: List[int],
+        content: str,
+        image_analysis: str,
+        callbacks: Optional[List[BaseCallbackHandler]]
+    ):
+        """
+        请求一组问题的答案。
 
-        # 显式定义输入变量以避免解析错误
-        prompt_template = PromptTemplate(
-            template=BATCH_ANSWER_GENERATION_PROMPT,
-            input_variables=["content", "questions_json_list_string", "image_analysis"]
+        Returns:
+            ({问题序号: 答案}, 错误说明或 None)；只包含能对应到问题的非空答案。
+        """
+        numbered = [{"id": number, "question": questions[index]} for number, index in enumerate(indices, 1)]
+        input_data = {
+            "content": content,
+            "questions_json_list_string": json.dumps(numbered, ensure_ascii=False),
+            "image_analysis": image_analysis
+        }
+        response_text = await super()._invoke_llm_analysis(
+            BATCH_ANSWER_GENERATION_PROMPT,
+            input_data,
+            callbacks,
+            cache_content_key="content",
+            # 一个答案都无法解析的回答不缓存，否则重新请求同一组问题时会命中同样的回答
+            cache_if=lambda text: bool(self._match_answers(text, questions, indices))
         )
-
+        if response_text.startswith("错误："):
+            logger.error(f"生成答案失败: {response_text}")
+            return {}, response_text
+        matched = self._match_answers(response_text, questions, indices)
+        if len(matched) < len(indices):
+            logger.warning(f"一组 {len(indices)} 个问题中有 {len(indices) - len(matched)} 个未得到可解析的答案。")
+            logger.debug(f"LLM响应文本: {response_text[:1000]}")
+        return matched, None
+
+    @staticmethod
+    def _match_answers(response_text: str, questions: List[str], indices: List[int]) -> Dict[int, str]:
+        """把回答中的各项按编号（其次按去除空白和标点后的问题原文）对应回问题序号。"""
         try:
-            input_data = {
-                "content": truncated_content,
-                "questions_json_list_string": questions_json_list_string,
-                "image_analysis": image_analysis
-            }
-            response_text = await super()._invoke_llm_analysis(
-                BATCH_ANSWER_GENERATION_PROMPT,
-                input_data,
-                callbacks,
-                cache_content_key="content" # 或者更复杂的键，如 content + questions_json_list_string
-            )
-
-            if response_text.startswith("错误："):
-                logger.error(f"批量生成答案失败: {response_text}")
-                return [{"question": q, "answer": response_text} for q in questions]
-
-            # 清理LLM响应，移除Markdown代码块标记
-            cleaned_response_text = response_text.strip()
-            if cleaned_response_text.startswith("```json"):
-                cleaned_response_text = cleaned_response_text[7:] # 移除 ```json\n
-            elif cleaned_response_text.startswith("```"):
-                cleaned_response_text = cleaned_response_text[3:] # 移除 ```\n
-            
-            if cleaned_response_text.endswith("```"):
-                cleaned_response_text = cleaned_response_text[:-3] # 移除 ```
-            
-            cleaned_response_text = cleaned_response_text.strip()
-
-            try:
-                # 使用清理后的文本进行JSON解析
-                qa_pairs_from_llm = json.loads(cleaned_response_text)
-                
-                # 确保返回的是列表，并且列表中的元素是字典
-                if not isinstance(qa_pairs_from_llm, list) or \
-                   not all(isinstance(item, dict) and "question" in item and "answer" in item for item in qa_pairs_from_llm):
-                    logger.error(f"LLM返回的JSON结构不符合预期 (不是字典列表或缺少键)。原始文本: {response_text[:500]}")
-                    # 为每个原始问题生成一个包含错误信息的答案条目
-                    return [{"question": q, "answer": f"错误：LLM返回的JSON结构不符合预期。原始响应: {response_text[:200]}"} for q in questions]
-
-                # 将LLM生成的答案与原始问题列表对齐 (以原始问题列表为准)
-                # 这是一个简单的对齐，假设LLM返回的顺序和问题数量与输入一致
-                # 更健壮的实现可能需要基于问题文本进行匹配
-                aligned_qa_pairs = []
-                llm_answers_map = {item.get("question", "").strip(): item.get("answer", "未能生成答案。") for item in qa_pairs_from_llm}
-
-                for original_question_text in questions:
-                    # 尝试精确匹配
-                    answer = llm_answers_map.get(original_question_text.strip())
-                    if answer is None:
-                        # 如果精确匹配失败，可以尝试模糊匹配或记录错误
-                        logger.warning(f"未能从LLM的响应中为问题 '{original_question_text}' 找到精确匹配的答案。")
-                        answer = f"错误：未能从LLM响应中找到此问题的答案。LLM可能未按预期格式返回。"
-                    
-                    aligned_qa_pairs.append({
-                        "question": original_question_text,
-                        "answer": answer
-                    })
-                
-                logger.info(f"成功解析并对齐了 {len(aligned_qa_pairs)} 个问答对。")
-                return aligned_qa_pairs
-
-            except json.JSONDecodeError as e:
-                logger.error(f"批量生成答案时解析JSON失败: {e}")
-                logger.error(f"LLM响应文本 (导致JSON解析失败): {response_text[:1000]}") # 记录更长的文本以便调试
-                # 为每个原始问题生成一个包含错误信息的答案条目
-                return [{"question": q, "answer": f"错误：未能从LLM响应中解析答案 ({e})"} for q in questions]
-        
-        except Exception as e:
-            logger.error(f"批量生成答案时发生意外错误: {e}")
-            logger.debug(f"错误详情: questions_json_list_string: {questions_json_list_string[:100]}, content_len: {len(truncated_content)}")
-            # 为每个原始问题生成一个包含错误信息的答案条目
-            return [{"question": q, "answer": f"错误：生成答案时发生意外 ({e})"} for q in questions]
+            items = parse_llm_json(response_text)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+        if isinstance(items, dict):
+            items = [items]
+        if not isinstance(items, list):
+            return {}
+
+        def normalize(text: str) -> str:
+            return re.sub(r"[\s\W_]+", "", text).lower()
+
+        by_text = {normalize(questions[index]): index for index in indices}
+        matched = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            answer = item.get("answer")
+            if not isinstance(answer, str) or not answer.strip():
+                continue
+            index = None
+            number = item.get("id")
+            if isinstance(number, str) and number.strip().isdigit():
+                number = int(number)
+            if isinstance(number, int) and 1 <= number <= len(indices):
+                index = indices[number - 1]
+            elif isinstance(item.get("question"), str):
+                index = by_text.get(normalize(item["question"]))
+            if index is not None and index not in matched:
+                matched[index] = answer.strip()
+        return matched
 
     def _extract_questions_from_text(self, text: str) -> List[str]:
         logger.info("尝试提取问题...")
@@ -323,18 +363,19 @@ class StorytellingAgent(BaseResearchAgent):
         self, 
         content: str, 
         callbacks: Optional[List[BaseCallbackHandler]] = None,
-        image_analysis: str = ""  # 添加图像分析参数，默认为空字符串
+        image_analysis: str = "",  # 添加图像分析参数，默认为空字符串
+        stream_callback: Optional[StreamCallback] = None  # 流式输出回调，接收截至目前的累计文本
     ) -> str:
         logger.info(f"以讲故事的方式讲述文献，内容长度: {len(content)} 字符")
-        truncated_content = self._truncate_content(content, max_chars=config.settings.MAX_CONTENT_CHARS_FOR_LLM)
         input_data = {
-            "content": truncated_content,
+            "content": content,
             "image_analysis": image_analysis
         }
         response_text = await super()._invoke_llm_analysis(
             STORYTELLING_PROMPT, # 使用 prompts.STORYTELLING_PROMPT
             input_data,
-            callbacks
+            callbacks,
+            stream_callback=stream_callback
         )
         if response_text.startswith("错误："):
             return response_text
@@ -364,20 +405,21 @@ class MindMapAgent(BaseResearchAgent):
         self, 
         content: str, 
         callbacks: Optional[List[BaseCallbackHandler]] = None,
-        image_analysis: str = ""  # 添加图像分析参数，默认为空字符串
+        image_analysis: str = "",  # 添加图像分析参数，默认为空字符串
+        stream_callback: Optional[StreamCallback] = None  # 流式输出回调，接收截至目前的累计文本
     ) -> str:
         logger.info(f"生成 Mermaid 脑图，内容长度: {len(content)} 字符")
-        truncated_content = self._truncate_content(content, max_chars=config.settings.MAX_CONTENT_CHARS_FOR_LLM)
         
         try:
             input_data = {
-                "content": truncated_content,
+                "content": content,
                 "image_analysis": image_analysis
             }
             response_text = await super()._invoke_llm_analysis(
                 MINDMAP_PROMPT,
                 input_data,
-                callbacks
+                callbacks,
+                stream_callback=stream_callback
             )
 
             if response_text.startswith("错误："):
@@ -399,7 +441,153 @@ class MindMapAgent(BaseResearchAgent):
         """实现抽象的run方法。"""
         return await self.generate_mindmap(content, callbacks, image_analysis)
 
+class DocumentDigestAgent(BaseResearchAgent):
+    """
+    长文献 map-reduce 模式的 map 步骤：按章节边界把全文切分为分块，在并发上限内并行提取各分块要点，
+    拼接为不超过 MAX_CONTENT_CHARS_FOR_LLM 的要点摘要。各项分析（reduce 步骤）以该摘要代替只保留开头的截断全文。
+    分块要点按分块内容缓存，同一文献的各项分析以及重复处理时都复用，不再请求。
+    """
+
+    # 分块要点是所有分析的输入
+    llm_priority = PRIORITY_HIGH
+
+    def __init__(self, llm_client: Any, max_concurrency: Optional[int] = None):
+        super().__init__(llm_client, provider_name="openai")
+        # 批处理中被多篇文献共享时，并发上限对所有文献合并生效
+        self._semaphore = asyncio.Semaphore(max_concurrency or config.settings.LLM_MAP_MAX_CONCURRENCY)
+
+    def _build_chain(self, prompt_template_str: str):
+        """构建并返回分块要点提取的链。"""
+        prompt = PromptTemplate(
+            template=prompt_template_str,
+            input_variables=["content", "chunk_index", "chunk_count", "max_chars"]
+        )
+        return prompt | self.llm_client
+
+    async def digest(self, content: str, callbacks: Optional[List[BaseCallbackHandler]] = None) -> str:
+        """
+        Returns:
+            内容不超过 MAX_CONTENT_CHARS_FOR_LLM 时原样返回；否则返回按原文顺序拼接的各分块要点。
+            提取失败的分块以其开头部分原文代替。
+        """
+        limit = config.settings.MAX_CONTENT_CHARS_FOR_LLM
+        if len(content) <= limit:
+            return content
+        chunks = chunk_markdown(content, config.settings.LLM_MAP_CHUNK_CHARS)
+        # 各分块要点平分总长度上限（扣除分隔标记），保证拼接结果不会再被截断
+        max_chars = max(200, limit // len(chunks) - 50)
+        logger.info(f"长文献分段提取要点：{len(content)} 字符分为 {len(chunks)} 块，每块要点不超过 {max_chars} 字符")
+
+        async def summarize(index: int, chunk: str) -> str:
+            input_data = {
+                "content": chunk,
+                "chunk_index": index,
+                "chunk_count": len(chunks),
+                "max_chars": max_chars
+            }
+            async with self._semaphore:
+                response_text = await self._invoke_llm_analysis(CHUNK_SUMMARY_PROMPT, input_data, callbacks)
+            if response_text.startswith("错误："):
+                logger.warning(f"第 {index}/{len(chunks)} 块要点提取失败，使用该块开头的原文: {response_text}")
+                return chunk[:max_chars]
+            return response_text.strip()[:max_chars]
+
+        summaries = await asyncio.gather(*(summarize(i, chunk) for i, chunk in enumerate(chunks, 1)))
+        return "\n\n".join(
+            f"【第 {i}/{len(chunks)} 部分要点】\n{summary}" for i, summary in enumerate(summaries, 1)
+        )
+
+    async def run(self, content: str, callbacks: Optional[List[BaseCallbackHandler]] = None) -> str:
+        """实现抽象的run方法。"""
+        return await self.digest(content, callbacks)
+
+class CombinedAnalysisAgent(BaseResearchAgent):
+    """
+    一次请求完成方法学分析、创新点提取、问题生成、讲故事和脑图五项任务，文献内容只发送一次
+    （分别调用五个智能体时同一份内容要发送五次）。
+    返回的 JSON 中缺失或无法解析的部分不出现在结果中，由调用方改用对应智能体单独生成。
+    """
+
+    # 结果键与 analysis_results 中的字段一致
+    SECTIONS = ("methodology_analysis", "innovation_extraction", "questions", "story", "mindmap")
+
+    def __init__(self, llm_client: Any):
+        super().__init__(llm_client, provider_name="openai")
+
+    def _build_chain(self, prompt_template_str: str):
+        """构建并返回合并分析的链。"""
+        prompt = PromptTemplate(template=prompt_template_str, input_variables=["content", "image_analysis", "num_questions"])
+        return prompt | self.llm_client
+
+    async def analyze_all(
+        self,
+        content: str,
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
+        image_analysis: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Returns:
+            {结果键: 内容} 字典，只包含成功解析的部分；questions 为问题列表，mindmap 为 Mermaid 代码块。
+        """
+        logger.info(f"合并分析（五项任务一次请求），内容长度: {len(content)} 字符")
+        input_data = {
+            "content": content,
+            "image_analysis": image_analysis,
+            "num_questions": config.settings.MAX_QUESTIONS_TO_GENERATE
+        }
+        # 截断或无法解析为JSON对象的回答不写入缓存，否则之后每次运行都会重放该回答并退回五次单独请求
+        response_text = await super()._invoke_llm_analysis(
+            COMBINED_ANALYSIS_PROMPT, input_data, callbacks, cache_if=self._is_json_object
+        )
+        if response_text.startswith("错误："):
+            logger.error(f"合并分析失败: {response_text}")
+            return {}
+        try:
+            parsed = parse_llm_json(response_text)
+        except ValueError as e:
+            logger.error(f"合并分析未能解析JSON: {e}")
+            logger.debug(f"合并分析原始响应: {response_text[:500]}...")
+            return {}
+        if not isinstance(parsed, dict):
+            logger.error(f"合并分析返回的JSON不是对象: {response_text[:200]}")
+            return {}
+
+        results = {}
+        for key in ("methodology_analysis", "innovation_extraction", "story"):
+            value = parsed.get(key)
+            if isinstance(value, str) and value.strip():
+                results[key] = value.strip()
+        questions = parsed.get("questions")
+        if isinstance(questions, list):
+            questions = [q.strip() for q in questions if isinstance(q, str) and q.strip()]
+            if questions:
+                results["questions"] = questions[:config.settings.MAX_QUESTIONS_TO_GENERATE]
+        mindmap = parsed.get("mindmap")
+        if isinstance(mindmap, str) and mindmap.strip():
+            from agents.formatting_utils import format_mermaid_code
+            results["mindmap"] = format_mermaid_code(mindmap)
+
+        missing = [key for key in self.SECTIONS if key not in results]
+        if missing:
+            logger.warning(f"合并分析结果缺少或无法解析以下部分，将单独生成: {', '.join(missing)}")
+        return results
+
+    @staticmethod
+    def _is_json_object(response_text: str) -> bool:
+        """回答能否解析为JSON对象。"""
+        try:
+            return isinstance(parse_llm_json(response_text), dict)
+        except ValueError:
+            return False
+
+    async def run(self, content: str, image_analysis: str = "", callbacks: Optional[List[BaseCallbackHandler]] = None) -> Dict[str, Any]:
+        """实现抽象的run方法。"""
+        return await self.analyze_all(content, callbacks, image_analysis)
+
 class DeepAnalysisAgent(BaseResearchAgent):
+    # 深度分析是流程的最后一步，优先于其他请求
+    llm_priority = PRIORITY_CRITICAL
+
     def __init__(self, llm_client: Any):
         super().__init__(llm_client, provider_name="openai")
 
@@ -418,7 +606,8 @@ class DeepAnalysisAgent(BaseResearchAgent):
         image_analysis: str = "",
         references_summary: str = "无参考文献信息。", # 提供默认值
         related_articles_summary: str = "无相关文献信息。", # 提供默认值
-        callbacks: Optional[List[BaseCallbackHandler]] = None
+        callbacks: Optional[List[BaseCallbackHandler]] = None,
+        stream_callback: Optional[StreamCallback] = None
     ) -> str:
         """
         执行深度文献分析。
@@ -429,27 +618,30 @@ class DeepAnalysisAgent(BaseResearchAgent):
             references_summary: 主要文献的参考文献摘要信息。
             related_articles_summary: 相关文献的摘要信息。
             callbacks: LangChain回调处理器列表。
+            stream_callback: 流式输出回调，接收截至目前的累计文本。
             
         Returns:
             Markdown格式的深度分析报告。
         """
         logger.info(f"开始深度文献分析，主文献内容长度: {len(content)} 字符")
         
-        # 截断各个输入部分以适应LLM的上下文窗口限制
-        # 注意：这里的截断策略可能需要根据实际最大Token数和各部分重要性进行调整
-        # 假设总字符数限制为 MAX_CONTENT_CHARS_FOR_LLM，按比例分配
-        # 例如：主内容占60%，图片分析10%，参考文献15%，相关文献15%
-        # 这是一个简化的分配，实际可能需要更复杂的策略
-        
-        total_limit = config.settings.MAX_CONTENT_CHARS_FOR_LLM
-        
-        # 为了简单起见，我们先对每个部分进行单独截断，并记录日志
-        # 更好的做法是动态计算各部分长度，然后按比例或优先级截断
-        
-        truncated_content = self._truncate_content(content, max_chars=int(total_limit * 0.5)) # 主内容占50%
-        truncated_image_analysis = self._truncate_content(image_analysis, max_chars=int(total_limit * 0.1)) # 图片分析10%
-        truncated_references_summary = self._truncate_content(references_summary, max_chars=int(total_limit * 0.2)) # 参考文献20%
-        truncated_related_articles_summary = self._truncate_content(related_articles_summary, max_chars=int(total_limit * 0.2)) # 相关文献20%
+        # 按Token在上下文窗口内为各部分分配预算：主内容优先，参考文献和相关文献次之，图片分析最后；
+        # 较短的部分只占用实际长度，剩余预算分给其他部分
+        budget = self.token_budget
+        fitted = budget.fit(
+            {
+                "content": content,
+                "image_analysis": image_analysis,
+                "references_summary": references_summary,
+                "related_articles_summary": related_articles_summary,
+            },
+            weights={"content": 5, "image_analysis": 1, "references_summary": 2, "related_articles_summary": 2},
+            total_tokens=budget.prompt_budget - budget.count(DEEP_ANALYSIS_PROMPT),
+        )
+        truncated_content = fitted["content"]
+        truncated_image_analysis = fitted["image_analysis"]
+        truncated_references_summary = fitted["references_summary"]
+        truncated_related_articles_summary = fitted["related_articles_summary"]
 
         logger.debug(f"深度分析输入截断后长度：主内容 {len(truncated_content)}, 图片分析 {len(truncated_image_analysis)}, 参考文献 {len(truncated_references_summary)}, 相关文献 {len(truncated_related_articles_summary)}")
 
@@ -468,7 +660,8 @@ class DeepAnalysisAgent(BaseResearchAgent):
                 callbacks,
                 # 对于深度分析，可能需要更复杂的缓存键，例如基于所有输入部分的哈希
                 # 但为简单起见，仍使用 "content" (主文献内容) 作为主要哈希依据
-                cache_content_key="content" 
+                cache_content_key="content",
+                stream_callback=stream_callback
             )
 
             if response_text.startswith("错误："):
@@ -0,0 +1,303 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import openai
+
+from slais import config
+from slais.utils.logging_utils import logger
+
+# 请求优先级：数值越小越先获得名额。深度分析位于关键路径末端，优先级最高
+PRIORITY_CRITICAL = 0
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 20
+PRIORITY_LOW = 30
+
+# 可重试的错误：限流、超时、连接失败和服务端错误；其余错误（如400）重试也不会成功
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # 包括 APITimeoutError
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+# RPM/TPM 的统计窗口（秒）
+_WINDOW_SECONDS = 60.0
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应的 retry-after-ms / Retry-After 头中读取建议等待秒数（仅支持秒数形式）。"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        if headers.get("retry-after"):
+            return max(0.0, float(headers["retry-after"]))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float) -> float:
+    """服务端给出 Retry-After 时按其等待，否则使用带 ±25% 抖动的指数退避。"""
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        return retry_after
+    delay = base_delay * (2 ** attempt)
+    return max(0.1, delay + random.uniform(-0.25 * delay, 0.25 * delay))
+
+
+class _ModelLane:
+    """
+    单个模型的请求名额：并发数、每分钟请求数和每分钟Token数（按发出前的估算值）三项限制，
+    等待中的请求按优先级、再按到达顺序获得名额。被限流 (429) 时整个模型暂停到 Retry-After 之后。
+    """
+
+    def __init__(self, model_name: str, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int):
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._waiters = []  # (priority, seq, estimated_tokens, enqueued_at, future)
+        self._seq = itertools.count()
+        self._window = deque()  # (发出时间, 估算Token数)
+        self._window_tokens = 0
+        self._timer = None
+        # 指标
+        self.granted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+        self.wait_by_priority: Dict[int, list] = {}  # 优先级 -> [请求数, 总等待秒数]
+
+    async def acquire(self, priority: int, estimated_tokens: int) -> float:
+        """等待一个名额，返回排队等待的秒数。"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), estimated_tokens, time.monotonic(), future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配名额但调用方被取消，归还名额
+                self.release()
+            else:
+                self._waiters = [w for w in self._waiters if w[4] is not future]
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def reset_loop_state(self) -> None:
+        """
+        丢弃与旧事件循环绑定的等待队列、定时器和名额占用（旧循环结束后它们不会再被唤醒或归还）。
+        配置的限制和累计指标保留。
+        """
+        self._waiters = []
+        self._timer = None
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._window.clear()
+        self._window_tokens = 0
+
+    def pause(self, seconds: float) -> None:
+        """被限流后暂停该模型的全部新请求，避免在 Retry-After 之前继续触发 429。"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _wait_for_rate(self, now: float, estimated_tokens: int) -> float:
+        """按RPM/TPM窗口计算队首请求还需等待的秒数（0表示可立即发出）。"""
+        while self._window and now - self._window[0][0] >= _WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+        wait = max(0.0, self.paused_until - now)
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            wait = max(wait, self._window[0][0] + _WINDOW_SECONDS - now)
+        if self.tokens_per_minute and self._window:
+            # 单个请求的估算值超过TPM上限时，等窗口清空后单独发出
+            excess = self._window_tokens + estimated_tokens - self.tokens_per_minute
+            released = 0
+            for sent_at, tokens in self._window:
+                if excess <= released:
+                    break
+                released += tokens
+                wait = max(wait, sent_at + _WINDOW_SECONDS - now)
+        return wait
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters and self.in_flight < self.max_concurrency:
+            priority, _, estimated_tokens, enqueued_at, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            wait = self._wait_for_rate(now, estimated_tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self._window.append((now, estimated_tokens))
+            self._window_tokens += estimated_tokens
+            waited = now - enqueued_at
+            self.granted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            stats = self.wait_by_priority.setdefault(priority, [0, 0.0])
+            stats[0] += 1
+            stats[1] += waited
+            future.set_result(waited)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "requests": self.granted,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "avg_wait_seconds": round(self.total_wait / self.granted, 3) if self.granted else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "avg_wait_by_priority": {
+                priority: round(total / count, 3) for priority, (count, total) in sorted(self.wait_by_priority.items())
+            },
+        }
+
+
+class LLMScheduler:
+    """
+    进程级LLM请求调度器：所有文本分析请求按模型、图片分析请求按 <模型名>:vision 通道共享并发数、RPM和TPM限制，
+    按优先级分配名额，并对限流 (429)、超时和服务端错误 (5xx) 按 Retry-After 或指数退避重试。
+    批处理中多篇文献并发时，限制对所有文献合并生效。
+    """
+
+    def __init__(self):
+        self._lanes: Dict[str, _ModelLane] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def configure(self, model_name: str, max_concurrency: Optional[int] = None,
+                  requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None) -> None:
+        """设置某个模型的限制（未给出的项保持不变）。图片请求使用 <模型名>:vision 通道，与同名文本模型的限制互不影响。"""
+        lane = self._lane(model_name)
+        if max_concurrency is not None:
+            lane.max_concurrency = max(1, max_concurrency)
+        if requests_per_minute is not None:
+            lane.requests_per_minute = requests_per_minute
+        if tokens_per_minute is not None:
+            lane.tokens_per_minute = tokens_per_minute
+
+    def _lane(self, model_name: str) -> _ModelLane:
+        lane = self._lanes.get(model_name)
+        if lane is None:
+            lane = _ModelLane(
+                model_name,
+                max_concurrency=config.settings.LLM_MAX_CONCURRENCY,
+                requests_per_minute=config.settings.LLM_RPM,
+                tokens_per_minute=config.settings.LLM_TPM,
+            )
+            self._lanes[model_name] = lane
+        return lane
+
+    def _bind_loop(self) -> None:
+        """
+        调度器是进程级单例，而CLI、Web界面和测试可能多次调用 asyncio.run()。
+        当前事件循环与上次不同时，重置各模型中绑定在旧循环上的 future 和定时器。
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            for lane in self._lanes.values():
+                lane.reset_loop_state()
+        self._loop = loop
+
+    @asynccontextmanager
+    async def slot(self, model_name: str, priority: int = PRIORITY_NORMAL, estimated_tokens: int = 0):
+        """在并发和速率限制下占用一个请求名额（不含重试），退出时归还。"""
+        self._bind_loop()
+        lane = self._lane(model_name)
+        await lane.acquire(priority, estimated_tokens)
+        try:
+            yield lane
+        finally:
+            lane.release()
+
+    def report_rate_limit(self, model_name: str, delay: float) -> None:
+        """记录一次限流，并在 delay 秒内暂停该模型的新请求。"""
+        lane = self._lane(model_name)
+        lane.rate_limited += 1
+        lane.pause(delay)
+
+    def report_retry(self, model_name: str) -> None:
+        self._lane(model_name).retries += 1
+
+    async def submit(self, model_name: str, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_NORMAL,
+                     estimated_tokens: int = 0, max_retries: Optional[int] = None, label: str = "") -> Any:
+        """
+        在名额内执行 call()，可重试的错误按 Retry-After 或指数退避重试；退避期间释放名额。
+        重试次数用尽或遇到不可重试的错误时抛出最后一次的异常。
+        """
+        max_retries = config.settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        lane = self._lane(model_name)
+        for attempt in range(max_retries + 1):
+            async with self.slot(model_name, priority, estimated_tokens):
+                try:
+                    return await call()
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= max_retries:
+                        lane.failures += 1
+                        raise
+                    delay = retry_delay(e, attempt, config.settings.LLM_RETRY_BASE_DELAY)
+                    if isinstance(e, openai.RateLimitError):
+                        self.report_rate_limit(model_name, delay)
+                    lane.retries += 1
+                    logger.warning(
+                        f"LLM请求失败 ({type(e).__name__})，{delay:.2f} 秒后重试 "
+                        f"(尝试 {attempt + 1}/{max_retries + 1}，模型 {model_name}) {label}"
+                    )
+                except Exception:
+                    lane.failures += 1
+                    raise
+            await asyncio.sleep(delay)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各模型的队列深度、并发数、请求/重试/限流次数和排队等待时间。"""
+        return {model_name: lane.metrics() for model_name, lane in self._lanes.items()}
+
+    def log_metrics(self) -> None:
+        for model_name, stats in self.metrics().items():
+            logger.info(
+                f"LLM调度统计 [{model_name}]: 请求 {stats['requests']} 次，重试 {stats['retries']} 次，"
+                f"限流 {stats['rate_limited']} 次，失败 {stats['failures']} 次，"
+                f"平均排队 {stats['avg_wait_seconds']:.2f} 秒（最长 {stats['max_wait_seconds']:.2f} 秒），"
+                f"最大队列深度 {stats['max_queue_depth']}，按优先级平均排队 {stats['avg_wait_by_priority']}"
+            )
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    """进程内共享的LLM请求调度器。"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
@@ -1,75 +1,162 @@
 import os
+import asyncio
+import shutil
 from pathlib import Path
 from slais.utils.logging_utils import logger
-from slais.pdf_utils import convert_pdf_to_markdown, extract_images
+from typing import AsyncIterator
+from slais.pdf_utils import (
+    convert_pdf_to_markdown, extract_images, extract_embedded_images, resolve_conversion_profile, MarkdownSegment,
+    paper_output_dir
+)
+from slais.utils.hash_utils import sha256_file
+from agents.cache.conversion_cache import ConversionCache
+from slais.pdf_worker_pool import run_in_pool
+from slais.converter_service import is_converter_available, convert_via_service, extract_images_via_service
 from slais import config
 
 class PDFParsingAgent:
     def __init__(self):
         pass
 
-    async def extract_content(self, pdf_path: str) -> str:
+    async def extract_content(self, pdf_path: str, profile: str = None) -> str:
         """提取PDF内容
         
         Args:
             pdf_path: PDF文件路径
+            profile: 转换配置档 (fast/standard/debug)，为None时使用 PDF_CONVERSION_PROFILE
             
         Returns:
             PDF内容的Markdown格式
         """
+        async for segment in self.iter_content(pdf_path, profile):
+            if segment.final:
+                return segment.text
+        return ""
+
+    async def iter_content(self, pdf_path: str, profile: str = None, lead_budget=None) -> AsyncIterator[MarkdownSegment]:
+        """按页序流式提取PDF内容
+        
+        转换过程中依次产出已转换页段的 Markdown（final=False），以空行连接即为文档开头部分；
+        最后总是产出一个 final=True 的片段，其 text 为完整文档（失败时为空字符串）。
+        命中转换缓存或整篇一次转换时只产出最终片段。
+        
+        Args:
+            pdf_path: PDF文件路径
+            profile: 转换配置档 (fast/standard/debug)，为None时使用 PDF_CONVERSION_PROFILE
+            lead_budget: 可选，提前开始的LLM分析的Token预算，开头几页不足以填满时不单独转换开头页面
+        """
         logger.info(f"开始解析PDF文件: {pdf_path}")
+        profile_name, _ = resolve_conversion_profile(profile)
         
         # 获取PDF文件名（不含扩展名）
         pdf_filename = os.path.basename(pdf_path)
         pdf_name_without_ext = os.path.splitext(pdf_filename)[0]
         
-        # 构建预期的Markdown文件输出路径
-        output_dir = Path(config.OUTPUT_BASE_DIR) / pdf_name_without_ext
+        # 本次运行的输出目录（报告、图片分析等阶段从这里读取图片），以内容哈希区分同名的不同文献
+        try:
+            pdf_sha256 = await asyncio.to_thread(sha256_file, pdf_path)
+        except OSError as e:
+            logger.warning(f"读取PDF文件失败，无法计算内容哈希: {e}")
+            pdf_sha256 = None
+        output_dir = paper_output_dir(pdf_path, pdf_sha256)
         markdown_dir = output_dir / f"{pdf_name_without_ext}_markdown"
-        expected_md_filepath = markdown_dir / f"{pdf_name_without_ext}.md"
 
-        # 检查是否已存在Markdown文件
-        if expected_md_filepath.exists() and expected_md_filepath.is_file():
-            logger.info(f"找到已存在的Markdown文件: {expected_md_filepath}。将直接读取此文件。")
+        # 按PDF内容（而非文件名）查找已有的转换结果，同名的不同文献不会混用，重复上传的同一文献不再转换
+        cache = None
+        if config.settings.PDF_CONVERSION_CACHE_ENABLED and pdf_sha256:
             try:
-                with open(expected_md_filepath, 'r', encoding='utf-8') as f:
-                    markdown_content = f.read()
-                logger.info(f"成功读取已存在的Markdown文件内容，长度: {len(markdown_content)}。")
-                return markdown_content
+                cache = ConversionCache()
+                entry = cache.find(pdf_sha256, profile_name)
+                if entry is not None:
+                    md_file_path = await asyncio.to_thread(cache.materialize, entry, markdown_dir, pdf_name_without_ext)
+                    with open(md_file_path, 'r', encoding='utf-8') as f:
+                        markdown_content = f.read()
+                    logger.info(f"使用缓存的转换结果，跳过PDF转换。Markdown长度: {len(markdown_content)}")
+                    yield MarkdownSegment(markdown_content, final=True)
+                    return
             except Exception as e:
-                logger.error(f"读取已存在的Markdown文件 {expected_md_filepath} 失败: {e}。将尝试重新转换PDF。")
-        else:
-            logger.info(f"未找到预期的Markdown文件 {expected_md_filepath} 或它不是一个文件。将执行PDF转换。")
+                logger.error(f"读取PDF转换缓存失败: {e}。将执行PDF转换。")
+                cache = None
 
-        # 创建最终输出目录
+        # 清除本文献输出目录中上次转换残留的图片，避免被当作本次转换的图片
+        shutil.rmtree(markdown_dir / config.settings.PDF_IMAGES_SUBDIR, ignore_errors=True)
         Path(output_dir).mkdir(parents=True, exist_ok=True)
 
+        segments = asyncio.Queue()
+        convert_task = asyncio.ensure_future(
+            self._convert(pdf_path, output_dir, profile_name, on_segment=segments.put_nowait, lead_budget=lead_budget)
+        )
+        content = ""
         try:
+            # 转换进行中时转发已完成的页段
+            while not (convert_task.done() and segments.empty()):
+                getter = asyncio.ensure_future(segments.get())
+                done, _ = await asyncio.wait({getter, convert_task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield MarkdownSegment(getter.result())
+                else:
+                    getter.cancel()
+
             # 调用转换功能，直接指定最终输出目录
-            md_file_path = await convert_pdf_to_markdown(pdf_path, output_dir=output_dir)
-            
+            md_file_path = convert_task.result()
             if md_file_path and Path(md_file_path).exists():
                 with open(md_file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
                 logger.info(f"PDF内容成功转换为Markdown，并已读取。路径: {md_file_path}, 长度: {len(content)}")
-                return content
+                if cache is not None and pdf_sha256:
+                    await asyncio.to_thread(
+                        cache.store, pdf_sha256, profile_name, markdown_dir, pdf_name_without_ext, pdf_filename
+                    )
             else:
                 logger.error(f"PDF转换为Markdown失败或未返回有效路径: {md_file_path}")
-                return ""
         except Exception as e:
             logger.error(f"从PDF '{pdf_path}' 提取内容时发生错误: {e}")
             import traceback
             logger.debug(f"错误详情: {traceback.format_exc()}")
-            return ""
+        finally:
+            if not convert_task.done():
+                convert_task.cancel()
+        yield MarkdownSegment(content, final=True)
+
+    async def _convert(self, pdf_path: str, output_dir, profile: str = None, on_segment=None, lead_budget=None) -> str:
+        """优先使用常驻转换服务（模型已加载），服务不可用或出错时在本地转换。
+        
+        on_segment 只在本地转换时生效；转换服务整篇返回结果。
+        """
+        if await is_converter_available():
+            logger.info("检测到PDF转换服务，使用常驻服务进行转换。")
+            try:
+                return await convert_via_service(pdf_path, output_dir, profile)
+            except Exception as e:
+                logger.warning(f"转换服务处理失败，改为本地转换: {e}")
+        return await convert_pdf_to_markdown(
+            pdf_path, output_dir=output_dir, profile=profile, on_segment=on_segment, lead_budget=lead_budget
+        )
 
-    async def extract_images(self, pdf_path: str, output_dir: str) -> list:
+    async def extract_images(self, pdf_path: str, output_dir: str, layout: bool = False) -> list:
         """
         提取PDF中的图片到指定目录。
         Args:
             pdf_path: PDF文件路径
             output_dir: 图片输出目录
+            layout: 为 False（默认）时用 PyMuPDF 直接导出嵌入的位图，不运行模型；
+                为 True 时运行 MinerU 版面分析，按版面裁剪图表（包括矢量图），耗时与一次完整转换相当
         Returns:
             图片文件路径列表
         """
-        # extract_images 是同步函数，这里直接调用即可
-        return extract_images(pdf_path, output_dir)
+        if not layout:
+            images = await asyncio.to_thread(extract_embedded_images, str(pdf_path), str(output_dir))
+            return [image["path"] for image in images]
+
+        if await is_converter_available():
+            try:
+                return await extract_images_via_service(pdf_path, output_dir)
+            except Exception as e:
+                logger.warning(f"通过转换服务提取图片失败，改为本地提取: {e}")
+
+        # extract_images 同样需要运行MinerU模型，交给转换进程池执行以免阻塞事件循环
+        try:
+            return await run_in_pool(extract_images, str(pdf_path), str(output_dir))
+        except Exception as e:
+            logger.error(f"提取PDF '{pdf_path}' 中的图片时发生错误: {e}")
+            return []
@@ -6,8 +6,20 @@
 # {image_analysis} 占位符会填充图片内容的结构化描述。
 # TokenUsageCallbackHandler (位于 agents/callbacks.py) 会负责计算总输入Token数量。
 
-METHODOLOGY_ANALYSIS_PROMPT = """
-请分析以下文献内容（包括图片分析结果），并以 Markdown 格式返回对研究方法的详细评估。
+# 各分析提示词共用的开头：文献内容和图片分析在前，任务说明在后。
+# 同一篇文献的各项分析请求（内容按相同上限截断）因此具有完全相同的前缀，
+# 可以命中服务商的提示词前缀缓存，缓存命中的Token按折扣计费且处理更快。
+PAPER_CONTEXT_PREFIX = """文献内容：
+{content}
+
+图片内容分析（如有）：
+{image_analysis}
+
+---
+"""
+
+METHODOLOGY_ANALYSIS_PROMPT = PAPER_CONTEXT_PREFIX + """
+请分析以上文献内容（包括图片分析结果），并以 Markdown 格式返回对研究方法的详细评估。
 请确保输出结构清晰，包含以下明确的标题和内容：
 
 ## 研究方法评估
@@ -33,17 +45,11 @@ METHODOLOGY_ANALYSIS_PROMPT = """
 ### 方法创新点
 - 识别并描述研究方法中的创新点。
 
-文献内容：
-{content}
-
-图片内容分析（如有）：
-{image_analysis}
-
 请严格按照上述 Markdown 格式输出。
 """
 
-INNOVATION_EXTRACTION_PROMPT = """
-请仔细阅读以下文献内容（包括图片分析结果），并以 Markdown 格式提取其核心创新点和潜在应用。
+INNOVATION_EXTRACTION_PROMPT = PAPER_CONTEXT_PREFIX + """
+请仔细阅读以上文献内容（包括图片分析结果），并以 Markdown 格式提取其核心创新点和潜在应用。
 请确保输出结构清晰，包含以下明确的标题和内容：
 
 ## 核心创新与应用前景
@@ -63,17 +69,11 @@ INNOVATION_EXTRACTION_PROMPT = """
 ### 未来研究方向
 - 文献中暗示或明确提出的未来研究方向。
 
-文献内容：
-{content}
-
-图片内容分析（如有）：
-{image_analysis}
-
 请严格按照上述 Markdown 格式输出。
 """
 
-QA_GENERATION_PROMPT = """
-请根据以下文献内容（包括图片分析结果），生成 {num_questions} 个高质量、具有深度和启发性的问题。
+QA_GENERATION_PROMPT = PAPER_CONTEXT_PREFIX + """
+请根据以上文献内容（包括图片分析结果），生成 {num_questions} 个高质量、具有深度和启发性的问题。
 这些问题应覆盖文献的核心概念、关键发现、研究方法、数据解读、创新点、局限性及未来展望等方面，能够引导深入理解和批判性思考。
 请以 Markdown 列表格式输出，每个问题前加 `- `，问题应简明、具体、与文献内容紧密相关，避免泛泛而谈。
 
@@ -84,12 +84,6 @@ QA_GENERATION_PROMPT = """
 - 作者如何解释实验数据中的异常现象？
 - 未来研究可以在哪些方向进一步拓展？
 
-文献内容：
-{content}
-
-图片内容分析（如有）：
-{image_analysis}
-
 请确保所有问题均基于文献内容，具有针对性和启发性，避免重复和表述模糊。
 """
 
@@ -106,44 +100,35 @@ QA_GENERATION_PROMPT = """
 #
 # 请直接给出答案，不需要重复问题。
 
-BATCH_ANSWER_GENERATION_PROMPT = """
-请根据以下文献内容（包括图片分析结果），为下面列出的每一个问题提供一个内容完善、信息充分、准确且具有参考价值的答案。
+BATCH_ANSWER_GENERATION_PROMPT = PAPER_CONTEXT_PREFIX + """
+请根据以上文献内容（包括图片分析结果），为下面列出的每一个问题提供一个内容完善、信息充分、准确且具有参考价值的答案。
 每个答案应涵盖问题相关的核心要点，必要时可适当补充背景、细节或例证，使回答具有完整性和权威性。
-请以一个 JSON 列表的格式返回结果，其中每个元素是一个包含 "question" 和 "answer" 键的字典。
-确保 JSON 格式严格正确无误，并且每个问题的文本与此处提供的完全一致。
-文献内容：
-{content}
-
-图片内容分析（如有）：
-{image_analysis}
+请以一个 JSON 列表的格式返回结果，其中每个元素是一个包含 "id"、"question" 和 "answer" 键的字典，
+"id" 与问题列表中的编号一致，"question" 为问题原文。确保 JSON 格式严格正确无误。
 
-问题列表 (请为这些问题生成答案，并确保在输出的JSON中，每个问题的文本与此处提供的完全一致)：
+问题列表 (JSON格式，每个问题带有编号 id)：
 {questions_json_list_string}
 
 重要提示：请只输出 JSON 内容，不要包含任何额外的解释性文字、Markdown 代码块标记（如```json）或任何其他非JSON文本。
 
 例如:
-"question": "问题1的文本", "answer": "答案1的文本",
-"question": "问题2的文本", "answer": "答案2的文本"
+[
+  {{"id": 1, "question": "问题1的文本", "answer": "答案1的文本"}},
+  {{"id": 2, "question": "问题2的文本", "answer": "答案2的文本"}}
+]
 请严格按照上述 JSON 格式输出所有问答对，确保每个答案内容详实、完善。
 """
 
-STORYTELLING_PROMPT = """
-请将以下文献内容（包括图片分析结果）用讲故事的方式生动地讲述出来。
+STORYTELLING_PROMPT = PAPER_CONTEXT_PREFIX + """
+请将以上文献内容（包括图片分析结果）用讲故事的方式生动地讲述出来。
 故事应该引人入胜、通俗易懂，同时不失专业性和准确性，能够清晰地传达文献的核心思想、研究背景、过程、主要发现和重要意义。
 请避免使用过于晦涩的技术术语，或者在必要时进行简洁明了的解释。
 
-文献内容：
-{content}
-
-图片内容分析（如有）：
-{image_analysis}
-
 请以流畅的叙述体 Markdown 格式返回故事。
 """
 
-MINDMAP_PROMPT = """
-请根据以下文献内容（包括图片分析结果），生成一个概括全文逻辑结构的 Mermaid 格式的脑图（思维导图）。
+MINDMAP_PROMPT = PAPER_CONTEXT_PREFIX + """
+请根据以上文献内容（包括图片分析结果），生成一个概括全文逻辑结构的 Mermaid 格式的脑图（思维导图）。
 脑图应清晰地展示文献的主要章节、关键概念、研究流程或论证结构。
 请确保输出是有效的 Mermaid 语法代码块。
 
@@ -158,17 +143,51 @@ graph TD
     F --> G[结论]
 ```
 
-文献内容：
-{content}
+请只返回 Mermaid 代码块，不要包含额外的解释文本。
+"""
 
-图片内容分析（如有）：
-{image_analysis}
+# 长文献 map-reduce 模式的分段提取：逐段提取要点，拼接后代替截断的全文供各项分析使用
+CHUNK_SUMMARY_PROMPT = """
+以下是一篇学术文献的第 {chunk_index}/{chunk_count} 部分。请提取这一部分的要点，供后续的方法学评估、创新点提取、问答和综合分析使用。
+要求：
+- 保留研究问题、方法与实验设置、关键数据与数值结果、统计结论、作者的解释与讨论、局限性以及重要的引用工作；
+- 保留原文的章节标题，使用 Markdown 列表；
+- 只依据本部分内容，不要推测其他部分；
+- 总长度不超过 {max_chars} 个字符。
 
-请只返回 Mermaid 代码块，不要包含额外的解释文本。
+文献片段：
+{content}
+"""
+
+# 合并分析：一次请求完成方法学分析、创新点提取、问题生成、讲故事和脑图五项任务，文献内容只发送一次
+COMBINED_ANALYSIS_PROMPT = PAPER_CONTEXT_PREFIX + """
+请阅读以上文献内容（包括图片分析结果），一次性完成下列五项任务，并以一个 JSON 对象返回结果。
+
+1. methodology_analysis：以 Markdown 格式评估研究方法，以 "## 研究方法评估" 为标题，依次包含
+   "### 方法类型"、"### 关键技术"、"### 数据来源"、"### 样本量描述 (如果适用)"、"### 方法优点"、"### 方法局限性"、"### 方法创新点" 小节。
+2. innovation_extraction：以 Markdown 格式提取核心创新与应用前景，以 "## 核心创新与应用前景" 为标题，依次包含
+   "### 核心创新点"、"### 解决的问题"、"### 与现有工作相比的新颖性"、"### 潜在应用"、"### 未来研究方向" 小节。
+3. questions：生成 {num_questions} 个高质量、具有深度和启发性的问题，覆盖核心概念、关键发现、研究方法、数据解读、创新点、局限性及未来展望，
+   以字符串列表给出，问题应简明、具体、与文献内容紧密相关。
+4. story：用讲故事的方式生动地讲述文献，引人入胜、通俗易懂又不失专业性和准确性，
+   清晰传达研究背景、过程、主要发现和重要意义，使用流畅的叙述体 Markdown。
+5. mindmap：概括全文逻辑结构的 Mermaid 脑图代码（如 graph TD ...），展示主要章节、关键概念、研究流程或论证结构。
+
+重要提示：请只输出 JSON 对象，不要包含任何额外的解释性文字或 Markdown 代码块标记。字符串中的换行和引号必须正确转义。格式为：
+{{"methodology_analysis": "...", "innovation_extraction": "...", "questions": ["问题1", "问题2"], "story": "...", "mindmap": "graph TD\\n    A[文献标题] --> B(引言)"}}
 """
 
-DEEP_ANALYSIS_PROMPT = """
-请基于以下主要文献内容、其图片分析结果、参考文献摘要以及相关文献摘要，进行一次深入的综合分析。
+DEEP_ANALYSIS_PROMPT = PAPER_CONTEXT_PREFIX + """
+**主要文献的参考文献摘要（格式：[序号] 作者 (年份). 标题. 期刊. DOI/PMID (如有)）：**
+{references_summary}
+
+---
+**相关文献摘要（格式：作者 (年份). 标题. 期刊. DOI/PMID (如有)）：**
+{related_articles_summary}
+
+---
+
+请基于以上主要文献内容、其图片分析结果、参考文献摘要以及相关文献摘要，进行一次深入的综合分析。
 分析报告应以 Markdown 格式呈现，并包含以下几个方面：
 
 ## 文献深度分析报告
@@ -190,25 +209,6 @@ DEEP_ANALYSIS_PROMPT = """
 - 基于对当前文献及其学术上下文（参考文献和相关文献）的理解，提出更深层次的、尚未解决的关键问题。
 - 展望该领域未来可能出现的新研究方向或有前景的探索路径。
 
----
-
-**主要文献内容：**
-{content}
-
----
-**主要文献图片内容分析（如有）：**
-{image_analysis}
-
----
-**主要文献的参考文献摘要（格式：[序号] 作者 (年份). 标题. 期刊. DOI/PMID (如有)）：**
-{references_summary}
-
----
-**相关文献摘要（格式：作者 (年份). 标题. 期刊. DOI/PMID (如有)）：**
-{related_articles_summary}
-
----
-
 ### 6. 参考文献
 - 请在分析报告最后，输出本次分析中引用的所有参考文献，格式必须严格遵循Nature期刊的参考文献格式（作者. 文章标题. 期刊名 卷号, 起止页码 (年份). DOI/PMID（如有））。
 - 仅列出在分析报告正文中实际引用的文献，并在正文中以上标数字引用（如^1^、^2^等）。
@@ -216,6 +216,9 @@ DEEP_ANALYSIS_PROMPT = """
 请确保分析的深度和广度，并以清晰、结构化的 Markdown 格式返回报告，正文和参考文献格式均严格符合要求。
 """
 
+# 图片内容分析提示词版本，修改 IMAGE_ANALYSIS_BASE_PROMPT 时递增，使图片分析缓存失效
+IMAGE_ANALYSIS_PROMPT_VERSION = "2"
+
 # 图片内容分析基础提示词
 IMAGE_ANALYSIS_BASE_PROMPT = """
 请对学术论文中的图片进行简洁、准确的内容分析。对于每张图片，请提供以下结构化信息：
@@ -236,3 +239,11 @@ IMAGE_ANALYSIS_BASE_PROMPT = """
 
 请用清晰、简洁的中文学术语言输出结构化描述。
 """
+
+# 多图打包分析的输出要求（附加在 IMAGE_ANALYSIS_BASE_PROMPT 之后，各图片的图注与相关段落、图片本身依次附在其后）
+IMAGE_ANALYSIS_PACK_INSTRUCTIONS = """
+本次请求依次给出 {count} 张图片，每张图片前标有其编号。请分别对每张图片按上述要求输出结构化描述，不要合并或省略任何一张。
+
+重要提示：请只输出一个 JSON 数组，不要包含任何额外的解释性文字或 Markdown 代码块标记。数组中每个元素对应一张图片，格式为：
+{{"index": 图片编号(整数), "description": "该图片的结构化描述 (Markdown 文本)"}}
+"""
@@ -0,0 +1,166 @@
+import hashlib
+import math
+import re
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from agents.callbacks import get_tokenizer
+from slais import config
+from slais.utils.logging_utils import logger
+from slais.utils.markdown_utils import split_markdown_sections
+
+# 常用模型的上下文窗口（Token）。按最长前缀匹配模型名，LLM_CONTEXT_WINDOW 非0时优先使用该配置。
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "qwen-turbo": 131072,
+    "qwen-plus": 131072,
+    "qwen-max": 32768,
+    "qwen-long": 1000000,
+    "deepseek-chat": 65536,
+    "deepseek-reasoner": 65536,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# 中日韩文字和全角符号大致各占一个Token，其余字符约四个占一个Token（编码器不可用时的近似估算）
+_WIDE_CHAR_PATTERN = re.compile(r"[　-鿿가-힯＀-￯]")
+
+# (编码器名, 文本SHA-256) -> Token数。各智能体共享，同一篇文献只编码一次
+_TOKEN_COUNT_CACHE: "OrderedDict[tuple, int]" = OrderedDict()
+_TOKEN_COUNT_CACHE_SIZE = 4096
+
+
+def model_context_window(model_name: str) -> int:
+    """模型的上下文窗口：LLM_CONTEXT_WINDOW 配置优先，其次按模型名前缀查表，未知模型使用 DEFAULT_CONTEXT_WINDOW。"""
+    if config.settings.LLM_CONTEXT_WINDOW:
+        return config.settings.LLM_CONTEXT_WINDOW
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    logger.warning(
+        f"未知模型 '{model_name}' 的上下文窗口，按 {DEFAULT_CONTEXT_WINDOW} Token 计算（可通过 LLM_CONTEXT_WINDOW 配置）。"
+    )
+    return DEFAULT_CONTEXT_WINDOW
+
+
+class TokenBudget:
+    """
+    按Token（而非字符数）为提示词各部分分配预算并截断。
+    预算 = 模型上下文窗口 - 为输出预留的Token；截断优先在章节边界、其次在段落边界进行。
+    Token数用 TokenUsageCallbackHandler 使用的同一编码器计算，并按文本哈希缓存。
+    """
+
+    def __init__(self, model_name: str, context_window: Optional[int] = None, output_reserve: Optional[int] = None):
+        self.model_name = model_name
+        self.tokenizer = get_tokenizer(model_name)
+        self._encoding_key = (getattr(self.tokenizer, "name", None) or model_name) if self.tokenizer else "approx"
+        self.context_window = context_window or model_context_window(model_name)
+        self.output_reserve = config.settings.LLM_OUTPUT_TOKEN_RESERVE if output_reserve is None else output_reserve
+
+    @property
+    def prompt_budget(self) -> int:
+        """提示词可用的Token数。"""
+        return max(0, self.context_window - self.output_reserve)
+
+    def count(self, text: str) -> int:
+        """文本的Token数（按文本哈希缓存）。"""
+        if not text:
+            return 0
+        key = (self._encoding_key, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        cached = _TOKEN_COUNT_CACHE.get(key)
+        if cached is not None:
+            _TOKEN_COUNT_CACHE.move_to_end(key)
+            return cached
+        tokens = None
+        if self.tokenizer is not None:
+            try:
+                tokens = len(self.tokenizer.encode(text))
+            except Exception as e:
+                logger.debug(f"编码器计算Token数失败，使用近似估算: {e}")
+        if tokens is None:
+            wide = len(_WIDE_CHAR_PATTERN.findall(text))
+            tokens = wide + math.ceil((len(text) - wide) / 4)
+        _TOKEN_COUNT_CACHE[key] = tokens
+        if len(_TOKEN_COUNT_CACHE) > _TOKEN_COUNT_CACHE_SIZE:
+            _TOKEN_COUNT_CACHE.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        把文本截断到 max_tokens 以内：按顺序保留完整章节，放不下的章节保留其能放下的开头段落；
+        第一段就放不下时按Token截断。
+        """
+        if max_tokens <= 0:
+            return ""
+        total = self.count(text)
+        if total <= max_tokens:
+            return text
+
+        kept, used = [], 0
+        for _, section in split_markdown_sections(text):
+            # 分隔用的空行按1个Token计
+            section_tokens = self.count(section) + 1
+            if used + section_tokens <= max_tokens:
+                kept.append(section)
+                used += section_tokens
+                continue
+            partial = []
+            for paragraph in section.split("\n\n"):
+                paragraph_tokens = self.count(paragraph) + 1
+                if used + paragraph_tokens > max_tokens:
+                    if not kept and not partial:
+                        partial.append(self._cut(paragraph, max_tokens - used))
+                    break
+                partial.append(paragraph)
+                used += paragraph_tokens
+            # 只放得下标题行时不保留该章节
+            if partial and not (len(partial) == 1 and partial[0].startswith("#")):
+                kept.extend(partial)
+            break
+        result = "\n\n".join(part for part in kept if part)
+        logger.warning(f"内容过长 ({total} Token)，按章节边界截断为约 {self.count(result)} Token（上限 {max_tokens}）。")
+        return result
+
+    def _cut(self, text: str, max_tokens: int) -> str:
+        """在Token级别截断单个段落。"""
+        if self.tokenizer is not None:
+            try:
+                cut = self.tokenizer.decode(self.tokenizer.encode(text)[:max_tokens])
+                if isinstance(cut, str):
+                    return cut
+            except Exception:
+                pass
+        return text[:int(len(text) * max_tokens / max(1, self.count(text)))]
+
+    def allocate(self, parts: Dict[str, str], weights: Dict[str, float], total_tokens: int) -> Dict[str, int]:
+        """
+        按优先级权重把 total_tokens 分配给各部分：先按权重比例划分，
+        实际长度小于其份额的部分只占用实际长度，剩余预算再按权重分给其余部分。
+
+        Returns:
+            {部分名: Token上限}
+        """
+        sizes = {name: self.count(text) for name, text in parts.items()}
+        limits = {}
+        remaining = max(0, total_tokens)
+        pending = set(parts)
+        while pending:
+            weight_sum = sum(weights.get(name, 1.0) for name in pending)
+            shares = {name: remaining * weights.get(name, 1.0) / weight_sum for name in pending}
+            satisfied = {name for name in pending if sizes[name] <= shares[name]}
+            if not satisfied:
+                limits.update({name: int(shares[name]) for name in pending})
+                break
+            for name in satisfied:
+                limits[name] = sizes[name]
+                remaining -= sizes[name]
+            pending -= satisfied
+        return limits
+
+    def fit(self, parts: Dict[str, str], weights: Dict[str, float], total_tokens: int) -> Dict[str, str]:
+        """按 allocate 的分配结果截断各部分。"""
+        limits = self.allocate(parts, weights, total_tokens)
+        return {name: self.truncate(text, limits[name]) for name, text in parts.items()}
@@ -1,10 +1,13 @@
 import argparse
 import asyncio
 import json
+import math
 import os
 import datetime
+import time
 from pathlib import Path
 import csv # Import csv module
+import shutil
 import sys # Ensure sys is imported for sys.argv and sys.executable
 
 # 确保项目根目录在路径中
@@ -62,20 +65,17 @@ def _get_streamlit_script_run_ctx():
         # If this function returns None, we assume not in Streamlit context.
         return None
 
-async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email: str, progress_callback=None):
+def build_pipeline_agents():
     """
-    完整的文章处理流程。
-    Args:
-        pdf_path (str): PDF文件路径。
-        article_doi (str): 文章DOI。
-        ncbi_email (str): NCBI邮箱。
-        progress_callback (callable, optional): 用于更新进度的回调函数，接收 (percentage, text) 参数。
+    初始化LLM客户端和全部智能体。
+    批处理模式下只初始化一次，并在所有文献之间共享。
+
+    Returns:
+        dict: 包含 llm、image_llm 及各智能体实例的字典；文本LLM初始化失败时返回 None。
     """
-    # 确保导入必要的依赖项
     from slais.utils.logging_utils import logger
     from slais import config
     from langchain_openai import ChatOpenAI
-    from agents.callbacks import TokenUsageCallbackHandler
     from agents.pdf_parsing_agent import PDFParsingAgent
     from agents.metadata_fetching_agent import MetadataFetchingAgent
     from agents.llm_analysis_agent import (
@@ -84,23 +84,22 @@ async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email:
         QAGenerationAgent,
         StorytellingAgent,
         MindMapAgent,
-        DeepAnalysisAgent # 在此处添加 DeepAnalysisAgent 的导入
+        CombinedAnalysisAgent,
+        DocumentDigestAgent,
+        DeepAnalysisAgent
     )
     from agents.image_analysis_agent import ImageAnalysisAgent
-    
-    logger.info(f"开始处理文章，PDF路径: {pdf_path}, DOI: {article_doi}")
-
-    def update_progress(percentage: int, text: str):
-        if progress_callback:
-            progress_callback(percentage, text)
-        logger.info(f"进度更新: {percentage}% - {text}")
 
     # 1. 初始化LLM客户端 (支持.env配置的模型)
     # 文本 LLM
     llm_params = {
         "model_name": config.settings.OPENAI_API_MODEL,  # 从.env读取模型名
         "openai_api_key": config.settings.OPENAI_API_KEY,
-        "temperature": config.settings.OPENAI_TEMPERATURE
+        "temperature": config.settings.OPENAI_TEMPERATURE,
+        # 流式输出时在最后一段返回Token用量，保证成本统计完整
+        "stream_usage": True,
+        # 重试由 agents.llm_scheduler 在并发/速率限制之下统一处理，避免SDK内部重试绕过限流
+        "max_retries": 0
     }
     if config.settings.OPENAI_API_BASE_URL:
         llm_params["openai_api_base"] = config.settings.OPENAI_API_BASE_URL
@@ -126,7 +125,9 @@ async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email:
     image_llm_params = {
         "model_name": config.settings.IMAGE_LLM_API_MODEL,
         "openai_api_key": config.settings.IMAGE_LLM_API_KEY,
-        "temperature": config.settings.IMAGE_LLM_TEMPERATURE
+        "temperature": config.settings.IMAGE_LLM_TEMPERATURE,
+        # 重试由 ImageAnalysisAgent 在并发/速率限制之下统一处理，避免SDK内部重试绕过限流
+        "max_retries": 0
     }
     if config.settings.IMAGE_LLM_API_BASE_URL:
         image_llm_params["openai_api_base"] = config.settings.IMAGE_LLM_API_BASE_URL
@@ -143,278 +144,531 @@ async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email:
         logger.error(f"初始化图片 LLM 客户端失败: {e}")
         image_llm = None
 
-    # 实例化 TokenUsageCallbackHandler
+    # 2. 初始化智能体
+    return {
+        "llm": llm,
+        "image_llm": image_llm,
+        "pdf_parser": PDFParsingAgent(),
+        "metadata_fetcher": MetadataFetchingAgent(),
+        "methodology_analyzer": MethodologyAnalysisAgent(llm),
+        "innovation_extractor": InnovationExtractionAgent(llm),
+        "qa_generator": QAGenerationAgent(llm),
+        "storytelling_agent": StorytellingAgent(llm),
+        "mindmap_agent": MindMapAgent(llm),
+        "combined_analyzer": CombinedAnalysisAgent(llm),
+        "content_digester": DocumentDigestAgent(llm),
+        "deep_analyzer": DeepAnalysisAgent(llm),
+        "image_agent": ImageAnalysisAgent(image_llm),  # 用图片 LLM 初始化
+    }
+
+async def _open_paper_checkpoint(pdf_path: str, article_doi: str):
+    """
+    为单篇文献创建检查点视图（以PDF内容的SHA-256和DOI为键）。
+    检查点被禁用或PDF无法读取时返回 None。
+    """
+    from slais.utils.logging_utils import logger
+    from slais import config
+
+    if not config.settings.PIPELINE_CHECKPOINTS_ENABLED or not Path(pdf_path).is_file():
+        return None
+    try:
+        from slais.utils.hash_utils import sha256_file
+        from agents.cache.checkpoint_manager import CheckpointManager, PaperCheckpoint
+        pdf_sha256 = await asyncio.to_thread(sha256_file, pdf_path)
+        return PaperCheckpoint(CheckpointManager(), pdf_sha256, article_doi or "")
+    except Exception as e:
+        logger.warning(f"初始化检查点失败，本次运行不保存检查点: {e}")
+        return None
+
+async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email: str, progress_callback=None, agents=None, resume: bool = False, stream_callback=None):
+    """
+    完整的文章处理流程。
+    Args:
+        pdf_path (str): PDF文件路径。
+        article_doi (str): 文章DOI。
+        ncbi_email (str): NCBI邮箱。
+        progress_callback (callable, optional): 用于更新进度的回调函数，接收 (percentage, text) 参数。
+        agents (dict, optional): build_pipeline_agents() 的返回值。批处理时传入以复用LLM客户端和智能体，
+            为 None 时在本次调用内初始化。
+        resume (bool): 为 True 时复用该文献（PDF内容 + DOI）已完成阶段的检查点，只重新执行缺失或失败的阶段。
+        stream_callback (callable, optional): 流式输出回调，接收 (section, text, finished) 参数。section 为
+            methodology_analysis、innovation_extraction、story、mindmap 或 deep_analysis，text 为截至目前的累计文本，
+            该部分完成时以最终结果再调用一次且 finished 为 True。缓存命中的结果立即以完整文本回放。
+    """
+    # 确保导入必要的依赖项
+    from slais.utils.logging_utils import logger
+    from slais import config
+    from agents.callbacks import TokenUsageCallbackHandler
+    from agents.image_analysis_agent import summarize_image_analysis
+    from slais.utils.content_list_utils import image_captions, image_contexts, load_content_list
+    
+    logger.info(f"开始处理文章，PDF路径: {pdf_path}, DOI: {article_doi}")
+
+    if agents is None:
+        agents = build_pipeline_agents()
+        if agents is None:
+            return None
+
+    image_llm = agents["image_llm"]
+    pdf_parser = agents["pdf_parser"]
+    metadata_fetcher = agents["metadata_fetcher"]
+    methodology_analyzer = agents["methodology_analyzer"]
+    innovation_extractor = agents["innovation_extractor"]
+    qa_generator = agents["qa_generator"]
+    storytelling_agent = agents["storytelling_agent"]
+    mindmap_agent = agents["mindmap_agent"]
+    combined_analyzer = agents.get("combined_analyzer")
+    content_digester = agents.get("content_digester")
+    use_map_reduce = config.settings.LLM_MAP_REDUCE and content_digester is not None
+    deep_analyzer = agents["deep_analyzer"]
+    image_agent = agents["image_agent"]
+
+    # 实例化 TokenUsageCallbackHandler（每篇文献单独统计）
     token_callback_handler = TokenUsageCallbackHandler(model_name=config.settings.OPENAI_API_MODEL)
     callbacks_list = [token_callback_handler] # 创建回调列表
 
-    # 2. 初始化智能体
-    pdf_parser = PDFParsingAgent()
-    metadata_fetcher = MetadataFetchingAgent()
-    methodology_analyzer = MethodologyAnalysisAgent(llm)
-    innovation_extractor = InnovationExtractionAgent(llm)
-    qa_generator = QAGenerationAgent(llm)
-    storytelling_agent = StorytellingAgent(llm)
-    mindmap_agent = MindMapAgent(llm)
-    deep_analyzer = DeepAnalysisAgent(llm) # 实例化 DeepAnalysisAgent
-    image_agent = ImageAnalysisAgent(image_llm)  # 用图片 LLM 初始化
-
-    # 3. 执行流程
-    analysis_results = {}
-    # 阶段时间记录
-    stage_times = {}
-    stage_status = {}
-    stage_costs = {}
-
-    def record_stage(stage_name, start_time, end_time):
-        now = end_time.strftime("%H:%M:%S")
-        duration = (end_time - start_time).total_seconds()
-        stage_times[stage_name] = now
-        stage_status[stage_name] = "完成"
-        stage_costs[stage_name] = duration
-        logger.info(f"阶段记录成功: {{'阶段': '{stage_name}', '完成时间': '{now}', '耗时_秒': {duration:.2f}, '状态': '完成'}}")
+    # 流式输出：各分析部分的增量文本转发给 stream_callback，并记录每部分首段输出的耗时
+    pipeline_started_at = time.monotonic()
 
-    # 3.1 PDF解析
-    update_progress(10, "步骤 1/6：解析PDF内容...")
-    start_time_pdf_parsing = datetime.datetime.now() # 初始化 start_time_pdf_parsing
-    markdown_content = await pdf_parser.extract_content(pdf_path)
-    
-    if not markdown_content:
-        logger.error("PDF内容提取失败，流程中止。")
-        stage_status["PDF内容解析"] = "失败" # 标记失败状态
-        record_stage("PDF内容解析", start_time_pdf_parsing, datetime.datetime.now()) # 记录失败状态的时间
-        # 考虑是否应该在这里也记录一个耗时，即使是失败的
-        # 如果流程在此处中止，后续阶段将不会被记录
-        # return None # 如果提前返回，确保前端能处理部分 stage_times 或无 stage_times 的情况
-    else:
-        record_stage("PDF内容解析", start_time_pdf_parsing, datetime.datetime.now()) # 记录成功状态的时间
+    def section_stream(section: str) -> dict:
+        """返回传给智能体的流式输出参数；未设置 stream_callback 时为空，智能体照常一次性返回。"""
+        if stream_callback is None:
+            return {}
+        first_output = []
 
-    analysis_results["pdf_markdown_content_length"] = len(markdown_content) if markdown_content else 0
-    update_progress(20, "步骤 1/6：PDF内容解析完成。")
+        def forward(text: str):
+            if not first_output:
+                first_output.append(True)
+                logger.info(f"{section} 开始输出，距流程开始 {time.monotonic() - pipeline_started_at:.1f} 秒")
+            stream_callback(section, text, False)
+        return {"stream_callback": forward}
+
+    def finish_stream(section: str, value):
+        if stream_callback is not None and isinstance(value, str):
+            try:
+                stream_callback(section, value, True)
+            except Exception as e:
+                logger.debug(f"流式输出回调出错: {e}")
+
+    # 3. 按依赖关系组织执行流程：每个阶段在输入就绪后立即启动，互不依赖的阶段并发执行
+    from slais.stage_graph import PipelineStage, StageScheduler, StageOutcome, PARTIAL_STATUS
+    from agents.token_budget import TokenBudget
+    from slais.pdf_utils import paper_output_dir
 
-    # 新增：提取图片路径列表（图片统一存放在 output/<pdf_stem>/<pdf_stem>_markdown/images 目录，且为相对路径）
     pdf_stem = Path(pdf_path).stem
+    # 图片统一存放在 output/<pdf_stem>_<内容哈希>/<pdf_stem>_markdown/images 目录，且为相对路径
+    # 输出目录与 PDFParsingAgent 一致，由 paper_output_dir 按内容哈希区分同名的不同文献
     # MARKDOWN_SUBDIR 通常未设置，实际输出目录为 <pdf_stem>_markdown
-    markdown_dir = Path(config.settings.OUTPUT_BASE_DIR) / pdf_stem / f"{pdf_stem}_markdown"
+    markdown_dir = await asyncio.to_thread(paper_output_dir, pdf_path) / f"{pdf_stem}_markdown"
     image_dir = markdown_dir / "images"
-    image_paths = []
-    if image_dir.exists():
-        # 以 markdown_dir 为基准，获得 images 下所有图片的相对路径
-        image_paths = [str((image_dir / p.name).relative_to(markdown_dir)) for p in image_dir.iterdir() if p.is_file() and p.suffix.lower() in [".png", ".jpg", ".jpeg", ".bmp", ".gif"]]
-    elif hasattr(pdf_parser, "extract_images") and callable(getattr(pdf_parser, "extract_images", None)):
-        try:
-            extracted = await pdf_parser.extract_images(pdf_path, output_dir=image_dir)
-            if extracted and isinstance(extracted, list):
-                # 以 markdown_dir 为基准，获得 images 下所有图片的相对路径
-                image_paths = [str(Path(p).relative_to(markdown_dir)) for p in extracted]
-                logger.info(f"自动提取图片，获得 {len(image_paths)} 张图片。")
-        except Exception as e:
-            logger.warning(f"自动提取图片失败: {e}")
-    else:
-        logger.info("PDFParsingAgent 不支持 extract_images 方法，跳过图片自动提取。")
-    analysis_results["image_paths"] = image_paths
-
-    # 3.1b 图片内容分析（并发）
-    start_time_image_analysis = datetime.datetime.now()
-    current_stage_name_image = "图片内容分析"
-    if image_llm and image_paths: # 仅当image_llm成功初始化且有图片路径时才分析
-        update_progress(25, f"步骤 2/6：检测到 {len(image_paths)} 张图片，开始分析图片内容...")
+
+    # 3.1 PDF解析
+    # 支持流式解析时，开头部分的内容一旦超出LLM初步分析的Token预算（模型上下文窗口）就作为阶段性输出发布，
+    # LLM初步分析随即启动（完整内容同样会被截断到该预算），其余页面继续转换（图片分析、深度分析等仍使用完整内容）
+    llm_token_budget = getattr(methodology_analyzer, "token_budget", None) or TokenBudget(config.settings.OPENAI_API_MODEL)
+
+    async def stage_pdf_content(inputs):
+        update_progress(None, "解析PDF内容...")
+        if not hasattr(pdf_parser, "iter_content"):
+            markdown_content = await pdf_parser.extract_content(pdf_path)
+        else:
+            markdown_content = ""
+            leading_segments = []
+            leading_tokens = 0
+            published = False
+            async for segment in pdf_parser.iter_content(pdf_path, lead_budget=llm_token_budget):
+                if segment.final:
+                    markdown_content = segment.text
+                    break
+                leading_segments.append(segment.text)
+                leading_tokens += llm_token_budget.count(segment.text)
+                if not published and leading_tokens >= llm_token_budget.prompt_budget:
+                    leading_content = "\n\n".join(leading_segments)
+                    update_progress(None, f"已转换的开头内容约 {leading_tokens} Token，超出LLM上下文预算，提前开始LLM分析...")
+                    scheduler.publish("pdf_content", leading_content)
+                    published = True
+        if not markdown_content:
+            logger.error("PDF内容提取失败，依赖PDF内容的阶段将使用空内容。")
+            return StageOutcome("", "失败")
+        return markdown_content
+
+    # PDF_IMAGE_SOURCE 为 embedded 时直接用 PyMuPDF 导出嵌入图片，图片分析无需等待PDF转换完成
+    use_embedded_images = config.settings.PDF_IMAGE_SOURCE == "embedded"
+    embedded_image_dir = markdown_dir / "embedded_images"
+
+    # 提取图片路径列表
+    async def stage_image_paths(inputs):
+        image_paths = []
+        if not use_embedded_images and image_dir.exists():
+            # 以 markdown_dir 为基准，获得 images 下所有图片的相对路径
+            image_paths = [str((image_dir / p.name).relative_to(markdown_dir)) for p in image_dir.iterdir() if p.is_file() and p.suffix.lower() in [".png", ".jpg", ".jpeg", ".bmp", ".gif"]]
+        elif hasattr(pdf_parser, "extract_images") and callable(getattr(pdf_parser, "extract_images", None)):
+            # 转换结果中没有图片目录时同样走轻量的嵌入图片导出，不再运行一遍版面分析
+            target_dir = image_dir
+            if use_embedded_images:
+                target_dir = embedded_image_dir
+                shutil.rmtree(target_dir, ignore_errors=True)
+            try:
+                extracted = await pdf_parser.extract_images(pdf_path, output_dir=target_dir)
+                if extracted and isinstance(extracted, list):
+                    # 以 markdown_dir 为基准，获得 images 下所有图片的相对路径
+                    image_paths = [str(Path(p).relative_to(markdown_dir)) for p in extracted]
+                    logger.info(f"自动提取图片，获得 {len(image_paths)} 张图片。")
+            except Exception as e:
+                logger.warning(f"自动提取图片失败: {e}")
+        else:
+            logger.info("PDFParsingAgent 不支持 extract_images 方法，跳过图片自动提取。")
+        return image_paths
+
+    # 3.2 图片内容分析（并发）
+    async def stage_image_analysis(inputs):
+        image_paths = inputs["image_paths"]
+        if not image_llm:
+            logger.warning("图片LLM未成功初始化，跳过图片内容分析。")
+            update_progress(None, "图片LLM初始化失败，跳过图片分析。")
+            return StageOutcome([], "跳过 (LLM未初始化)")
+        if not image_paths:
+            update_progress(None, "未检测到可分析的图片。")
+            return StageOutcome([], "跳过 (无图片)")
+        update_progress(None, f"检测到 {len(image_paths)} 张图片，开始分析图片内容...")
+        # 版面裁剪的图片可在转换生成的内容列表中找到图注和引用它的段落，用于相关性筛选和各图片的提示词
+        content_list = load_content_list(markdown_dir, pdf_stem)
+
+        def by_image_path(mapping):
+            return {str(markdown_dir / p): mapping[Path(p).as_posix()] for p in image_paths if Path(p).as_posix() in mapping}
+
+        # 按完成顺序逐张接收结果；完成 IMAGE_ANALYSIS_READY_FRACTION 比例的图片后发布阶段性结果，
+        # 依赖图片分析的阶段随即启动，其余图片继续分析（超过时限的记为超时）
+        absolute_paths = [str(markdown_dir / p) for p in image_paths]
+        ready_count = math.ceil(len(absolute_paths) * config.settings.IMAGE_ANALYSIS_READY_FRACTION)
+        finished = {}
+        published = False
         try:
-            image_analysis_results = await image_agent.analyze_images(
-                [str(markdown_dir / p) for p in image_paths],
-                context=markdown_content,
-                callbacks=callbacks_list
+            async for result in image_agent.analyze_images_iter(
+                absolute_paths,
+                context=inputs["pdf_content"],
+                callbacks=callbacks_list,
+                captions=by_image_path(image_captions(content_list)),
+                image_contexts=by_image_path(image_contexts(content_list, config.settings.IMAGE_CONTEXT_MAX_CHARS))
+            ):
+                finished[result["image_path"]] = result
+                status = (
+                    "超时" if result.get("timed_out") else "失败" if result.get("failed")
+                    else "跳过" if result.get("skipped") else "完成"
+                )
+                update_progress(None, f"图片分析 ({len(finished)}/{len(absolute_paths)})：{Path(result['image_path']).name} - {status}")
+                if not published and ready_count <= len(finished) < len(absolute_paths):
+                    update_progress(None, f"已完成 {len(finished)}/{len(absolute_paths)} 张图片的分析，提前启动依赖图片分析的阶段...")
+                    scheduler.publish("image_analysis", [finished[p] for p in absolute_paths if p in finished])
+                    published = True
+            image_analysis_results = [finished[p] for p in absolute_paths]
+            image_stats = summarize_image_analysis(image_analysis_results)
+            update_progress(
+                None,
+                f"图片内容分析完成，获得 {image_stats['succeeded']} 条描述"
+                f"（失败 {image_stats['failed']} 张，其中超时 {image_stats['timed_out']} 张，筛选跳过 {image_stats['skipped']} 张）。"
             )
-            analysis_results["image_analysis"] = image_analysis_results
-            record_stage(current_stage_name_image, start_time_image_analysis, datetime.datetime.now())
-            update_progress(35, f"步骤 2/6：图片内容分析完成，获得 {len(image_analysis_results)} 条描述。")
+            if image_stats["failed"]:
+                # 有图片失败或超时时记为部分失败，恢复运行时重新分析（成功的图片命中缓存）
+                return StageOutcome(image_analysis_results, PARTIAL_STATUS)
+            return image_analysis_results
         except Exception as e:
             logger.error(f"图片内容分析过程中发生错误: {e}")
-            analysis_results["image_analysis"] = []
-            stage_status[current_stage_name_image] = "失败"
-            record_stage(current_stage_name_image, start_time_image_analysis, datetime.datetime.now())
-            update_progress(35, "步骤 2/6：图片内容分析失败。")
-    elif not image_llm:
-        logger.warning("图片LLM未成功初始化，跳过图片内容分析。")
-        analysis_results["image_analysis"] = []
-        stage_status[current_stage_name_image] = "跳过 (LLM未初始化)"
-        record_stage(current_stage_name_image, start_time_image_analysis, datetime.datetime.now())
-        update_progress(35, "步骤 2/6：图片LLM初始化失败，跳过图片分析。")
-    else: # image_llm存在，但image_paths为空
-        analysis_results["image_analysis"] = []
-        stage_status[current_stage_name_image] = "跳过 (无图片)"
-        record_stage(current_stage_name_image, start_time_image_analysis, datetime.datetime.now())
-        update_progress(35, "步骤 2/6：未检测到可分析的图片。")
-
-    # 新增：将图片内容分析结果格式化为Markdown字符串，供LLM分析用
-    def format_image_analysis_md(image_analysis, image_paths):
-        if not image_analysis or not isinstance(image_analysis, list):
-            return "无图片内容分析结果。"
-        lines = []
-        for idx, img in enumerate(image_analysis):
-            img_path = img.get("image_path", "")
-            desc = img.get("description", "")
-            rel_img_path = img_path
-            if image_paths:
-                for p in image_paths:
-                    if p in img_path or Path(img_path).name == Path(p).name:
-                        rel_img_path = p
-                        break
-            lines.append(f"图片{idx+1}: {rel_img_path}\\n结构化描述: {desc}\\n")
-        return "\\n".join(lines)
-    image_analysis_md = format_image_analysis_md(analysis_results["image_analysis"], analysis_results["image_paths"])
-
-    # 合并文献内容和图片分析内容，供LLM分析
-    full_content = markdown_content + "\\n\\n图片内容分析：\\n" + image_analysis_md
-
-    # 3.2 元数据获取
-    update_progress(40, "步骤 3/6：获取元数据...")
-    start_time_metadata = datetime.datetime.now()
-    current_stage_name_metadata = "元数据获取"
-    try:
-        metadata = await metadata_fetcher.fetch_metadata(doi=article_doi, email=ncbi_email)
-        analysis_results["metadata"] = metadata
-        record_stage(current_stage_name_metadata, start_time_metadata, datetime.datetime.now())
-        update_progress(50, "步骤 3/6：元数据获取完成。")
-    except Exception as e:
-        logger.error(f"元数据获取失败: {e}")
-        analysis_results["metadata"] = {"pubmed_info": None, "s2_info": None, "error": str(e)}
-        stage_status[current_stage_name_metadata] = "失败"
-        record_stage(current_stage_name_metadata, start_time_metadata, datetime.datetime.now())
-        update_progress(50, "步骤 3/6：元数据获取失败。")
-        
-    s2_info = analysis_results["metadata"].get("s2_info")
-    pubmed_info = analysis_results["metadata"].get("pubmed_info")
-
-    # 3.3-3.9 LLM分析并发执行 (现在是步骤 4/7)
-    update_progress(60, "步骤 4/7：LLM初步分析中...")
-    start_time_llm_analysis = datetime.datetime.now()
-    current_stage_name_llm = "LLM初步分析" # 更新阶段名称
-    tasks = {
-        "methodology_analysis": methodology_analyzer.analyze_methodology(
-            full_content, callbacks=callbacks_list),
-        "innovation_extraction": innovation_extractor.extract_innovations(
-            full_content, callbacks=callbacks_list),
-        "questions": qa_generator.generate_questions(
-            full_content, callbacks=callbacks_list),
-        "story": storytelling_agent.tell_story(
-            full_content, callbacks=callbacks_list),
-        "mindmap": mindmap_agent.generate_mindmap(
-            full_content, callbacks=callbacks_list)
-    }
-    # 并发执行
-    try:
+            update_progress(None, "图片内容分析失败。")
+            return StageOutcome([], "失败")
+
+    # 3.3 元数据获取（仅依赖DOI，与PDF解析并发）
+    async def stage_metadata(inputs):
+        update_progress(None, "获取元数据...")
+        try:
+            metadata = await metadata_fetcher.fetch_metadata(doi=article_doi, email=ncbi_email)
+            update_progress(None, "元数据获取完成。")
+            return metadata
+        except Exception as e:
+            logger.error(f"元数据获取失败: {e}")
+            update_progress(None, "元数据获取失败。")
+            return StageOutcome({"pubmed_info": None, "s2_info": None, "error": str(e)}, "失败")
+
+    # 3.3.1 长文献分段要点（map-reduce 模式）：全文超过LLM内容上限时，分块并行提取要点，
+    # 各项分析以要点摘要代替只保留开头的截断内容
+    async def stage_content_digest(inputs):
+        content = inputs["pdf_content"] or ""
+        if len(content) <= config.settings.MAX_CONTENT_CHARS_FOR_LLM:
+            return StageOutcome(content, "跳过 (内容未超出上限)")
+        update_progress(None, "文献内容超出LLM上限，分段提取要点...")
+        digest = await content_digester.digest(content, callbacks=callbacks_list)
+        update_progress(None, f"分段要点提取完成，要点摘要 {len(digest)} 字符。")
+        return digest
+
+    # 供LLM分析的文献内容。LLM_ANALYSIS_WAIT_FOR_IMAGES 开启时合并图片分析结果（需等待图片分析完成）
+    def build_full_content(inputs):
+        markdown_content = inputs.get("content_digest") or inputs.get("pdf_content") or ""
+        if "image_analysis" in inputs:
+            image_analysis_md = format_image_analysis_md(inputs["image_analysis"], inputs.get("image_paths"))
+            return markdown_content + "\\n\\n图片内容分析：\\n" + image_analysis_md
+        return markdown_content
+
+    # LLM初步分析只使用内容开头不超过Token预算的部分，因此可以使用PDF解析的阶段性输出；
+    # 需要合并图片分析结果时则必须等待完整转换
+    if use_map_reduce:
+        # 要点摘要需要完整内容，不能使用PDF解析的阶段性输出
+        llm_analysis_inputs = ["content_digest"]
+        if config.settings.LLM_ANALYSIS_WAIT_FOR_IMAGES:
+            llm_analysis_inputs += ["image_paths", "image_analysis"]
+        llm_analysis_early_inputs = []
+    elif config.settings.LLM_ANALYSIS_WAIT_FOR_IMAGES:
+        llm_analysis_inputs = ["pdf_content", "image_paths", "image_analysis"]
+        llm_analysis_early_inputs = []
+    else:
+        llm_analysis_inputs = []
+        llm_analysis_early_inputs = ["pdf_content"]
+
+    # 3.4 LLM初步分析（五项分析并发执行）
+    # LLM_COMBINED_ANALYSIS 开启时先用一次请求完成五项分析，只对缺失或无法解析的部分单独调用对应智能体
+    async def stage_llm_analysis(inputs):
+        update_progress(None, "LLM初步分析中...")
+        full_content = build_full_content(inputs)
+        task_factories = {
+            "methodology_analysis": lambda: methodology_analyzer.analyze_methodology(
+                full_content, callbacks=callbacks_list, **section_stream("methodology_analysis")),
+            "innovation_extraction": lambda: innovation_extractor.extract_innovations(
+                full_content, callbacks=callbacks_list, **section_stream("innovation_extraction")),
+            "questions": lambda: qa_generator.generate_questions(
+                full_content, callbacks=callbacks_list),
+            "story": lambda: storytelling_agent.tell_story(
+                full_content, callbacks=callbacks_list, **section_stream("story")),
+            "mindmap": lambda: mindmap_agent.generate_mindmap(
+                full_content, callbacks=callbacks_list, **section_stream("mindmap"))
+        }
+        llm_results = {}
+        if config.settings.LLM_COMBINED_ANALYSIS and combined_analyzer:
+            try:
+                llm_results = await combined_analyzer.analyze_all(full_content, callbacks=callbacks_list)
+            except Exception as e:
+                logger.error(f"合并分析出错，改为分别调用各项分析: {e}")
+            if llm_results:
+                update_progress(None, f"合并分析完成 {len(llm_results)}/{len(task_factories)} 项。")
+        tasks = {key: factory() for key, factory in task_factories.items() if key not in llm_results}
         results = await asyncio.gather(*tasks.values(), return_exceptions=True)
         for key, value in zip(tasks.keys(), results):
             if isinstance(value, Exception):
                 logger.error(f"{key} 分析任务出错: {value}")
-                analysis_results[key] = None # 或者记录错误信息 str(value)
+                llm_results[key] = None # 或者记录错误信息 str(value)
             else:
-                analysis_results[key] = value
-        record_stage(current_stage_name_llm, start_time_llm_analysis, datetime.datetime.now())
-        update_progress(70, "步骤 4/7：LLM初步分析完成。")
-    except Exception as e:
-        logger.error(f"LLM初步分析阶段出错: {e}")
-        stage_status[current_stage_name_llm] = "失败"
-        record_stage(current_stage_name_llm, start_time_llm_analysis, datetime.datetime.now())
-        update_progress(70, "步骤 4/7：LLM初步分析失败。")
-
-
-    # 3.5 问答生成 - 再为每个问题生成答案（单独并发） (现在是步骤 5/7)
-    update_progress(75, "步骤 5/7：为每个问题生成答案...")
-    start_time_qa_answers = datetime.datetime.now()
-    current_stage_name_qa_answers = "问答对生成"
-    questions = analysis_results.get("questions") or []
-    if questions:
+                llm_results[key] = value
+        for key, value in llm_results.items():
+            finish_stream(key, value)
+        failed_sections = [
+            key for key, value in llm_results.items()
+            if value is None or (isinstance(value, str) and value.startswith("错误："))
+        ]
+        if failed_sections:
+            # 有分析项出错时记为部分失败，恢复运行时重新执行（已成功的分析项命中缓存）
+            update_progress(None, f"LLM初步分析完成，{len(failed_sections)} 项出错: {', '.join(failed_sections)}")
+            return StageOutcome(llm_results, PARTIAL_STATUS)
+        update_progress(None, "LLM初步分析完成。")
+        return llm_results
+
+    # 3.5 问答生成 - 为每个问题生成答案
+    async def stage_qa_pairs(inputs):
+        questions = (inputs["llm_analysis"] or {}).get("questions") or []
+        if not questions:
+            return StageOutcome([], "跳过 (无问题)")
+        update_progress(None, "为每个问题生成答案...")
         try:
             qa_pairs = await qa_generator.generate_answers_batch(
                 questions,
-                full_content,
+                build_full_content(inputs),
                 callbacks=callbacks_list
             )
-            analysis_results["qa_pairs"] = qa_pairs
-            record_stage(current_stage_name_qa_answers, start_time_qa_answers, datetime.datetime.now())
+            update_progress(None, "问答生成完成。")
+            return qa_pairs
         except Exception as e:
             logger.error(f"批量生成答案失败: {e}")
-            analysis_results["qa_pairs"] = [{"question": q, "answer": "生成答案时出错"} for q in questions]
-            stage_status[current_stage_name_qa_answers] = "失败"
-            record_stage(current_stage_name_qa_answers, start_time_qa_answers, datetime.datetime.now())
-    else:
-        qa_pairs = []
-        analysis_results["qa_pairs"] = qa_pairs
-        stage_status[current_stage_name_qa_answers] = "跳过 (无问题)"
-        record_stage(current_stage_name_qa_answers, start_time_qa_answers, datetime.datetime.now())
-    update_progress(80, "步骤 5/6：问答生成完成。")
-
-    # 3.6 (可选) 获取参考文献和相关文章 (现在是步骤 6/7)
-    s2_paper_id = s2_info.get("paperId") if s2_info else None
-    pubmed_pmid = pubmed_info.get("pmid") if pubmed_info else None
-
-    # 获取参考文献
-    update_progress(82, "步骤 6/7：获取参考文献...") # 调整进度百分比
-    start_time_references = datetime.datetime.now()
-    current_stage_name_references = "参考文献获取"
-    references_data = {
-        "source_paper_id": "N/A",
-        "reference_dois": [],
-        "full_references_details": [],
-        "error": "未尝试获取参考文献。"
-    }
-    if s2_paper_id:
+            return StageOutcome([{"question": q, "answer": "生成答案时出错"} for q in questions], "失败")
+
+    # 3.6 获取参考文献（仅依赖元数据）
+    async def stage_references(inputs):
+        s2_info = (inputs["metadata"] or {}).get("s2_info")
+        s2_paper_id = s2_info.get("paperId") if s2_info else None
+        references_data = {
+            "source_paper_id": "N/A",
+            "reference_dois": [],
+            "full_references_details": [],
+            "error": "未尝试获取参考文献。"
+        }
+        if not s2_paper_id:
+            logger.warning("跳过获取参考文献，因为主要文章的 Semantic Scholar paperId 未找到或无效。")
+            references_data["error"] = "主要文章的 Semantic Scholar paperId 未找到或无效。"
+            update_progress(None, "跳过获取参考文献。")
+            return StageOutcome(references_data, "跳过 (无S2PaperID)")
+        update_progress(None, "获取参考文献...")
         try:
             references_data = await metadata_fetcher.fetch_references(s2_paper_id, ncbi_email)
-            analysis_results["references_data"] = references_data
-            record_stage(current_stage_name_references, start_time_references, datetime.datetime.now())
-            update_progress(85, f"步骤 6/7：获取了 {len(references_data.get('full_references_details', []))} 条参考文献。") # 调整进度
+            update_progress(None, f"获取了 {len(references_data.get('full_references_details', []))} 条参考文献。")
+            return references_data
         except Exception as e:
             logger.error(f"获取参考文献失败: {e}")
             references_data["error"] = str(e)
-            analysis_results["references_data"] = references_data
-            stage_status[current_stage_name_references] = "失败"
-            record_stage(current_stage_name_references, start_time_references, datetime.datetime.now())
-            update_progress(85, "步骤 6/7：获取参考文献失败。") # 调整进度
-    else:
-        logger.warning("跳过获取参考文献，因为主要文章的 Semantic Scholar paperId 未找到或无效。")
-        references_data["error"] = "主要文章的 Semantic Scholar paperId 未找到或无效。"
-        analysis_results["references_data"] = references_data
-        stage_status[current_stage_name_references] = "跳过 (无S2PaperID)"
-        record_stage(current_stage_name_references, start_time_references, datetime.datetime.now())
-        update_progress(85, "步骤 6/7：跳过获取参考文献。") # 调整进度
-
-
-    # 获取相关文章
-    update_progress(87, "步骤 6/7：获取相关文章...") # 调整进度
-    start_time_related_articles = datetime.datetime.now()
-    current_stage_name_related = "相关文章获取"
-    related_articles_pubmed = []
-    if pubmed_pmid:
+            update_progress(None, "获取参考文献失败。")
+            return StageOutcome(references_data, "失败")
+
+    # 3.7 获取相关文章（仅依赖元数据）
+    async def stage_related_articles(inputs):
+        pubmed_info = (inputs["metadata"] or {}).get("pubmed_info")
+        pubmed_pmid = pubmed_info.get("pmid") if pubmed_info else None
+        if not pubmed_pmid:
+            logger.warning("跳过获取相关文章，因为主要文章的 PubMed PMID 未找到或无效。")
+            update_progress(None, "跳过获取相关文章。")
+            return StageOutcome([], "跳过 (无PMID)")
+        update_progress(None, "获取相关文章...")
         try:
             related_articles_pubmed = await metadata_fetcher.fetch_related_articles(pubmed_pmid, ncbi_email)
-            analysis_results["related_articles_pubmed"] = related_articles_pubmed
-            record_stage(current_stage_name_related, start_time_related_articles, datetime.datetime.now())
-            update_progress(90, f"步骤 6/7：获取了 {len(related_articles_pubmed)} 篇PubMed相关文章。") # 调整进度
+            update_progress(None, f"获取了 {len(related_articles_pubmed)} 篇PubMed相关文章。")
+            return related_articles_pubmed
         except Exception as e:
             logger.error(f"获取相关文章失败: {e}")
-            analysis_results["related_articles_pubmed"] = []
-            stage_status[current_stage_name_related] = "失败"
-            record_stage(current_stage_name_related, start_time_related_articles, datetime.datetime.now())
-            update_progress(90, "步骤 6/7：获取相关文章失败。") # 调整进度
-    else:
-        logger.warning("跳过获取相关文章，因为主要文章的 PubMed PMID 未找到或无效。")
-        analysis_results["related_articles_pubmed"] = []
-        stage_status[current_stage_name_related] = "跳过 (无PMID)"
-        record_stage(current_stage_name_related, start_time_related_articles, datetime.datetime.now())
-        update_progress(90, "步骤 6/7：跳过获取相关文章。") # 调整进度
-
-    # 3.7 新增：深度文献分析 (现在是步骤 7/7)
-    update_progress(92, "步骤 7/7：执行深度文献分析...")
-    start_time_deep_analysis = datetime.datetime.now()
-    current_stage_name_deep_analysis = "深度文献分析"
+            update_progress(None, "获取相关文章失败。")
+            return StageOutcome([], "失败")
+
+    # 3.8 深度文献分析
+    async def stage_deep_analysis(inputs):
+        update_progress(None, "执行深度文献分析...")
+        try:
+            deep_analysis_result = await deep_analyzer.analyze_deeply(
+                content=inputs.get("content_digest") or inputs["pdf_content"] or "",
+                image_analysis=format_image_analysis_md(inputs["image_analysis"], inputs["image_paths"]),
+                references_summary=format_references_summary(inputs["references_data"]),
+                related_articles_summary=format_related_articles_summary(inputs["related_articles_pubmed"]),
+                callbacks=callbacks_list,
+                **section_stream("deep_analysis")
+            )
+            finish_stream("deep_analysis", deep_analysis_result)
+            update_progress(None, "深度文献分析完成。")
+            return deep_analysis_result
+        except Exception as e:
+            logger.error(f"深度文献分析失败: {e}")
+            update_progress(None, "深度文献分析失败。")
+            return StageOutcome(f"错误：深度文献分析失败 ({e})", "失败")
+
+    stages = [
+        PipelineStage("pdf_content", stage_pdf_content, [], "PDF内容解析"),
+        PipelineStage("image_paths", stage_image_paths, [] if use_embedded_images else ["pdf_content"]),
+        PipelineStage("image_analysis", stage_image_analysis,
+                      ["image_paths"] if use_embedded_images else ["image_paths", "pdf_content"], "图片内容分析",
+                      early_inputs=["pdf_content"] if use_embedded_images else []),
+        PipelineStage("metadata", stage_metadata, [], "元数据获取"),
+        PipelineStage("llm_analysis", stage_llm_analysis, llm_analysis_inputs, "LLM初步分析",
+                      early_inputs=llm_analysis_early_inputs),
+        PipelineStage("qa_pairs", stage_qa_pairs, ["llm_analysis"] + llm_analysis_inputs, "问答对生成",
+                      early_inputs=llm_analysis_early_inputs),
+        PipelineStage("references_data", stage_references, ["metadata"], "参考文献获取"),
+        PipelineStage("related_articles_pubmed", stage_related_articles, ["metadata"], "相关文章获取"),
+        PipelineStage(
+            "deep_analysis", stage_deep_analysis,
+            ["pdf_content", "image_paths", "image_analysis", "references_data", "related_articles_pubmed"]
+            + (["content_digest"] if use_map_reduce else []),
+            "深度文献分析"
+        ),
+    ]
+    if use_map_reduce:
+        stages.append(PipelineStage("content_digest", stage_content_digest, ["pdf_content"], "长文献分段要点提取"))
+
+    # 允许以部分图片的分析结果提前启动时，图片分析改为提前依赖
+    if config.settings.IMAGE_ANALYSIS_READY_FRACTION < 1:
+        for stage in stages:
+            if "image_analysis" in stage.inputs:
+                stage.inputs = [dep for dep in stage.inputs if dep != "image_analysis"]
+                stage.early_inputs = stage.early_inputs + ["image_analysis"]
+
+    progress_state = {"percentage": 5}
+
+    def on_stage_done(stage, status, done, total):
+        progress_state["percentage"] = 5 + int(90 * done / total)
+        if stage.display_name:
+            update_progress(None, f"阶段完成 ({done}/{total})：{stage.display_name} - {status}")
+
+    def update_progress(percentage, text: str):
+        # 阶段并发执行，进度按已完成阶段数计算
+        percentage = progress_state["percentage"] if percentage is None else percentage
+        if progress_callback:
+            progress_callback(percentage, text)
+        logger.info(f"进度更新: {percentage}% - {text}")
+
+    checkpoint = await _open_paper_checkpoint(pdf_path, article_doi)
+    if resume and checkpoint is None:
+        logger.warning("无法读取检查点，本次将完整执行全部阶段。")
+    scheduler = StageScheduler(stages, on_stage_done=on_stage_done, checkpoint=checkpoint, resume=resume)
+    try:
+        outputs = await scheduler.run()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    llm_results = outputs["llm_analysis"] or {}
+    analysis_results = {
+        "pdf_markdown_content_length": len(outputs["pdf_content"] or ""),
+        "image_paths": outputs["image_paths"] or [],
+        "image_analysis": outputs["image_analysis"] or [],
+        "image_analysis_stats": summarize_image_analysis(outputs["image_analysis"] or []),
+        "metadata": outputs["metadata"] or {"pubmed_info": None, "s2_info": None},
+        "methodology_analysis": llm_results.get("methodology_analysis"),
+        "innovation_extraction": llm_results.get("innovation_extraction"),
+        "questions": llm_results.get("questions"),
+        "story": llm_results.get("story"),
+        "mindmap": llm_results.get("mindmap"),
+        "qa_pairs": outputs["qa_pairs"] or [],
+        "references_data": outputs["references_data"],
+        "related_articles_pubmed": outputs["related_articles_pubmed"] or [],
+        "deep_analysis": outputs["deep_analysis"],
+    }
+    stage_times = scheduler.stage_times
+    stage_status = scheduler.stage_status
+    stage_costs = scheduler.stage_costs
+    critical_path, _ = scheduler.critical_path()
+
+    update_progress(100, "所有处理步骤完成。")
+    token_callback_handler.log_total_usage()
     
-    # 准备参考文献和相关文献的摘要信息
+    # 在 process_article_pipeline 函数的末尾，返回之前
+    logger.info(f"最终返回的阶段时间信息 (stage_times): {stage_times}")
+    logger.info(f"最终返回的阶段状态信息 (stage_status): {stage_status}")
+    logger.info(f"最终返回的阶段耗时信息 (stage_costs): {stage_costs}")
+    
+    # 返回分析结果和阶段时间信息
+    return {
+        "analysis_results": analysis_results,
+        "stage_times": stage_times,
+        "stage_status": stage_status,
+        "stage_costs": stage_costs,
+        "critical_path": critical_path,
+        "total_token_usage": token_callback_handler.get_total_usage_and_cost()
+    }
+
+def format_image_analysis_md(image_analysis, image_paths):
+    """将图片内容分析结果格式化为Markdown字符串，供LLM分析用。"""
+    if not image_analysis or not isinstance(image_analysis, list):
+        return "无图片内容分析结果。"
+    lines = []
+    # 被相关性筛选跳过的图片没有描述，不提供给LLM
+    for idx, img in enumerate(img for img in image_analysis if not img.get("skipped")):
+        img_path = img.get("image_path", "")
+        desc = img.get("description", "")
+        rel_img_path = img_path
+        if image_paths:
+            for p in image_paths:
+                if p in img_path or Path(img_path).name == Path(p).name:
+                    rel_img_path = p
+                    break
+        lines.append(f"图片{idx+1}: {rel_img_path}\\n结构化描述: {desc}\\n")
+    return "\\n".join(lines)
+
+def format_references_summary(references_data) -> str:
+    """准备参考文献的摘要信息，供深度分析使用。"""
     references_summary_str = "无参考文献信息。"
-    if analysis_results.get("references_data", {}).get("full_references_details"):
+    if (references_data or {}).get("full_references_details"):
         refs_list = []
-        for idx, ref in enumerate(analysis_results["references_data"]["full_references_details"][:10]): # 最多取前10条以控制长度
+        for idx, ref in enumerate(references_data["full_references_details"][:10]): # 最多取前10条以控制长度
             title = ref.get('title', 'N/A')
             authors = ref.get('authors_str', 'N/A') # 使用原始的 authors_str
             year = ref.get('pub_date', 'N/A').split('-')[0] if ref.get('pub_date') else 'N/A'
@@ -424,11 +678,14 @@ async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email:
             identifier = f"DOI: {doi}" if doi else (f"PMID: {pmid_ref}" if pmid_ref else "")
             refs_list.append(f"[{idx+1}] {authors} ({year}). {title}. {journal}. {identifier}".strip())
         references_summary_str = "\n".join(refs_list) if refs_list else "无有效参考文献摘要信息。"
+    return references_summary_str
 
+def format_related_articles_summary(related_articles) -> str:
+    """准备相关文献的摘要信息，供深度分析使用。"""
     related_articles_summary_str = "无相关文献信息。"
-    if analysis_results.get("related_articles_pubmed"):
+    if related_articles:
         related_list = []
-        for rel_art in analysis_results["related_articles_pubmed"][:5]: # 最多取前5条
+        for rel_art in related_articles[:5]: # 最多取前5条
             title = rel_art.get('title', 'N/A')
             authors = rel_art.get('authors_str', 'N/A') # 使用原始的 authors_str
             year = rel_art.get('pub_date', 'N/A').split('-')[0] if rel_art.get('pub_date') else 'N/A'
@@ -438,41 +695,7 @@ async def process_article_pipeline(pdf_path: str, article_doi: str, ncbi_email:
             identifier = f"DOI: {doi}" if doi else (f"PMID: {pmid_rel}" if pmid_rel else "")
             related_list.append(f"- {authors} ({year}). {title}. {journal}. {identifier}".strip())
         related_articles_summary_str = "\n".join(related_list) if related_list else "无有效相关文献摘要信息。"
-        
-    try:
-        deep_analysis_result = await deep_analyzer.analyze_deeply(
-            content=full_content, # 使用包含图片分析的 full_content
-            image_analysis="", # image_analysis 已包含在 full_content 中，此处可传空或不传，取决于Agent设计
-            references_summary=references_summary_str,
-            related_articles_summary=related_articles_summary_str,
-            callbacks=callbacks_list
-        )
-        analysis_results["deep_analysis"] = deep_analysis_result
-        record_stage(current_stage_name_deep_analysis, start_time_deep_analysis, datetime.datetime.now())
-        update_progress(98, "步骤 7/7：深度文献分析完成。")
-    except Exception as e:
-        logger.error(f"深度文献分析失败: {e}")
-        analysis_results["deep_analysis"] = f"错误：深度文献分析失败 ({e})"
-        stage_status[current_stage_name_deep_analysis] = "失败"
-        record_stage(current_stage_name_deep_analysis, start_time_deep_analysis, datetime.datetime.now())
-        update_progress(98, "步骤 7/7：深度文献分析失败。")
-
-    update_progress(100, "所有处理步骤完成。")
-    token_callback_handler.log_total_usage()
-    
-    # 在 process_article_pipeline 函数的末尾，返回之前
-    logger.info(f"最终返回的阶段时间信息 (stage_times): {stage_times}")
-    logger.info(f"最终返回的阶段状态信息 (stage_status): {stage_status}")
-    logger.info(f"最终返回的阶段耗时信息 (stage_costs): {stage_costs}")
-    
-    # 返回分析结果和阶段时间信息
-    return {
-        "analysis_results": analysis_results,
-        "stage_times": stage_times,
-        "stage_status": stage_status,
-        "stage_costs": stage_costs,
-        "total_token_usage": token_callback_handler.get_total_usage_and_cost()
-    }
+    return related_articles_summary_str
 
 def save_csv_report(data: list, filepath: Path, fieldnames: list):
     """Saves data to a CSV file with enhanced error handling and data validation."""
@@ -511,6 +734,7 @@ def save_report(results: dict, pdf_path: str):
     from slais.utils.logging_utils import logger
     from slais import config
     from agents.formatting_utils import generate_enhanced_report
+    from slais.pdf_utils import paper_output_dir
     
     if not results:
         logger.warning("没有结果可保存。")
@@ -519,7 +743,7 @@ def save_report(results: dict, pdf_path: str):
     pdf_filename_stem = Path(pdf_path).stem
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    output_subdir = Path(config.settings.OUTPUT_BASE_DIR) / pdf_filename_stem
+    output_subdir = paper_output_dir(pdf_path)
     output_subdir.mkdir(parents=True, exist_ok=True)
     
     # 定义统一的CSV列名，确保信息全面且一致
@@ -586,12 +810,166 @@ def run_web_app():
     from web.web_app import run_slais_web
     run_slais_web()
 
+# 流式输出的各部分名称（CLI与Web界面共用）
+STREAM_SECTION_TITLES = {
+    "methodology_analysis": "研究方法分析",
+    "innovation_extraction": "创新点与应用前景",
+    "story": "文献故事",
+    "mindmap": "脑图",
+    "deep_analysis": "深度文献分析",
+}
+
+class ConsoleStreamPrinter:
+    """
+    CLI 的流式输出回调 (--stream)：一次只实时打印一个部分，
+    同时生成的其他部分先缓存，当前部分完成后按开始输出的顺序接着打印，避免多个部分的输出交错。
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.order = []       # 各部分开始输出的顺序
+        self.texts = {}       # 各部分截至目前的文本
+        self.finished = set()
+        self.shown = set()    # 已完整打印的部分
+        self.active = None
+        self.printed = ""     # 当前部分已打印的文本
+
+    def __call__(self, section: str, text: str, finished: bool = False):
+        if section not in self.texts:
+            self.order.append(section)
+        self.texts[section] = text
+        if finished:
+            self.finished.add(section)
+        if self.active is None:
+            self._advance()
+        elif section == self.active:
+            self._flush()
+
+    def _advance(self):
+        for section in self.order:
+            if section not in self.shown:
+                self.active = section
+                self.printed = ""
+                self.stream.write(f"\n===== {STREAM_SECTION_TITLES.get(section, section)} =====\n")
+                self._flush()
+                return
+
+    def _flush(self):
+        text = self.texts[self.active]
+        # 完成时的最终结果可能经过格式化（如脑图），与已打印内容不连续时不再重复打印
+        if text.startswith(self.printed):
+            self.stream.write(text[len(self.printed):])
+            self.printed = text
+        if self.active in self.finished:
+            self.stream.write("\n")
+            self.shown.add(self.active)
+            self.active = None
+            self._advance()
+        self.stream.flush()
+
+async def run_batch(jobs: list, ncbi_email: str, max_concurrent_papers: int = None, resume: bool = False):
+    """
+    在同一个事件循环内批量处理多篇文献。
+    所有文献共享一组LLM客户端和智能体（以及进程内已加载的MinerU模型），
+    同时处理的文献数量由 max_concurrent_papers 控制。
+
+    Args:
+        jobs (list): [{"pdf_path": ..., "doi": ...}, ...]
+        ncbi_email (str): NCBI邮箱。
+        max_concurrent_papers (int, optional): 同时处理的文献数，默认使用 BATCH_MAX_CONCURRENT_PAPERS。
+        resume (bool): 为 True 时每篇文献从其检查点继续，已完成的阶段不再执行。
+
+    Returns:
+        dict: 批次汇总信息（吞吐量、失败列表、Token花费）。
+    """
+    from slais.utils.logging_utils import logger
+    from slais import config
+    from slais.batch import summarize_batch
+    from agents.llm_scheduler import get_scheduler
+
+    max_concurrent_papers = max_concurrent_papers or config.settings.BATCH_MAX_CONCURRENT_PAPERS
+    logger.info(f"开始批处理，共 {len(jobs)} 篇文献，最大并发文献数: {max_concurrent_papers}")
+
+    agents = build_pipeline_agents()
+    if agents is None:
+        logger.error("LLM客户端初始化失败，批处理中止。")
+        return None
+
+    semaphore = asyncio.Semaphore(max_concurrent_papers)
+    batch_start = datetime.datetime.now()
+
+    async def process_one(index: int, job: dict) -> dict:
+        pdf_path = job["pdf_path"]
+        record = {"pdf_path": pdf_path, "doi": job.get("doi", ""), "status": "失败"}
+        async with semaphore:
+            paper_start = datetime.datetime.now()
+            logger.info(f"[批处理 {index + 1}/{len(jobs)}] 开始处理: {pdf_path}")
+            try:
+                if not Path(pdf_path).exists():
+                    raise FileNotFoundError(f"PDF文件不存在: {pdf_path}")
+                results = await process_article_pipeline(
+                    pdf_path=pdf_path,
+                    article_doi=job.get("doi") or None,
+                    ncbi_email=ncbi_email,
+                    agents=agents,
+                    resume=resume
+                )
+                if not results:
+                    raise RuntimeError("文章处理流程未能生成有效结果。")
+                save_report(results, pdf_path)
+                record["status"] = "成功"
+                record["total_token_usage"] = results.get("total_token_usage")
+                record["image_analysis_stats"] = results["analysis_results"].get("image_analysis_stats")
+            except Exception as e:
+                logger.error(f"[批处理 {index + 1}/{len(jobs)}] 处理 {pdf_path} 失败: {e}")
+                record["error"] = str(e)
+            record["elapsed_seconds"] = (datetime.datetime.now() - paper_start).total_seconds()
+            logger.info(
+                f"[批处理 {index + 1}/{len(jobs)}] {record['status']}: {pdf_path}，"
+                f"耗时 {record['elapsed_seconds']:.1f} 秒"
+            )
+        return record
+
+    records = await asyncio.gather(*(process_one(i, job) for i, job in enumerate(jobs)))
+    elapsed = (datetime.datetime.now() - batch_start).total_seconds()
+    summary = summarize_batch(list(records), elapsed)
+    summary["papers"] = list(records)
+    summary["llm_scheduler"] = get_scheduler().metrics()
+
+    logger.info(
+        f"批处理完成: 成功 {summary['papers_succeeded']}/{summary['papers_total']}，"
+        f"失败 {summary['papers_failed']}，总耗时 {elapsed:.1f} 秒，"
+        f"吞吐量 {summary['papers_per_hour']:.2f} 篇/小时，"
+        f"总Token {summary['token_usage']['total_tokens']}"
+        f"（提示词前缀缓存命中 {summary['token_usage']['total_cached_prompt_tokens']}），"
+        f"估算总成本 ￥{summary['token_usage']['total_cost']:.6f}，"
+        f"图片分析缓存命中 {summary['image_cache']['hits']} 张/未命中 {summary['image_cache']['misses']} 张"
+    )
+    get_scheduler().log_metrics()
+    for failure in summary["failures"]:
+        logger.warning(f"失败文献: {failure['pdf_path']} - {failure['error']}")
+
+    summary_path = Path(config.settings.OUTPUT_BASE_DIR) / f"batch_summary_{batch_start.strftime('%Y%m%d_%H%M%S')}.json"
+    try:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"批处理汇总已保存到: {summary_path}")
+    except Exception as e:
+        logger.error(f"保存批处理汇总失败: {e}")
+    return summary
+
 async def main_async():
     """
     异步主函数，协调整个流程。
     """
     parser = argparse.ArgumentParser(description="PDF文献智能分析与洞察系统 (SLAIS)")
     parser.add_argument("--pdf", type=str, help="要分析的PDF文件路径。")
+    parser.add_argument("--pdf-dir", type=str, help="批处理模式：处理目录下的所有PDF文件（DOI从PDF中自动识别）。")
+    parser.add_argument("--manifest", type=str, help="批处理模式：CSV或JSONL清单文件，每条包含 pdf_path 和 doi。")
+    parser.add_argument("--concurrency", type=int, help="批处理模式下同时处理的文献数。")
+    parser.add_argument("--resume", action="store_true", help="从检查点继续：跳过该文献已完成的阶段，只执行缺失或失败的阶段。")
+    parser.add_argument("--stream", action="store_true", help="单篇模式下在终端实时输出各项分析的生成内容。")
+    parser.add_argument("--serve-converter", action="store_true", help="启动常驻的本地PDF转换服务（预加载MinerU模型）。")
     parser.add_argument("--web", action="store_true", help="以Web界面模式运行（Streamlit）")
     args = parser.parse_args()
 
@@ -600,9 +978,31 @@ async def main_async():
         run_web_app()
         return
 
+    ncbi_email_for_requests = config.settings.NCBI_EMAIL
+    if not ncbi_email_for_requests or ncbi_email_for_requests == "your@gmail.com":
+        logger.warning("NCBI_EMAIL 未在配置中正确设置或仍为默认值。PubMed API请求可能会受限或失败。")
+        # 可以选择在这里中止，或者允许继续但带有警告
+
+    if args.manifest or args.pdf_dir:
+        from slais.batch import load_manifest, collect_pdf_dir
+        if args.manifest:
+            if not Path(args.manifest).exists():
+                logger.error(f"指定的清单文件不存在: {args.manifest}")
+                return
+            jobs = load_manifest(args.manifest)
+        else:
+            if not Path(args.pdf_dir).is_dir():
+                logger.error(f"指定的PDF目录不存在: {args.pdf_dir}")
+                return
+            jobs = collect_pdf_dir(args.pdf_dir)
+        if not jobs:
+            logger.error("批处理清单为空，没有需要处理的文献。")
+            return
+        await run_batch(jobs, ncbi_email_for_requests, args.concurrency, resume=args.resume)
+        return
+
     pdf_to_process = args.pdf if args.pdf else config.settings.DEFAULT_PDF_PATH
     article_doi_to_process = config.settings.ARTICLE_DOI
-    ncbi_email_for_requests = config.settings.NCBI_EMAIL
 
     if not pdf_to_process or not Path(pdf_to_process).exists(): # Added check for pdf_to_process being None/empty
         logger.error(f"指定的PDF文件不存在或未提供: {pdf_to_process}")
@@ -612,17 +1012,18 @@ async def main_async():
     if not article_doi_to_process:
         logger.error("ARTICLE_DOI 未在配置中设置。请在 .env 文件中配置。")
         return
-        
-    if not ncbi_email_for_requests or ncbi_email_for_requests == "your@gmail.com":
-        logger.warning("NCBI_EMAIL 未在配置中正确设置或仍为默认值。PubMed API请求可能会受限或失败。")
-        # 可以选择在这里中止，或者允许继续但带有警告
 
     final_results = await process_article_pipeline(
         pdf_path=pdf_to_process,
         article_doi=article_doi_to_process,
-        ncbi_email=ncbi_email_for_requests
+        ncbi_email=ncbi_email_for_requests,
+        resume=args.resume,
+        stream_callback=ConsoleStreamPrinter() if args.stream else None
     )
 
+    from agents.llm_scheduler import get_scheduler
+    get_scheduler().log_metrics()
+
     if final_results:
         save_report(final_results, pdf_to_process)
     else:
@@ -667,14 +1068,25 @@ if __name__ == "__main__":
 使用示例:
   python app.py                           # 启动Web界面模式 (Streamlit)
   python app.py --pdf path/to/file.pdf    # CLI模式处理指定PDF文件
+  python app.py --pdf-dir pdfs/ --concurrency 4   # 批处理目录下所有PDF
+  python app.py --manifest papers.csv     # 按清单批处理 (CSV/JSONL: pdf_path, doi)
+  python app.py --manifest papers.csv --resume   # 中断后继续，已完成的阶段不再执行
+  python app.py --pdf path/to/file.pdf --stream  # 在终端实时输出各项分析的生成内容
+  python app.py --serve-converter         # 启动常驻PDF转换服务，之后的运行自动使用它
   python app.py --web                     # 显式启动Web界面模式
   python app.py --help                    # 显示此帮助信息
 
-注意: CLI模式需要在 .env 文件中配置 ARTICLE_DOI 和 NCBI_EMAIL
+注意: 单篇CLI模式需要在 .env 文件中配置 ARTICLE_DOI 和 NCBI_EMAIL
             """,
             formatter_class=argparse.RawDescriptionHelpFormatter
         )
         temp_parser.add_argument("--pdf", type=str, help="要分析的PDF文件路径 (CLI模式)")
+        temp_parser.add_argument("--pdf-dir", type=str, help="批处理目录下的所有PDF文件 (CLI批处理模式)")
+        temp_parser.add_argument("--manifest", type=str, help="CSV或JSONL清单文件，包含 pdf_path 和 doi (CLI批处理模式)")
+        temp_parser.add_argument("--concurrency", type=int, help="批处理模式下同时处理的文献数")
+        temp_parser.add_argument("--resume", action="store_true", help="从检查点继续，只执行缺失或失败的阶段")
+        temp_parser.add_argument("--stream", action="store_true", help="在终端实时输出各项分析的生成内容 (单篇CLI模式)")
+        temp_parser.add_argument("--serve-converter", action="store_true", help="启动常驻的本地PDF转换服务，预加载MinerU模型")
         temp_parser.add_argument("--web", action="store_true", help="以Web界面模式运行 (Streamlit)")
         
         # 预解析参数 - 这会处理帮助和捕获无效参数
@@ -691,10 +1103,19 @@ if __name__ == "__main__":
         sys.exit(e.code)
     
     # 判断运行模式
-    if args.pdf:
+    if args.serve_converter:
+        # 常驻PDF转换服务模式
+        logger.info("检测到PDF转换服务模式。")
+        from slais.converter_service import run_converter_service
+        run_converter_service()
+    elif args.pdf:
         # CLI PDF 处理模式
         logger.info("检测到CLI PDF处理模式。")
         asyncio.run(main_async())
+    elif args.pdf_dir or args.manifest:
+        # CLI 批处理模式
+        logger.info("检测到CLI批处理模式。")
+        asyncio.run(main_async())
     elif args.web:
         # 显式Web模式
         logger.info("显式请求Web界面模式。")
@@ -0,0 +1,151 @@
+import csv
+import json
+import re
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from slais.utils.logging_utils import logger
+from slais import config
+
+# DOI 正则：参考 Crossref 推荐的匹配规则
+DOI_PATTERN = re.compile(r'\b(10\.\d{4,9}/[^\s"<>]+)', re.IGNORECASE)
+
+
+def extract_doi_from_pdf(pdf_path: str, max_pages: Optional[int] = None) -> Optional[str]:
+    """
+    扫描PDF前几页的文本，尝试提取文章DOI。
+
+    Args:
+        pdf_path: PDF文件路径
+        max_pages: 最多扫描的页数，默认使用 config.MAX_PAGES_TO_SCAN_FOR_DOI
+
+    Returns:
+        找到的DOI字符串，未找到时返回None
+    """
+    import fitz  # PyMuPDF
+
+    max_pages = max_pages or config.settings.MAX_PAGES_TO_SCAN_FOR_DOI
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page_idx in range(min(max_pages, doc.page_count)):
+                text = doc[page_idx].get_text()
+                match = DOI_PATTERN.search(text)
+                if match:
+                    # 去掉DOI末尾常见的标点
+                    return match.group(1).rstrip('.,;)]')
+    except Exception as e:
+        logger.warning(f"从PDF {pdf_path} 提取DOI失败: {e}")
+    return None
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, str]]:
+    """
+    读取批处理清单文件（CSV 或 JSONL）。
+
+    CSV 需包含 pdf_path 列，可选 doi 列；JSONL 每行是一个包含 pdf_path 和可选 doi 的对象。
+    相对路径以清单文件所在目录为基准解析。
+
+    Returns:
+        [{"pdf_path": ..., "doi": ...}, ...]
+    """
+    manifest = Path(manifest_path)
+    base_dir = manifest.parent
+    entries = []
+
+    if manifest.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(manifest, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    logger.warning(f"清单第 {line_no} 行不是有效的JSON，已跳过: {e}")
+    else:
+        with open(manifest, 'r', encoding='utf-8-sig', newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    jobs = []
+    for entry in entries:
+        pdf_path = (entry.get("pdf_path") or entry.get("pdf") or "").strip()
+        if not pdf_path:
+            logger.warning(f"清单条目缺少 pdf_path，已跳过: {entry}")
+            continue
+        if not Path(pdf_path).is_absolute():
+            pdf_path = str(base_dir / pdf_path)
+        jobs.append({
+            "pdf_path": pdf_path,
+            "doi": (entry.get("doi") or "").strip()
+        })
+    logger.info(f"从清单 {manifest_path} 读取到 {len(jobs)} 篇文献。")
+    return jobs
+
+
+def collect_pdf_dir(pdf_dir: str) -> List[Dict[str, str]]:
+    """
+    收集目录下的所有PDF文件，并尝试从每个PDF中提取DOI。
+
+    Returns:
+        [{"pdf_path": ..., "doi": ...}, ...]，未能提取DOI的条目 doi 为空字符串
+    """
+    jobs = []
+    for pdf_path in sorted(Path(pdf_dir).glob("*.pdf")):
+        doi = extract_doi_from_pdf(str(pdf_path)) or ""
+        if not doi:
+            logger.warning(f"未能从 {pdf_path.name} 中识别DOI，元数据相关阶段可能失败。")
+        jobs.append({"pdf_path": str(pdf_path), "doi": doi})
+    logger.info(f"在目录 {pdf_dir} 中找到 {len(jobs)} 个PDF文件。")
+    return jobs
+
+
+def summarize_batch(records: List[Dict[str, Any]], elapsed_seconds: float) -> Dict[str, Any]:
+    """
+    汇总一次批处理的吞吐量、失败情况和Token花费。
+
+    Args:
+        records: 每篇文献的处理记录，包含 pdf_path, doi, status ("成功"/"失败"),
+                 error (可选), elapsed_seconds, total_token_usage (可选), image_analysis_stats (可选)
+        elapsed_seconds: 整个批次的墙钟耗时
+
+    Returns:
+        批次汇总字典
+    """
+    succeeded = [r for r in records if r.get("status") == "成功"]
+    failed = [r for r in records if r.get("status") != "成功"]
+
+    token_totals = {
+        "total_prompt_tokens": 0,
+        "total_completion_tokens": 0,
+        "total_tokens": 0,
+        "total_cached_prompt_tokens": 0,
+        "total_cost": 0.0,
+        "cache_savings": 0.0,
+    }
+    for record in records:
+        usage = record.get("total_token_usage") or {}
+        for key in token_totals:
+            token_totals[key] += usage.get(key, 0) or 0
+
+    image_cache = {"hits": 0, "misses": 0}
+    for record in records:
+        image_stats = record.get("image_analysis_stats") or {}
+        image_cache["hits"] += image_stats.get("cache_hits", 0)
+        image_cache["misses"] += image_stats.get("cache_misses", 0)
+
+    hours = elapsed_seconds / 3600 if elapsed_seconds > 0 else 0
+    paper_durations = [r.get("elapsed_seconds", 0.0) for r in records]
+    return {
+        "papers_total": len(records),
+        "papers_succeeded": len(succeeded),
+        "papers_failed": len(failed),
+        "elapsed_seconds": elapsed_seconds,
+        "papers_per_hour": len(succeeded) / hours if hours else 0.0,
+        "avg_seconds_per_paper": sum(paper_durations) / len(paper_durations) if paper_durations else 0.0,
+        "token_usage": token_totals,
+        "image_cache": image_cache,
+        "failures": [
+            {"pdf_path": r.get("pdf_path"), "doi": r.get("doi"), "error": r.get("error", "")}
+            for r in failed
+        ],
+    }
@@ -3,7 +3,7 @@ import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
-from pydantic import Field
+from pydantic import Field, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import datetime
 
@@ -55,12 +55,39 @@ class Settings(BaseSettings):
     OPENAI_API_MODEL: str = Field("gpt-4", description="Model name for OpenAI or compatible API")
     OPENAI_API_BASE_URL: Optional[str] = Field("https://api.openai.com/v1", description="Base URL for OpenAI or compatible API (optional)")
     OPENAI_TEMPERATURE: float = Field(0.0, description="Temperature for OpenAI or compatible API")
+    LLM_MAX_CONCURRENCY: int = Field(8, ge=1, description="Maximum concurrent requests per text model across all papers")
+    LLM_RPM: int = Field(0, ge=0, description="Requests per minute limit per text model (0 for no limit)")
+    LLM_TPM: int = Field(0, ge=0, description="Prompt tokens per minute limit per text model, using pre-flight estimates (0 for no limit)")
+    LLM_MAX_RETRIES: int = Field(3, ge=0, description="Retries for rate-limited, timed-out or failed text LLM requests")
+    LLM_RETRY_BASE_DELAY: float = Field(2.0, gt=0, description="Base delay in seconds for text LLM retry backoff")
 
     # 图像 LLM 配置
     IMAGE_LLM_API_KEY: str = Field("", description="API key for Image LLM")
     IMAGE_LLM_API_MODEL: str = Field("qwen-vl-plus", description="Model name for Image LLM")
     IMAGE_LLM_API_BASE_URL: str = Field("", description="Base URL for Image LLM")
     IMAGE_LLM_TEMPERATURE: float = Field(0.1, description="Temperature for Image LLM")
+    IMAGE_LLM_MAX_CONCURRENCY: int = Field(4, ge=1, description="Maximum number of concurrent Image LLM requests")
+    IMAGE_LLM_RPM: int = Field(60, ge=0, description="Requests per minute limit for the Image LLM (0 for no limit)")
+    IMAGE_LLM_MAX_RETRIES: int = Field(3, ge=0, description="Retries for rate-limited, timed-out or failed Image LLM requests")
+    IMAGE_LLM_RETRY_BASE_DELAY: float = Field(2.0, gt=0, description="Base delay in seconds for Image LLM retry backoff")
+    IMAGE_LLM_REQUEST_TIMEOUT: float = Field(120.0, gt=0, description="Timeout in seconds for a single Image LLM request")
+    IMAGE_ANALYSIS_CACHE_ENABLED: bool = Field(True, description="Cache image analysis results by image content hash, model, temperature and prompt version")
+    IMAGE_UPLOAD_MAX_EDGE: int = Field(1568, ge=0, description="Maximum long edge in pixels of images sent to the Image LLM (0 to keep the original size)")
+    IMAGE_UPLOAD_FORMAT: str = Field("jpeg", description="Format images are re-encoded to before upload: jpeg, png, webp or original; 'original' only re-encodes when resizing or when the format is not accepted")
+    IMAGE_UPLOAD_QUALITY: int = Field(85, ge=1, le=100, description="JPEG/WebP quality used when re-encoding images for upload")
+    IMAGE_DEDUP_ENABLED: bool = Field(True, description="Analyze only one image per group of perceptual duplicates and reuse its description")
+    IMAGE_DEDUP_MAX_DISTANCE: int = Field(6, ge=0, le=64, description="Maximum aHash/pHash Hamming distance (of 64 bits) for two images to count as duplicates")
+    IMAGE_FILTER_MODE: str = Field("defer", description="Relevance filter for images before vision analysis: defer (analyze low-scoring images last), skip (do not analyze them) or off")
+    IMAGE_FILTER_MIN_SCORE: float = Field(0.5, ge=0.0, le=1.0, description="Relevance score (0-1) below which an image is skipped or deferred")
+    IMAGE_FILTER_MIN_SIZE: int = Field(100, ge=0, description="Short edge in pixels below which an image's size score drops")
+    IMAGE_FILTER_MAX_ASPECT: float = Field(8.0, ge=0.0, description="Aspect ratio above which an image's aspect score drops (rules, banners)")
+    IMAGE_FILTER_MIN_ENTROPY: float = Field(2.0, ge=0.0, description="Grayscale pixel entropy in bits below which an image's entropy score drops (blank or flat crops)")
+    IMAGE_CONTEXT_MAX_CHARS: int = Field(1500, ge=0, description="Maximum characters of caption-referencing and adjacent paragraphs attached to each image prompt")
+    IMAGE_CAPTION_ONLY_MIN_CHARS: int = Field(0, ge=0, description="Describe images whose caption has at least this many characters from the caption alone, without a vision call (0 to disable)")
+    IMAGE_PACK_SIZE: int = Field(1, ge=1, description="Maximum number of images packed into one vision request (1 disables packing)")
+    IMAGE_PACK_MAX_PIXELS: int = Field(4_000_000, ge=0, description="Maximum total uploaded pixels per packed vision request (0 for no limit)")
+    IMAGE_ANALYSIS_DEADLINE: float = Field(300.0, ge=0, description="Per-image time limit in seconds, including retries, after which the image is marked timed-out (0 for no limit)")
+    IMAGE_ANALYSIS_READY_FRACTION: float = Field(1.0, gt=0, le=1, description="Fraction of images that must be analyzed before downstream stages may start with the partial results")
 
     # NCBI Configuration
     NCBI_EMAIL: Optional[str] = Field(None, description="Email address for NCBI API requests")
@@ -105,6 +132,21 @@ class Settings(BaseSettings):
     OUTPUT_BASE_DIR: str = Field("output", description="Base directory for output files")
     PDF_IMAGES_SUBDIR: str = Field("images", description="Subdirectory for PDF images within output")
 
+    # PDF Conversion Configuration
+    PDF_CONVERSION_WORKERS: int = Field(1, ge=0, description="Number of long-lived worker processes for MinerU conversion (0 = convert in a thread of the main process)")
+    PDF_CONVERSION_TIMEOUT: int = Field(1800, ge=0, description="Timeout in seconds for a single PDF conversion job (0 = no timeout)")
+    PDF_CONVERSION_CACHE_ENABLED: bool = Field(True, description="Reuse conversion results keyed by PDF content hash, profile and conversion version")
+    PDF_PARALLEL_MIN_PAGES: int = Field(60, ge=0, description="PDFs with at least this many pages are split into page ranges converted in parallel (0 = never split; needs PDF_CONVERSION_WORKERS > 1)")
+    PDF_PAGES_PER_CHUNK: int = Field(20, ge=1, description="Pages per range when converting long PDFs in parallel")
+    PDF_STREAM_LEAD_PAGES: int = Field(0, ge=0, description="Convert the first N pages as a separate range so LLM analysis can start before the rest of the PDF is converted; only applied when those pages fill the LLM token budget (0 = disabled)")
+    PDF_IMAGE_SOURCE: str = Field("layout", description="Images for analysis: layout (figure crops from the MinerU conversion) or embedded (raster images exported directly with PyMuPDF, no model pass, does not wait for conversion)")
+    EMBEDDED_IMAGE_MIN_SIZE: int = Field(64, ge=0, description="Embedded images narrower or shorter than this many pixels are skipped")
+    PDF_CONVERSION_PROFILE: str = Field("standard", description="Conversion profile: fast (markdown and images only), standard (+ content list), debug (+ model/layout/span drawings and middle JSON)")
+    PDF_CONVERTER_HOST: str = Field("127.0.0.1", description="Host the conversion service (--serve-converter) listens on")
+    PDF_CONVERTER_PORT: int = Field(8765, description="Port the conversion service (--serve-converter) listens on")
+    PDF_CONVERTER_URL: str = Field("http://127.0.0.1:8765", description="URL of the conversion service used by PDFParsingAgent when reachable (empty = always convert locally)")
+    PDF_CONVERTER_HEALTH_TIMEOUT: float = Field(1.0, description="Timeout in seconds for the conversion service health check")
+
     # Cache Configuration
     CACHE_DIR: str = Field("cache", description="Directory for cache files")
     CACHE_EXPIRY_DAYS: int = Field(30, description="Cache expiry in days")
@@ -116,7 +158,21 @@ class Settings(BaseSettings):
     # Analysis Configuration
     MAX_PAGES_TO_SCAN_FOR_DOI: int = Field(5, description="Maximum pages to scan for DOI in PDF")
     MAX_QUESTIONS_TO_GENERATE: int = Field(int(os.getenv("MAX_QUESTIONS_TO_GENERATE", 30)), ge=1, description="Maximum number of Q&A pairs to generate")
-    MAX_CONTENT_CHARS_FOR_LLM: int = Field(15000, ge=1000, description="Maximum content characters to pass to LLM for analysis tasks")
+    QA_ANSWER_SHARD_SIZE: int = Field(6, ge=0, description="Questions answered per request; shards are requested in parallel (0 answers all questions in one request)")
+    QA_ANSWER_MAX_RETRIES: int = Field(2, ge=0, description="Rounds of re-asking only the questions whose answers were missing or unparseable")
+    MAX_CONTENT_CHARS_FOR_LLM: int = Field(15000, ge=1000, description="Content length (chars) above which LLM_MAP_REDUCE summarizes the paper chunk by chunk, and the size of that summary; the content sent to the LLM is otherwise fitted to the model context window by tokens")
+    LLM_CONTEXT_WINDOW: int = Field(0, ge=0, description="Context window of the analysis model in tokens; 0 looks it up from the model name")
+    LLM_OUTPUT_TOKEN_RESERVE: int = Field(4096, ge=0, description="Tokens of the context window reserved for the model's answer when fitting prompts")
+
+    LLM_ANALYSIS_WAIT_FOR_IMAGES: bool = Field(False, description="Whether the preliminary LLM analyses wait for image analysis and include its results in their input")
+    LLM_COMBINED_ANALYSIS: bool = Field(False, description="Run methodology, innovation, question, story and mindmap analyses as one JSON request, falling back to separate requests for sections that fail to parse")
+    LLM_MAP_REDUCE: bool = Field(False, description="Summarize papers longer than MAX_CONTENT_CHARS_FOR_LLM chunk by chunk and analyze the combined summaries instead of the truncated text")
+    LLM_MAP_CHUNK_CHARS: int = Field(12000, ge=1000, description="Maximum characters per section-aligned chunk in map-reduce mode")
+    LLM_MAP_MAX_CONCURRENCY: int = Field(4, ge=1, description="Maximum concurrent chunk summarization requests in map-reduce mode")
+
+    # Batch Processing Configuration
+    BATCH_MAX_CONCURRENT_PAPERS: int = Field(2, ge=1, description="Maximum number of papers processed concurrently in batch mode")
+    PIPELINE_CHECKPOINTS_ENABLED: bool = Field(True, description="Save per-stage outputs keyed by PDF hash and DOI so interrupted runs can be resumed with --resume")
 
     # LLM 模型选择配置 (从 web/config.txt 迁移过来，并更新为最新模型)
     LLM_MODEL_CHOICES: Dict[str, List[str]] = Field(
@@ -184,6 +240,29 @@ class Settings(BaseSettings):
     # markdown子目录名，可在.env中配置，未配置时自动为 <pdf_stem>_markdown
     MARKDOWN_SUBDIR: str = ""
 
+    @field_validator("IMAGE_UPLOAD_FORMAT")
+    @classmethod
+    def _normalize_image_upload_format(cls, value: str) -> str:
+        """统一为小写并把 jpg 映射为 jpeg；其他不支持的格式在启动时报错，而不是在转码时静默改为上传原图。"""
+        fmt = value.strip().lower()
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt not in ("jpeg", "png", "webp", "original"):
+            raise ValueError(f"IMAGE_UPLOAD_FORMAT 不支持 '{value}'，可选值: jpeg (jpg), png, webp, original")
+        return fmt
+
+    @field_validator("IMAGE_FILTER_MODE", "PDF_IMAGE_SOURCE")
+    @classmethod
+    def _check_choice(cls, value: str, info: ValidationInfo) -> str:
+        """取值固定的配置项统一为小写；拼写错误在启动时报错，而不是被当作其他模式静默执行。"""
+        choices = {
+            "IMAGE_FILTER_MODE": ("defer", "skip", "off"),
+            "PDF_IMAGE_SOURCE": ("layout", "embedded"),
+        }[info.field_name]
+        normalized = value.strip().lower()
+        if normalized not in choices:
+            raise ValueError(f"{info.field_name} 不支持 '{value}'，可选值: {', '.join(choices)}")
+        return normalized
+
     # Derived configurations (like LOG_FILE) can be defined as properties or methods if needed
     @property
     def LOG_FILE(self) -> str:
@@ -219,10 +298,37 @@ DASHSCOPE_API_KEY = settings.DASHSCOPE_API_KEY
 OPENAI_API_MODEL = settings.OPENAI_API_MODEL
 OPENAI_API_BASE_URL = settings.OPENAI_API_BASE_URL
 OPENAI_TEMPERATURE = settings.OPENAI_TEMPERATURE
+LLM_MAX_CONCURRENCY = settings.LLM_MAX_CONCURRENCY
+LLM_RPM = settings.LLM_RPM
+LLM_TPM = settings.LLM_TPM
+LLM_MAX_RETRIES = settings.LLM_MAX_RETRIES
+LLM_RETRY_BASE_DELAY = settings.LLM_RETRY_BASE_DELAY
 IMAGE_LLM_API_KEY = settings.IMAGE_LLM_API_KEY
 IMAGE_LLM_API_MODEL = settings.IMAGE_LLM_API_MODEL
 IMAGE_LLM_API_BASE_URL = settings.IMAGE_LLM_API_BASE_URL
 IMAGE_LLM_TEMPERATURE = settings.IMAGE_LLM_TEMPERATURE
+IMAGE_LLM_MAX_CONCURRENCY = settings.IMAGE_LLM_MAX_CONCURRENCY
+IMAGE_LLM_RPM = settings.IMAGE_LLM_RPM
+IMAGE_LLM_MAX_RETRIES = settings.IMAGE_LLM_MAX_RETRIES
+IMAGE_LLM_RETRY_BASE_DELAY = settings.IMAGE_LLM_RETRY_BASE_DELAY
+IMAGE_LLM_REQUEST_TIMEOUT = settings.IMAGE_LLM_REQUEST_TIMEOUT
+IMAGE_ANALYSIS_CACHE_ENABLED = settings.IMAGE_ANALYSIS_CACHE_ENABLED
+IMAGE_UPLOAD_MAX_EDGE = settings.IMAGE_UPLOAD_MAX_EDGE
+IMAGE_UPLOAD_FORMAT = settings.IMAGE_UPLOAD_FORMAT
+IMAGE_UPLOAD_QUALITY = settings.IMAGE_UPLOAD_QUALITY
+IMAGE_DEDUP_ENABLED = settings.IMAGE_DEDUP_ENABLED
+IMAGE_DEDUP_MAX_DISTANCE = settings.IMAGE_DEDUP_MAX_DISTANCE
+IMAGE_FILTER_MODE = settings.IMAGE_FILTER_MODE
+IMAGE_FILTER_MIN_SCORE = settings.IMAGE_FILTER_MIN_SCORE
+IMAGE_FILTER_MIN_SIZE = settings.IMAGE_FILTER_MIN_SIZE
+IMAGE_FILTER_MAX_ASPECT = settings.IMAGE_FILTER_MAX_ASPECT
+IMAGE_FILTER_MIN_ENTROPY = settings.IMAGE_FILTER_MIN_ENTROPY
+IMAGE_CONTEXT_MAX_CHARS = settings.IMAGE_CONTEXT_MAX_CHARS
+IMAGE_CAPTION_ONLY_MIN_CHARS = settings.IMAGE_CAPTION_ONLY_MIN_CHARS
+IMAGE_PACK_SIZE = settings.IMAGE_PACK_SIZE
+IMAGE_PACK_MAX_PIXELS = settings.IMAGE_PACK_MAX_PIXELS
+IMAGE_ANALYSIS_DEADLINE = settings.IMAGE_ANALYSIS_DEADLINE
+IMAGE_ANALYSIS_READY_FRACTION = settings.IMAGE_ANALYSIS_READY_FRACTION
 NCBI_EMAIL = settings.NCBI_EMAIL
 RELATED_ARTICLES_YEARS_BACK = settings.RELATED_ARTICLES_YEARS_BACK
 PUBMED_TOOL_NAME = settings.PUBMED_TOOL_NAME
@@ -255,6 +361,19 @@ DEFAULT_PDF_PATH = settings.DEFAULT_PDF_PATH
 ARTICLE_DOI = settings.ARTICLE_DOI
 OUTPUT_BASE_DIR = settings.OUTPUT_BASE_DIR
 PDF_IMAGES_SUBDIR = settings.PDF_IMAGES_SUBDIR
+PDF_CONVERSION_WORKERS = settings.PDF_CONVERSION_WORKERS
+PDF_CONVERSION_TIMEOUT = settings.PDF_CONVERSION_TIMEOUT
+PDF_CONVERSION_PROFILE = settings.PDF_CONVERSION_PROFILE
+PDF_IMAGE_SOURCE = settings.PDF_IMAGE_SOURCE
+EMBEDDED_IMAGE_MIN_SIZE = settings.EMBEDDED_IMAGE_MIN_SIZE
+PDF_STREAM_LEAD_PAGES = settings.PDF_STREAM_LEAD_PAGES
+PDF_PARALLEL_MIN_PAGES = settings.PDF_PARALLEL_MIN_PAGES
+PDF_PAGES_PER_CHUNK = settings.PDF_PAGES_PER_CHUNK
+PDF_CONVERSION_CACHE_ENABLED = settings.PDF_CONVERSION_CACHE_ENABLED
+PDF_CONVERTER_HOST = settings.PDF_CONVERTER_HOST
+PDF_CONVERTER_PORT = settings.PDF_CONVERTER_PORT
+PDF_CONVERTER_URL = settings.PDF_CONVERTER_URL
+PDF_CONVERTER_HEALTH_TIMEOUT = settings.PDF_CONVERTER_HEALTH_TIMEOUT
 CACHE_DIR = settings.CACHE_DIR
 CACHE_EXPIRY_DAYS = settings.CACHE_EXPIRY_DAYS
 LOG_LEVEL = settings.LOG_LEVEL
@@ -262,4 +381,15 @@ LOG_DIR = settings.LOG_DIR
 LOG_FILE = settings.LOG_FILE
 MAX_PAGES_TO_SCAN_FOR_DOI = settings.MAX_PAGES_TO_SCAN_FOR_DOI
 MAX_QUESTIONS_TO_GENERATE = settings.MAX_QUESTIONS_TO_GENERATE
+QA_ANSWER_SHARD_SIZE = settings.QA_ANSWER_SHARD_SIZE
+QA_ANSWER_MAX_RETRIES = settings.QA_ANSWER_MAX_RETRIES
 MAX_CONTENT_CHARS_FOR_LLM = settings.MAX_CONTENT_CHARS_FOR_LLM
+LLM_CONTEXT_WINDOW = settings.LLM_CONTEXT_WINDOW
+LLM_OUTPUT_TOKEN_RESERVE = settings.LLM_OUTPUT_TOKEN_RESERVE
+LLM_ANALYSIS_WAIT_FOR_IMAGES = settings.LLM_ANALYSIS_WAIT_FOR_IMAGES
+LLM_COMBINED_ANALYSIS = settings.LLM_COMBINED_ANALYSIS
+LLM_MAP_REDUCE = settings.LLM_MAP_REDUCE
+LLM_MAP_CHUNK_CHARS = settings.LLM_MAP_CHUNK_CHARS
+LLM_MAP_MAX_CONCURRENCY = settings.LLM_MAP_MAX_CONCURRENCY
+BATCH_MAX_CONCURRENT_PAPERS = settings.BATCH_MAX_CONCURRENT_PAPERS
+PIPELINE_CHECKPOINTS_ENABLED = settings.PIPELINE_CHECKPOINTS_ENABLED
@@ -0,0 +1,181 @@
+"""
+常驻的本地PDF转换服务。
+
+通过 `python app.py --serve-converter` 启动后，服务进程持有已预加载模型的转换进程池，
+CLI 和 Web 运行时的 PDFParsingAgent 检测到服务可用即把转换任务交给它，
+从而省去每次运行时导入 MinerU/torch 以及加载模型的冷启动时间。
+服务与客户端运行在同一台机器上，请求中直接传递文件路径。
+"""
+import asyncio
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from slais.utils.logging_utils import logger
+from slais import config
+
+
+def _service_url() -> str:
+    return config.settings.PDF_CONVERTER_URL.rstrip("/")
+
+
+# ---------------------------------------------------------------------------
+# 服务端
+# ---------------------------------------------------------------------------
+
+class _ConverterService:
+    """转换服务的请求处理器，任务交给 slais.pdf_worker_pool 中的转换进程池执行。"""
+
+    def __init__(self):
+        self.jobs_in_progress = 0
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "pid": os.getpid(),
+            "workers": config.settings.PDF_CONVERSION_WORKERS,
+            "jobs_in_progress": self.jobs_in_progress,
+        })
+
+    async def _read_job(self, request: web.Request) -> dict:
+        try:
+            payload = await request.json()
+        except Exception:
+            raise web.HTTPBadRequest(text="请求体必须是JSON")
+        pdf_path = payload.get("pdf_path")
+        if not pdf_path or not Path(pdf_path).is_file():
+            raise web.HTTPBadRequest(text=f"PDF文件不存在: {pdf_path}")
+        return payload
+
+    async def _run_job(self, job):
+        self.jobs_in_progress += 1
+        try:
+            return await job
+        finally:
+            self.jobs_in_progress -= 1
+
+    async def handle_convert(self, request: web.Request) -> web.Response:
+        from slais.pdf_utils import convert_pdf_to_markdown
+
+        payload = await self._read_job(request)
+        logger.info(f"转换服务收到转换任务: {payload['pdf_path']}")
+        try:
+            # convert_pdf_to_markdown 在服务的转换进程池中执行，长PDF会按页段并行转换
+            md_file_path = await self._run_job(
+                convert_pdf_to_markdown(payload["pdf_path"], payload.get("output_dir"), payload.get("profile"))
+            )
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        except asyncio.TimeoutError:
+            return web.json_response({"error": "转换超时"}, status=504)
+        except Exception as e:
+            logger.error(f"转换服务处理 {payload['pdf_path']} 失败: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+        return web.json_response({"md_file_path": md_file_path})
+
+    async def handle_extract_images(self, request: web.Request) -> web.Response:
+        from slais.pdf_utils import extract_images
+        from slais.pdf_worker_pool import run_in_pool
+
+        payload = await self._read_job(request)
+        if not payload.get("output_dir"):
+            raise web.HTTPBadRequest(text="缺少 output_dir")
+        try:
+            image_paths = await self._run_job(run_in_pool(extract_images, payload["pdf_path"], payload["output_dir"]))
+        except asyncio.TimeoutError:
+            return web.json_response({"error": "图片提取超时"}, status=504)
+        except Exception as e:
+            logger.error(f"转换服务提取 {payload['pdf_path']} 的图片失败: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+        return web.json_response({"image_paths": image_paths})
+
+    async def warm_up(self, app: web.Application):
+        """启动时创建转换进程池并让每个工作进程完成模型预加载。"""
+        from slais.pdf_worker_pool import get_pool
+        from slais.pdf_utils import preload_models
+
+        pool = get_pool()
+        loop = asyncio.get_running_loop()
+        if pool is None:
+            await asyncio.to_thread(preload_models)
+        else:
+            await asyncio.gather(*(
+                loop.run_in_executor(pool, os.getpid)
+                for _ in range(config.settings.PDF_CONVERSION_WORKERS)
+            ))
+        logger.info("转换服务模型预加载完成，开始接受任务。")
+
+    async def shutdown(self, app: web.Application):
+        from slais.pdf_worker_pool import shutdown_pool
+        shutdown_pool()
+
+
+def create_app() -> web.Application:
+    service = _ConverterService()
+    app = web.Application()
+    app.router.add_get("/health", service.handle_health)
+    app.router.add_post("/convert", service.handle_convert)
+    app.router.add_post("/extract_images", service.handle_extract_images)
+    app.on_startup.append(service.warm_up)
+    app.on_cleanup.append(service.shutdown)
+    return app
+
+
+def run_converter_service(host: Optional[str] = None, port: Optional[int] = None):
+    """以阻塞方式运行转换服务，直到进程被中断。"""
+    host = host or config.settings.PDF_CONVERTER_HOST
+    port = port or config.settings.PDF_CONVERTER_PORT
+    logger.info(f"启动PDF转换服务: http://{host}:{port}")
+    web.run_app(create_app(), host=host, port=port, print=None)
+
+
+# ---------------------------------------------------------------------------
+# 客户端
+# ---------------------------------------------------------------------------
+
+async def is_converter_available() -> bool:
+    """检查转换服务是否可用（未配置地址或连接失败时返回 False）。"""
+    url = _service_url()
+    if not url:
+        return False
+    try:
+        timeout = aiohttp.ClientTimeout(total=config.settings.PDF_CONVERTER_HEALTH_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(f"{url}/health") as response:
+                return response.status == 200
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+        return False
+
+
+async def _post_job(endpoint: str, payload: dict) -> dict:
+    conversion_timeout = config.settings.PDF_CONVERSION_TIMEOUT
+    timeout = aiohttp.ClientTimeout(total=conversion_timeout + 30 if conversion_timeout else None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.post(f"{_service_url()}/{endpoint}", json=payload) as response:
+            if response.status != 200:
+                raise RuntimeError(f"转换服务返回错误 (HTTP {response.status}): {await response.text()}")
+            return await response.json()
+
+
+async def convert_via_service(pdf_path: str, output_dir: Optional[str] = None, profile: Optional[str] = None) -> Optional[str]:
+    """请求转换服务把PDF转换为Markdown，返回生成的Markdown文件路径。"""
+    payload = {
+        "pdf_path": str(Path(pdf_path).resolve()),
+        "output_dir": str(Path(output_dir).resolve()) if output_dir else None,
+        "profile": profile or config.settings.PDF_CONVERSION_PROFILE,
+    }
+    result = await _post_job("convert", payload)
+    return result.get("md_file_path")
+
+
+async def extract_images_via_service(pdf_path: str, output_dir: str) -> List[str]:
+    """请求转换服务提取PDF中的图片，返回图片文件路径列表。"""
+    payload = {
+        "pdf_path": str(Path(pdf_path).resolve()),
+        "output_dir": str(Path(output_dir).resolve()),
+    }
+    result = await _post_job("extract_images", payload)
+    return result.get("image_paths") or []
@@ -1,8 +1,12 @@
 import os
 import json
 import re
+import shutil
+import asyncio
 import fitz  # PyMuPDF
 import logging
+import time
+from dataclasses import dataclass
 from pathlib import Path
 
 # # 设置 magic_pdf 配置文件路径（在导入前设置）
@@ -11,30 +15,341 @@ from pathlib import Path
 # if magic_pdf_config.exists():
 #     os.environ["MINERU_TOOLS_CONFIG_JSON"] = str(magic_pdf_config)
 
-from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
-from magic_pdf.data.dataset import PymuDocDataset
-from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
-from magic_pdf.config.enums import SupportedPdfParseMethod
 from slais.utils.logging_utils import logger
+from slais.utils.hash_utils import sha256_file
 from slais import config
 
-async def convert_pdf_to_markdown(pdf_path, output_dir=None):
+# 转换配置档：决定除 Markdown 和图片外还生成哪些产物
+#   fast     - 只生成分析流程使用的 Markdown 和图片
+#   standard - 另外保存内容列表 (<name>_content_list.json，含图片位置与图注)
+#   debug    - 另外绘制模型/布局/跨度PDF并保存中间JSON，用于排查解析问题
+CONVERSION_PROFILES = {
+    "fast": {"content_list": False, "debug_drawings": False, "middle_json": False},
+    "standard": {"content_list": True, "debug_drawings": False, "middle_json": False},
+    "debug": {"content_list": True, "debug_drawings": True, "middle_json": True},
+}
+
+@dataclass
+class MarkdownSegment:
+    """流式转换输出的一段 Markdown。final 为 True 时 text 是完整文档（转换失败时为空字符串）。"""
+    text: str
+    final: bool = False
+
+def paper_output_dir(pdf_path, pdf_sha256=None) -> Path:
+    """
+    单篇文献的输出目录 OUTPUT_BASE_DIR/<文件名>_<PDF内容SHA-256前8位>。
+    同名的不同文献（如批处理中不同目录下的同名PDF）各自使用独立的目录，转换结果和图片不会互相覆盖；
+    PDF无法读取时只以文件名命名。
+
+    Args:
+        pdf_path: PDF文件路径
+        pdf_sha256: 已计算的PDF内容摘要，为None时读取文件计算
+    """
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    if pdf_sha256 is None:
+        try:
+            pdf_sha256 = sha256_file(pdf_path)
+        except OSError:
+            return Path(config.settings.OUTPUT_BASE_DIR) / stem
+    return Path(config.settings.OUTPUT_BASE_DIR) / f"{stem}_{pdf_sha256[:8]}"
+
+# 转换逻辑变化（会影响输出内容）时递增，使旧的转换缓存失效
+CONVERSION_VERSION = "1"
+
+def conversion_version():
+    """返回转换版本标识：本项目的转换逻辑版本 + 已安装的 magic-pdf 版本（不导入 magic_pdf）。"""
+    try:
+        from importlib.metadata import version
+        magic_pdf_version = version("magic-pdf")
+    except Exception:
+        magic_pdf_version = "unknown"
+    return f"{CONVERSION_VERSION}-{magic_pdf_version}"
+
+def resolve_conversion_profile(profile=None):
+    """
+    返回转换配置档名称及其选项，profile 为 None 时使用 PDF_CONVERSION_PROFILE。
+
+    Raises:
+        ValueError: 未知的配置档名称
+    """
+    name = (profile or config.settings.PDF_CONVERSION_PROFILE).lower()
+    if name not in CONVERSION_PROFILES:
+        raise ValueError(f"未知的PDF转换配置档 '{name}'，可选: {', '.join(CONVERSION_PROFILES)}")
+    return name, CONVERSION_PROFILES[name]
+
+def preload_models():
+    """
+    预加载 MinerU 的版面分析/OCR模型（在转换工作进程启动时调用）。
+    模型由 magic_pdf 的 ModelSingleton 缓存，之后同一进程内的 doc_analyze 调用直接复用。
+    """
+    try:
+        from magic_pdf.model.doc_analyze_by_custom_model import ModelSingleton
+        model_manager = ModelSingleton()
+        for ocr in (False, True):
+            model_manager.get_model(ocr, False)
+        logger.info("MinerU模型已预加载。")
+    except Exception as e:
+        # 预加载失败不影响转换，首个任务会按需加载模型
+        logger.warning(f"预加载MinerU模型失败，将在首次转换时加载: {e}")
+
+async def convert_pdf_to_markdown(pdf_path, output_dir=None, profile=None, on_segment=None, lead_budget=None):
     """将PDF转换为Markdown格式
     
+    转换在常驻的工作进程池中执行（见 slais.pdf_worker_pool），不会阻塞事件循环。
+    
+    Args:
+        pdf_path: PDF文件路径
+        output_dir: 输出目录，如果为None，则使用最终输出目录而非临时目录
+        profile: 转换配置档 (fast/standard/debug)，为None时使用 PDF_CONVERSION_PROFILE
+        on_segment: 可选回调。提供时先单独转换前 PDF_STREAM_LEAD_PAGES 页，
+            并按页序对每个已转换完成的页段调用 on_segment(markdown片段)，
+            所有片段以空行连接即为最终文档；整篇一次转换时不调用。
+        lead_budget: 可选，提前开始的LLM分析的Token预算（提供 count(文本) 和 prompt_budget，如 TokenBudget）。
+            提供时只有开头几页的文本层足以填满该预算才单独转换开头几页，否则拆分不会让LLM分析提前开始。
+    
+    Returns:
+        生成的Markdown文件路径（字符串）
+    """
+    from slais.pdf_worker_pool import run_in_pool
+
+    pdf_path = str(pdf_path)
+    output_dir = str(output_dir) if output_dir else None
+    page_ranges = _plan_page_ranges(pdf_path, streaming=on_segment is not None, lead_budget=lead_budget)
+    if page_ranges:
+        md_file_path = await _convert_pdf_in_page_ranges(pdf_path, output_dir, profile, page_ranges, on_segment)
+        if md_file_path:
+            return md_file_path
+        logger.warning("分段转换失败，改为整篇转换。")
+    return await run_in_pool(convert_pdf_to_markdown_sync, pdf_path, output_dir, profile)
+
+def _plan_page_ranges(pdf_path, streaming=False, lead_budget=None):
+    """
+    决定是否分页段转换，返回 [(起始页, 结束页(不含)), ...]；整篇一次转换时返回 None。
+
+    - 页数达到 PDF_PARALLEL_MIN_PAGES 且有多个转换进程时，按 PDF_PAGES_PER_CHUNK 页拆分并行转换；
+    - streaming 时先单独转换前 PDF_STREAM_LEAD_PAGES 页，使下游尽早拿到开头的内容。
+      单独转换会多一次模型推理、截断跨页的段落，因此给出 lead_budget 时，
+      开头几页的文本层不足以填满LLM的Token预算（LLM分析不会因此提前开始）则不拆分。
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+            lead_pages = config.settings.PDF_STREAM_LEAD_PAGES if streaming else 0
+            if lead_pages >= page_count:
+                lead_pages = 0
+            lead_text = "".join(doc[i].get_text() for i in range(lead_pages)) if lead_pages and lead_budget else ""
+    except Exception as e:
+        logger.warning(f"读取PDF页数失败，按整篇转换: {e}")
+        return None
+
+    if lead_pages and lead_budget is not None:
+        lead_tokens = lead_budget.count(lead_text)
+        if lead_tokens < lead_budget.prompt_budget:
+            logger.info(
+                f"前 {lead_pages} 页约 {lead_tokens} Token，不足LLM上下文预算 {lead_budget.prompt_budget}，"
+                f"不单独转换开头页面。"
+            )
+            lead_pages = 0
+
+    min_pages = config.settings.PDF_PARALLEL_MIN_PAGES
+    parallel = min_pages > 0 and config.settings.PDF_CONVERSION_WORKERS > 1 and page_count >= min_pages
+    if not parallel and not lead_pages:
+        return None
+
+    pages_per_chunk = config.settings.PDF_PAGES_PER_CHUNK if parallel else page_count
+    ranges = [(0, lead_pages)] if lead_pages else []
+    for start in range(lead_pages, page_count, pages_per_chunk):
+        ranges.append((start, min(start + pages_per_chunk, page_count)))
+    return ranges
+
+def split_pdf_pages(pdf_path, pages_per_chunk, parts_dir, page_ranges=None):
+    """
+    用 PyMuPDF 把PDF按页段拆分为多个PDF文件。
+
+    Args:
+        pages_per_chunk: 每段页数（未提供 page_ranges 时使用）
+        page_ranges: 可选，显式指定的 [(起始页, 结束页(不含)), ...]
+
+    Returns:
+        [(分段PDF路径, 起始页索引), ...]，按页序排列
+    """
+    os.makedirs(parts_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    parts = []
+    with fitz.open(pdf_path) as doc:
+        if page_ranges is None:
+            page_ranges = [
+                (start, min(start + pages_per_chunk, doc.page_count))
+                for start in range(0, doc.page_count, pages_per_chunk)
+            ]
+        for start, end in page_ranges:
+            part_path = os.path.join(parts_dir, f"{stem}_part{len(parts):03d}.pdf")
+            with fitz.open() as part_doc:
+                part_doc.insert_pdf(doc, from_page=start, to_page=end - 1)
+                part_doc.save(part_path)
+            parts.append((part_path, start))
+    return parts
+
+class _PartStitcher:
+    """按页序逐段合并页段转换结果，每合并一段即返回该段（图片已重新编号的）Markdown。"""
+
+    def __init__(self, markdown_dir, stem, write_content_list=True):
+        self.markdown_dir = markdown_dir
+        self.stem = stem
+        self.write_content_list = write_content_list
+        self.subdir = config.PDF_IMAGES_SUBDIR
+        self.images_dir = os.path.join(markdown_dir, self.subdir)
+        os.makedirs(self.images_dir, exist_ok=True)
+        self.link_pattern = re.compile(rf"{re.escape(self.subdir)}/([^)\s\"']+)")
+        self.md_parts = []
+        self.content_list = []
+        self.next_image_idx = 0
+
+    def add_part(self, part_md_path, page_offset):
+        subdir = self.subdir
+        part_dir = os.path.dirname(part_md_path)
+        part_stem = os.path.splitext(os.path.basename(part_md_path))[0]
+        part_images_dir = os.path.join(part_dir, subdir)
+
+        renamed = {}
+        if os.path.isdir(part_images_dir):
+            for img_filename in sorted(os.listdir(part_images_dir)):
+                _, ext = os.path.splitext(img_filename)
+                new_filename = f"image_{self.next_image_idx:03d}{ext}"
+                self.next_image_idx += 1
+                shutil.copy2(os.path.join(part_images_dir, img_filename), os.path.join(self.images_dir, new_filename))
+                renamed[img_filename] = new_filename
+
+        with open(part_md_path, "r", encoding="utf-8") as f:
+            part_md = f.read()
+        part_md = self.link_pattern.sub(lambda m: f"{subdir}/{renamed.get(m.group(1), m.group(1))}", part_md).strip()
+        self.md_parts.append(part_md)
+
+        part_content_list = os.path.join(part_dir, f"{part_stem}_content_list.json")
+        if self.write_content_list and os.path.isfile(part_content_list):
+            with open(part_content_list, "r", encoding="utf-8") as f:
+                for block in json.load(f):
+                    if isinstance(block.get("page_idx"), int):
+                        block["page_idx"] += page_offset
+                    img_path = block.get("img_path")
+                    if img_path:
+                        img_name = img_path.replace('\\', '/').split('/')[-1]
+                        block["img_path"] = f"{subdir}/{renamed.get(img_name, img_name)}"
+                    self.content_list.append(block)
+        return part_md
+
+    def finish(self):
+        md_file_path = os.path.join(self.markdown_dir, f"{self.stem}.md")
+        with open(md_file_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(self.md_parts))
+        if self.write_content_list:
+            with open(os.path.join(self.markdown_dir, f"{self.stem}_content_list.json"), "w", encoding="utf-8") as f:
+                json.dump(self.content_list, f, ensure_ascii=False, indent=4)
+        logger.info(f"已合并 {len(self.md_parts)} 个页段的转换结果，共 {self.next_image_idx} 张图片: {md_file_path}")
+        return md_file_path
+
+def stitch_converted_parts(parts, markdown_dir, stem, write_content_list=True):
+    """
+    把各页段的转换结果按页序合并为一篇文档：拼接Markdown、把图片重新编号为全局连续的 image_XXX，
+    并合并内容列表（page_idx 加上页段的起始页，img_path 指向重新编号后的图片）。
+
+    Args:
+        parts: [(页段Markdown文件路径, 起始页索引), ...]，按页序排列
+        markdown_dir: 合并结果的输出目录
+        stem: 输出文件名前缀
+        write_content_list: 是否保存合并后的内容列表
+
+    Returns:
+        合并后的Markdown文件路径
+    """
+    stitcher = _PartStitcher(markdown_dir, stem, write_content_list)
+    for part_md_path, page_offset in parts:
+        stitcher.add_part(part_md_path, page_offset)
+    return stitcher.finish()
+
+async def _convert_pdf_in_page_ranges(pdf_path, output_dir, profile, page_ranges, on_segment=None):
+    """
+    把PDF拆分为页段，在转换进程池中并行转换后按页序合并。
+    页段边界处跨页的段落/表格不会被合并，这是换取并行度和提前输出的代价。
+
+    Args:
+        page_ranges: [(起始页, 结束页(不含)), ...]
+        on_segment: 可选回调，每个页段按页序合并后以该段的Markdown调用
+
+    Returns:
+        合并后的Markdown文件路径；任一页段失败时返回 None
+    """
+    from slais.pdf_worker_pool import run_in_pool
+
+    profile_name, profile_options = resolve_conversion_profile(profile)
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    if output_dir is None:
+        output_dir = str(paper_output_dir(pdf_path))
+    markdown_dir = os.path.join(output_dir, f"{stem}_markdown")
+    parts_dir = os.path.join(markdown_dir, "_parts")
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    start_time = time.perf_counter()
+    parts = await asyncio.to_thread(split_pdf_pages, pdf_path, None, parts_dir, page_ranges)
+    logger.info(f"PDF已拆分为 {len(parts)} 个页段 {page_ranges}，开始转换。")
+
+    # 各页段同时提交到进程池；按页序等待结果，使前面的页段一完成就能输出
+    tasks = [
+        asyncio.ensure_future(run_in_pool(convert_pdf_to_markdown_sync, part_path, parts_dir, profile_name))
+        for part_path, _ in parts
+    ]
+    stitcher = _PartStitcher(markdown_dir, stem, profile_options["content_list"])
+    try:
+        for (part_path, page_offset), task in zip(parts, tasks):
+            try:
+                part_md_path = await task
+            except Exception as e:
+                part_md_path = None
+                logger.error(f"页段 {os.path.basename(part_path)} 转换出错: {e}")
+            if not part_md_path:
+                logger.error(f"页段 {os.path.basename(part_path)} 转换失败。")
+                return None
+            segment = await asyncio.to_thread(stitcher.add_part, part_md_path, page_offset)
+            if on_segment:
+                on_segment(segment)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    md_file_path = await asyncio.to_thread(stitcher.finish)
+    if not profile_options["debug_drawings"]:
+        # 调试配置档保留各页段的中间产物，其他配置档清理
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    logger.info(f"分段转换完成，耗时 {time.perf_counter() - start_time:.2f} 秒。")
+    return md_file_path
+
+def convert_pdf_to_markdown_sync(pdf_path, output_dir=None, profile=None):
+    """将PDF转换为Markdown格式（同步执行，供转换工作进程调用）
+    
     Args:
         pdf_path: PDF文件路径
         output_dir: 输出目录，如果为None，则使用最终输出目录而非临时目录
+        profile: 转换配置档 (fast/standard/debug)，为None时使用 PDF_CONVERSION_PROFILE
     
     Returns:
         生成的Markdown文件路径（字符串）
     """
+    profile_name, profile_options = resolve_conversion_profile(profile)
+
+    # magic_pdf 及其依赖的 torch 导入耗时较长，只在真正执行转换时导入
+    from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
+    from magic_pdf.data.dataset import PymuDocDataset
+    from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+    from magic_pdf.config.enums import SupportedPdfParseMethod
+
     # 获取PDF文件名（不含扩展名）
     pdf_filename = os.path.basename(pdf_path)
     pdf_name_without_ext = os.path.splitext(pdf_filename)[0]
     
     # 如果未指定输出目录，使用默认的最终输出目录
     if output_dir is None:
-        output_dir = os.path.join(config.OUTPUT_BASE_DIR, pdf_name_without_ext)
+        output_dir = str(paper_output_dir(pdf_path))
     
     # 创建专门的Markdown子文件夹
     markdown_dir = os.path.join(output_dir, f"{pdf_name_without_ext}_markdown")
@@ -65,6 +380,15 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
         root_logger.removeHandler(handler)
     root_logger.setLevel(logging.ERROR)
     
+    step_times = {}
+    step_start = time.perf_counter()
+
+    def finish_step(step_name):
+        nonlocal step_start
+        now = time.perf_counter()
+        step_times[step_name] = now - step_start
+        step_start = now
+
     try:
         # 初始化写入器
         image_writer = FileBasedDataWriter(local_image_dir)
@@ -73,54 +397,55 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
         # 读取PDF内容
         reader = FileBasedDataReader("")
         pdf_bytes = reader.read(pdf_path)
-        logger.info("PDF内容已读取")
+        logger.info(f"PDF内容已读取，转换配置档: {profile_name}")
         
         # 创建数据集实例
         ds = PymuDocDataset(pdf_bytes)
+        is_ocr = ds.classify() == SupportedPdfParseMethod.OCR
+        finish_step("读取与分类")
         
         # 推断处理模式
-        if ds.classify() == SupportedPdfParseMethod.OCR:
+        if is_ocr:
             logger.info("使用OCR模式处理PDF")
             infer_result = ds.apply(doc_analyze, ocr=True)
+            finish_step("版面分析(doc_analyze)")
             pipe_result = infer_result.pipe_ocr_mode(image_writer)
         else:
             logger.info("使用文本模式处理PDF")
             infer_result = ds.apply(doc_analyze, ocr=False)
+            finish_step("版面分析(doc_analyze)")
             pipe_result = infer_result.pipe_txt_mode(image_writer)
+        finish_step("管线处理与图片裁剪")
         
         logger.info("PDF处理完成")
         
-        # 绘制模型结果
-        try:
-            infer_result.draw_model(os.path.join(local_md_dir, f"{pdf_name_without_ext}_model.pdf"))
-            logger.info("模型结果已绘制")
-        except Exception as e:
-            logger.error(f"绘制模型结果时出错: {e}")
-
-        # 获取模型推断结果
-        try:
-            model_inference_result = infer_result.get_infer_res()
-        except Exception as e:
-            logger.error(f"获取模型推断结果时出错: {e}")
-            model_inference_result = None
-        
-        # 绘制布局结果
-        try:
-            pipe_result.draw_layout(os.path.join(local_md_dir, f"{pdf_name_without_ext}_layout.pdf"))
-            logger.info("布局结果已绘制")
-        except Exception as e:
-            logger.error(f"绘制布局结果时出错: {e}")
-        
-        # 绘制跨度结果
-        try:
-            pipe_result.draw_span(os.path.join(local_md_dir, f"{pdf_name_without_ext}_spans.pdf"))
-            logger.info("跨度结果已绘制")
-        except Exception as e:
-            logger.error(f"绘制跨度结果时出错: {e}")
+        if profile_options["debug_drawings"]:
+            # 绘制模型结果
+            try:
+                infer_result.draw_model(os.path.join(local_md_dir, f"{pdf_name_without_ext}_model.pdf"))
+                logger.info("模型结果已绘制")
+            except Exception as e:
+                logger.error(f"绘制模型结果时出错: {e}")
+            
+            # 绘制布局结果
+            try:
+                pipe_result.draw_layout(os.path.join(local_md_dir, f"{pdf_name_without_ext}_layout.pdf"))
+                logger.info("布局结果已绘制")
+            except Exception as e:
+                logger.error(f"绘制布局结果时出错: {e}")
+            
+            # 绘制跨度结果
+            try:
+                pipe_result.draw_span(os.path.join(local_md_dir, f"{pdf_name_without_ext}_spans.pdf"))
+                logger.info("跨度结果已绘制")
+            except Exception as e:
+                logger.error(f"绘制跨度结果时出错: {e}")
+            finish_step("绘制调试PDF")
         
-        # 获取原始Markdown内容和内容列表
+        # 获取原始Markdown内容和内容列表（内容列表只生成一次，图片重命名后同步更新其中的路径）
         md_content_original = pipe_result.get_markdown(image_dir)
         content_list = pipe_result.get_content_list(image_dir)
+        finish_step("生成Markdown与内容列表")
         
         # --- Begin Diagnostic Logging for content_list ---
         # 减少诊断日志输出量，仅保留最核心信息
@@ -132,6 +457,7 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
         
         updated_md_content = md_content_original
         image_counter = 0 # Initialize image_counter here
+        renamed_image_paths = {}  # 原Markdown图片路径 -> 新路径，用于同步更新内容列表
         
         logger.info("开始重命名图片并更新Markdown内容中的图片链接...")
         
@@ -181,6 +507,7 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
                     renamed_successfully = True # 视为成功，以便更新Markdown链接
 
                 if renamed_successfully:
+                    renamed_image_paths[original_md_image_path] = new_md_image_path
                     # 更新Markdown中的链接，即使文件没有被重命名（因为它可能已经是正确的名字但链接是旧的）
                     if original_md_image_path in updated_md_content:
                         updated_md_content = updated_md_content.replace(original_md_image_path, new_md_image_path)
@@ -205,6 +532,7 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
             logger.warning(f"图像目录不存在或不是有效目录: '{local_image_dir}'")
 
         logger.info(f"图片重命名和Markdown链接更新完成。共处理 {image_counter} 张图片。")
+        finish_step("图片重命名")
         
         md_file_path = os.path.join(local_md_dir, f"{pdf_name_without_ext}.md")
         try:
@@ -215,14 +543,29 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
             logger.error(f"保存更新后的Markdown文件失败 '{md_file_path}': {e}")
             return None
         
-        content_list_content = pipe_result.get_content_list(image_dir)
-        pipe_result.dump_content_list(md_writer, f"{pdf_name_without_ext}_content_list.json", image_dir)
-        logger.info("内容列表已保存")
+        finish_step("保存Markdown")
         
-        middle_json_content = pipe_result.get_middle_json()
-        pipe_result.dump_middle_json(md_writer, f"{pdf_name_without_ext}_middle.json")
-        logger.info("中间JSON文件已保存")
+        if profile_options["content_list"]:
+            for block in content_list or []:
+                img_path = block.get("img_path")
+                if img_path:
+                    block["img_path"] = renamed_image_paths.get(img_path.replace('\\', '/'), img_path)
+            content_list_path = os.path.join(local_md_dir, f"{pdf_name_without_ext}_content_list.json")
+            with open(content_list_path, "w", encoding="utf-8") as f:
+                json.dump(content_list, f, ensure_ascii=False, indent=4)
+            logger.info("内容列表已保存")
+            finish_step("保存内容列表")
         
+        if profile_options["middle_json"]:
+            pipe_result.dump_middle_json(md_writer, f"{pdf_name_without_ext}_middle.json")
+            logger.info("中间JSON文件已保存")
+            finish_step("保存中间JSON")
+        
+        total_time = sum(step_times.values())
+        logger.info(
+            f"PDF转换完成 (配置档 {profile_name})，总耗时 {total_time:.2f} 秒，各步骤耗时: "
+            + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in step_times.items())
+        )
         return md_file_path  # 确保返回的是文件路径而不是内容
     finally:
         # 恢复原始日志级别
@@ -235,6 +578,70 @@ async def convert_pdf_to_markdown(pdf_path, output_dir=None):
         for handler in root_handlers:
             root_logger.addHandler(handler)
 
+# PyMuPDF 可直接保存的嵌入图片格式；其他格式（如 JPX、JBIG2）转为 PNG
+EMBEDDED_IMAGE_EXTS = {"png", "jpeg", "jpg"}
+EMBEDDED_IMAGE_INDEX_FILE = "image_index.json"
+
+def extract_embedded_images(pdf_path, output_dir, min_size=None):
+    """
+    用 PyMuPDF 直接导出PDF中嵌入的位图，不运行版面分析模型，通常在数秒内完成。
+    与 MinerU 按版面裁剪的图表不同，矢量绘制的图表不会被导出，同一位图在多页重复出现时只导出一次。
+    导出的同时在输出目录写入 image_index.json，记录每张图片所在页和位置。
+
+    参数:
+        pdf_path (str): 输入PDF文件的路径
+        output_dir (str): 图像输出目录
+        min_size (int, optional): 宽或高小于该像素数的图片（图标、装饰线等）被跳过，默认 EMBEDDED_IMAGE_MIN_SIZE
+    返回:
+        list: [{"path", "page_idx", "bbox", "width", "height"}, ...]，按页序排列
+    """
+    min_size = config.settings.EMBEDDED_IMAGE_MIN_SIZE if min_size is None else min_size
+    os.makedirs(output_dir, exist_ok=True)
+    images = []
+    seen_xrefs = set()
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page_idx, page in enumerate(doc):
+                for img in page.get_images(full=True):
+                    xref, width, height = img[0], img[2], img[3]
+                    if xref in seen_xrefs or width < min_size or height < min_size:
+                        continue
+                    seen_xrefs.add(xref)
+
+                    rects = page.get_image_rects(xref)
+                    bbox = [round(v, 2) for v in rects[0]] if rects else None
+                    filename_base = f"page{page_idx + 1:03d}_img{len(images):03d}"
+                    extracted = doc.extract_image(xref)
+                    if extracted and extracted.get("ext") in EMBEDDED_IMAGE_EXTS and not extracted.get("smask"):
+                        image_path = os.path.join(output_dir, f"{filename_base}.{extracted['ext']}")
+                        with open(image_path, "wb") as f:
+                            f.write(extracted["image"])
+                    else:
+                        pix = fitz.Pixmap(doc, xref)
+                        if extracted and extracted.get("smask"):
+                            pix = fitz.Pixmap(pix, fitz.Pixmap(doc, extracted["smask"]))
+                        if pix.colorspace and pix.colorspace.n not in (1, 3):
+                            pix = fitz.Pixmap(fitz.csRGB, pix)
+                        image_path = os.path.join(output_dir, f"{filename_base}.png")
+                        pix.save(image_path)
+                    images.append({
+                        "path": image_path,
+                        "page_idx": page_idx,
+                        "bbox": bbox,
+                        "width": width,
+                        "height": height,
+                    })
+
+        with open(os.path.join(output_dir, EMBEDDED_IMAGE_INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                [dict(item, path=os.path.basename(item["path"])) for item in images],
+                f, ensure_ascii=False, indent=2
+            )
+        logger.info(f"从PDF文件 {os.path.basename(pdf_path)} 直接导出 {len(images)} 张嵌入图片。")
+    except Exception as e:
+        logger.error(f"导出PDF嵌入图片时发生错误：{str(e)}")
+    return images
+
 def extract_images(pdf_path, output_dir):
     """
     从PDF文件中提取图像。
@@ -245,6 +652,11 @@ def extract_images(pdf_path, output_dir):
     返回:
         list: 提取到的图像文件路径列表
     """
+    from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
+    from magic_pdf.data.dataset import PymuDocDataset
+    from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+    from magic_pdf.config.enums import SupportedPdfParseMethod
+
     logger.info(f"开始从PDF文件 {os.path.basename(pdf_path)} 提取图像到 {output_dir}")
     image_paths = []
     try:
@@ -255,8 +667,9 @@ def extract_images(pdf_path, output_dir):
         pdf_bytes = reader.read(pdf_path)
         ds = PymuDocDataset(pdf_bytes)
 
-        infer_result = ds.apply(doc_analyze, ocr=ds.classify() == SupportedPdfParseMethod.OCR)
-        pipe_result = infer_result.pipe_txt_mode(image_writer) if ds.classify() != SupportedPdfParseMethod.OCR else infer_result.pipe_ocr_mode(image_writer)
+        is_ocr = ds.classify() == SupportedPdfParseMethod.OCR
+        infer_result = ds.apply(doc_analyze, ocr=is_ocr)
+        pipe_result = infer_result.pipe_ocr_mode(image_writer) if is_ocr else infer_result.pipe_txt_mode(image_writer)
 
         saved_files = os.listdir(output_dir)
         image_paths = [os.path.join(output_dir, f) for f in saved_files if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
@@ -277,6 +690,11 @@ def extract_tables(pdf_path):
     返回:
         list: 提取到的表格的Markdown字符串列表
     """
+    from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
+    from magic_pdf.data.dataset import PymuDocDataset
+    from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+    from magic_pdf.config.enums import SupportedPdfParseMethod
+
     logger.info(f"开始从PDF文件 {os.path.basename(pdf_path)} 提取表格")
     tables_markdown = []
     try:
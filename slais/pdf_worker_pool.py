@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from slais.utils.logging_utils import logger
+from slais import config
+
+# 进程内共享的转换进程池（惰性创建）
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# 因某个任务超时而被主动终止的进程池；其上其他任务的失败不是它们自身的问题
+_reset_pools = weakref.WeakSet()
+
+
+def _init_worker():
+    """
+    子进程初始化：日志只输出到 stderr（避免多个进程写同一日志文件），
+    并预加载 MinerU 的版面/OCR模型，使后续每个转换任务都复用已加载的模型。
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(f'%(asctime)s - pdf-worker[{os.getpid()}] - %(levelname)s - %(message)s'))
+    logger.handlers = [handler]
+    logger.propagate = False
+
+    from slais.pdf_utils import preload_models
+    preload_models()
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    获取转换进程池；PDF_CONVERSION_WORKERS 为 0 时返回 None（在本进程的线程中转换）。
+    进程池使用 spawn 方式启动，避免 fork 已加载 torch/CUDA 的父进程。
+    """
+    global _pool
+    workers = config.settings.PDF_CONVERSION_WORKERS
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            logger.info(f"启动PDF转换进程池，工作进程数: {workers}")
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def shutdown_pool(terminate: bool = False, pool: Optional[ProcessPoolExecutor] = None):
+    """
+    关闭转换进程池。
+
+    Args:
+        terminate: 为 True 时立即终止工作进程（用于任务超时后回收卡住的进程）。
+        pool: 要关闭的进程池，默认为当前进程池；若它已被其他任务替换，则不影响新的进程池。
+    """
+    global _pool
+    with _pool_lock:
+        if pool is None or pool is _pool:
+            pool, _pool = _pool, None
+    if pool is None:
+        return
+    if terminate:
+        # ProcessPoolExecutor 没有公开的终止接口，只能直接结束其工作进程
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+    pool.shutdown(wait=not terminate, cancel_futures=True)
+    logger.info("PDF转换进程池已关闭。")
+
+
+async def run_in_pool(func: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+    """
+    在转换进程池中执行同步函数并等待结果，不阻塞事件循环。
+
+    任务超时会重置整个进程池：ProcessPoolExecutor 无法单独结束某个工作进程，任一工作进程被终止后
+    整个进程池都会失效，因此同一进程池上其他文献正在执行或排队的转换也会中断。
+    这些任务会在重建的进程池上重新提交，且不计入它们自身的重试次数；
+    只有工作进程自行崩溃（如内存不足）时才计为一次失败，重建后最多重试一次。
+
+    Args:
+        func: 模块级同步函数（需可被 pickle）
+        *args: 传给 func 的参数
+        timeout: 单个任务的超时秒数，默认使用 PDF_CONVERSION_TIMEOUT，0 表示不限制
+
+    Raises:
+        asyncio.TimeoutError: 任务超时。超时后进程池被终止并在下次提交时重建。
+    """
+    if timeout is None:
+        timeout = config.settings.PDF_CONVERSION_TIMEOUT
+    timeout = timeout or None
+    name = getattr(func, '__name__', func)
+
+    crashes = 0
+    while True:
+        pool = get_pool()
+        future = None
+        try:
+            if pool is None:
+                return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+            future = pool.submit(func, *args)
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"PDF转换任务 {name} 超过 {timeout} 秒未完成，终止并重建转换进程池。")
+            if pool is not None:
+                _reset_pools.add(pool)
+                shutdown_pool(terminate=True, pool=pool)
+            raise
+        except (BrokenProcessPool, asyncio.CancelledError) as e:
+            task = asyncio.current_task()
+            if isinstance(e, asyncio.CancelledError) and getattr(task, "cancelling", lambda: 0)():
+                # 调用方取消了任务本身
+                raise
+            if pool is not None and pool in _reset_pools and (isinstance(e, BrokenProcessPool) or future.cancelled()):
+                # 进程池因其他任务超时被终止（执行中的任务失效，排队的任务被取消），重新提交且不计入重试
+                logger.info(f"转换进程池因其他任务超时被重置，重新提交PDF转换任务 {name}。")
+                continue
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            # 工作进程崩溃（如内存不足），重建后重试一次
+            logger.warning(f"PDF转换进程池已失效: {e}")
+            shutdown_pool(terminate=True, pool=pool)
+            crashes += 1
+            if crashes > 1:
+                raise
+            logger.info("重建PDF转换进程池并重试当前任务。")
@@ -10,36 +10,7 @@ import json
 
 from .utils.logging_utils import logger
 from . import config
-
-# 速率限制控制 - 令牌桶实现
-class TokenBucket:
-    def __init__(self, rate_per_minute: float, burst_limit: Optional[int] = None):
-        self.rate_per_second = rate_per_minute / 60.0
-        self.burst_limit = burst_limit if burst_limit is not None else max(10, int(rate_per_minute / 3))
-        self.tokens = float(self.burst_limit)
-        self.last_update = time.time()
-        self.lock = asyncio.Lock()
-    
-    async def get_token(self) -> float:
-        async with self.lock:
-            now = time.time()
-            elapsed = now - self.last_update
-            new_tokens = elapsed * self.rate_per_second
-            self.tokens = min(float(self.burst_limit), self.tokens + new_tokens)
-            self.last_update = now
-            
-            if self.tokens >= 1.0:
-                self.tokens -= 1.0
-                return 0.0
-            else:
-                wait_time = (1.0 - self.tokens) / self.rate_per_second
-                return wait_time
-                
-    async def wait_for_token(self) -> None:
-        wait_time = await self.get_token()
-        if wait_time > 0:
-            logger.debug(f"[S2 TokenBucket] 等待 {wait_time:.2f} 秒")
-            await asyncio.sleep(wait_time)
+from .utils.rate_limit import TokenBucket
 
 class SemanticScholarClient:
     """Semantic Scholar API 客户端 - 已优化版本"""
@@ -0,0 +1,259 @@
+import asyncio
+import datetime
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from slais.utils.logging_utils import logger
+
+# stage_costs 中的汇总键
+WALL_CLOCK_KEY = "流程总耗时(墙钟)"
+CRITICAL_PATH_KEY = "关键路径耗时"
+# 从检查点恢复的阶段记录的状态
+RESTORED_STATUS = "完成 (检查点恢复)"
+# 需要在恢复运行时重新执行的状态；其余状态（完成、各类“跳过”）均为确定的最终结果，可从检查点复用
+FAILED_STATUS = "失败"
+PARTIAL_STATUS = "部分失败"
+RETRY_STATUSES = (FAILED_STATUS, PARTIAL_STATUS)
+
+
+@dataclass
+class StageOutcome:
+    """
+    阶段函数可返回此对象，以便在输出之外报告非“完成”的状态（如“失败”“部分失败”“跳过 (无图片)”）。
+    “失败”和“部分失败”的阶段在恢复运行时会重新执行。
+    """
+    output: Any
+    status: str = "完成"
+
+
+@dataclass
+class PipelineStage:
+    """
+    流程中的一个阶段。
+
+    Attributes:
+        name: 阶段名，同时是其输出在结果字典中的键。
+        run: 异步函数，接收 {输入阶段名: 输出} 字典，返回输出值或 StageOutcome。
+        inputs: 依赖的阶段名列表，全部完成后本阶段才会启动。
+        display_name: 记录到 stage_times/stage_status/stage_costs 中的名称；为 None 时不记录（内部阶段）。
+        early_inputs: 可提前使用的依赖：上游通过 StageScheduler.publish 发布了阶段性输出即可启动，
+            收到的是该阶段性输出（上游未发布时等同于普通依赖，收到最终输出）。
+    """
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    inputs: List[str] = field(default_factory=list)
+    display_name: Optional[str] = None
+    early_inputs: List[str] = field(default_factory=list)
+
+    @property
+    def dependencies(self) -> List[str]:
+        return self.inputs + self.early_inputs
+
+
+class StageScheduler:
+    """
+    按依赖关系执行流程阶段：每个阶段在其全部输入就绪后立即启动，彼此独立的阶段并发执行。
+    执行结束后提供每个阶段的耗时、状态，以及整体墙钟时间和关键路径时间。
+    """
+
+    def __init__(self, stages: List[PipelineStage], on_stage_done: Optional[Callable[[PipelineStage, str, int, int], None]] = None,
+                 checkpoint: Optional[Any] = None, resume: bool = False):
+        """
+        Args:
+            stages: 阶段列表。
+            on_stage_done: 可选回调，每个阶段结束时调用，参数为 (阶段, 状态, 已完成阶段数, 阶段总数)。
+            checkpoint: 可选检查点存储，需提供 load(阶段名) -> (输出, 状态) | None 和 save(阶段名, 输出, 状态)。
+                        每个阶段结束后保存其输出。
+            resume: 为 True 时，检查点中状态不是“失败”/“部分失败”且所有输入也来自检查点的阶段不再执行，
+                    直接复用保存的输出。
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("阶段名称重复。")
+        self.on_stage_done = on_stage_done
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.restored: set = set()
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._early_futures: Dict[str, asyncio.Future] = {}
+        self._published_at: Dict[str, datetime.datetime] = {}
+        self.order = self._topological_order()
+
+        self.stage_times: Dict[str, str] = {}
+        self.stage_status: Dict[str, str] = {}
+        self.stage_costs: Dict[str, float] = {}
+        self.timings: Dict[str, Tuple[datetime.datetime, datetime.datetime]] = {}
+        self.completed_count = 0
+
+    def _topological_order(self) -> List[str]:
+        """校验依赖并返回拓扑序；存在未知依赖或环时抛出 ValueError。"""
+        for stage in self.stages.values():
+            for dep in stage.dependencies:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 '{stage.name}' 依赖未定义的阶段 '{dep}'。")
+
+        order, visiting, visited = [], set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"阶段依赖存在环，涉及阶段 '{name}'。")
+            visiting.add(name)
+            for dep in self.stages[name].dependencies:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _record(self, stage: PipelineStage, status: str, start: datetime.datetime, end: datetime.datetime):
+        self.timings[stage.name] = (start, end)
+        self.completed_count += 1
+        if stage.display_name:
+            duration = (end - start).total_seconds()
+            now = end.strftime("%H:%M:%S")
+            self.stage_times[stage.display_name] = now
+            self.stage_status[stage.display_name] = status
+            self.stage_costs[stage.display_name] = duration
+            logger.info(f"阶段记录成功: {{'阶段': '{stage.display_name}', '完成时间': '{now}', '耗时_秒': {duration:.2f}, '状态': '{status}'}}")
+        if self.on_stage_done:
+            try:
+                self.on_stage_done(stage, status, self.completed_count, len(self.stages))
+            except Exception as e:
+                logger.warning(f"阶段完成回调出错: {e}")
+
+    def _restore(self, stage: PipelineStage) -> Optional[Tuple[Any, str]]:
+        """
+        从检查点恢复阶段输出。状态不是“失败”/“部分失败”（即“完成”或确定的“跳过”）
+        且所有输入阶段同样是恢复得到的阶段才会被复用，上游重新执行过的阶段会使下游检查点失效。
+        """
+        if not (self.resume and self.checkpoint):
+            return None
+        if any(dep not in self.restored for dep in stage.dependencies):
+            return None
+        try:
+            saved = self.checkpoint.load(stage.name)
+        except Exception as e:
+            logger.warning(f"读取阶段 '{stage.name}' 的检查点失败: {e}")
+            return None
+        if saved is None or saved[1] in RETRY_STATUSES:
+            return None
+        logger.info(f"阶段 '{stage.display_name or stage.name}' 已从检查点恢复，跳过执行。")
+        return saved
+
+    def _save(self, stage: PipelineStage, output: Any, status: str):
+        if not self.checkpoint:
+            return
+        try:
+            self.checkpoint.save(stage.name, output, status)
+        except Exception as e:
+            logger.warning(f"保存阶段 '{stage.name}' 的检查点失败: {e}")
+
+    def publish(self, stage_name: str, output: Any):
+        """
+        由阶段函数在执行过程中调用，发布阶段性输出（如已转换的前若干页内容）。
+        以 early_inputs 依赖该阶段的下游阶段收到后立即启动；每个阶段只有第一次发布生效。
+        """
+        future = self._early_futures.get(stage_name)
+        if future is not None and not future.done():
+            self._published_at[stage_name] = datetime.datetime.now()
+            logger.info(f"阶段 '{stage_name}' 发布了阶段性输出，提前启动依赖它的阶段。")
+            future.set_result(output)
+
+    def _finish(self, stage_name: str, output: Any):
+        self._futures[stage_name].set_result(output)
+        # 未发布阶段性输出时，提前依赖方收到最终输出
+        if not self._early_futures[stage_name].done():
+            self._early_futures[stage_name].set_result(output)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        执行全部阶段。
+
+        Returns:
+            {阶段名: 输出} 字典。未捕获异常的阶段输出为 None，状态记为“失败”。
+        """
+        loop = asyncio.get_running_loop()
+        futures = self._futures = {name: loop.create_future() for name in self.stages}
+        early_futures = self._early_futures = {name: loop.create_future() for name in self.stages}
+
+        async def run_stage(stage: PipelineStage):
+            inputs = {dep: await futures[dep] for dep in stage.inputs}
+            for dep in stage.early_inputs:
+                inputs[dep] = await early_futures[dep]
+            start = datetime.datetime.now()
+            restored = self._restore(stage)
+            if restored is not None:
+                self.restored.add(stage.name)
+                status = RESTORED_STATUS if restored[1] == "完成" else f"{restored[1]} (检查点恢复)"
+                self._record(stage, status, start, datetime.datetime.now())
+                self._finish(stage.name, restored[0])
+                return
+
+            status = "完成"
+            try:
+                output = await stage.run(inputs)
+                if isinstance(output, StageOutcome):
+                    status = output.status
+                    output = output.output
+            except Exception as e:
+                logger.error(f"阶段 '{stage.display_name or stage.name}' 执行出错: {e}")
+                import traceback
+                logger.debug(f"错误详情: {traceback.format_exc()}")
+                output, status = None, FAILED_STATUS
+            self._save(stage, output, status)
+            self._record(stage, status, start, datetime.datetime.now())
+            self._finish(stage.name, output)
+
+        run_start = datetime.datetime.now()
+        await asyncio.gather(*(run_stage(self.stages[name]) for name in self.order))
+        wall_clock = (datetime.datetime.now() - run_start).total_seconds()
+
+        critical_path, critical_time = self.critical_path()
+        self.stage_costs[WALL_CLOCK_KEY] = wall_clock
+        self.stage_costs[CRITICAL_PATH_KEY] = critical_time
+        logger.info(
+            f"流程墙钟耗时 {wall_clock:.2f} 秒，关键路径耗时 {critical_time:.2f} 秒，"
+            f"关键路径: {' -> '.join(critical_path)}"
+        )
+        return {name: future.result() for name, future in futures.items()}
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        根据各阶段实际耗时计算关键路径（依赖图中耗时之和最大的链）。
+        对 early_inputs 依赖，只计入上游阶段发布阶段性输出之前的耗时。
+
+        Returns:
+            (关键路径上的阶段名列表, 关键路径总耗时秒数)
+        """
+        durations = {
+            name: (end - start).total_seconds() for name, (start, end) in self.timings.items()
+        }
+        best: Dict[str, Tuple[float, Optional[str]]] = {}
+
+        def dep_cost(stage: PipelineStage, dep: str) -> float:
+            if dep in stage.early_inputs and dep in self._published_at and dep in self.timings:
+                dep_start_cost = best[dep][0] - durations.get(dep, 0.0)
+                return dep_start_cost + (self._published_at[dep] - self.timings[dep][0]).total_seconds()
+            return best[dep][0]
+
+        for name in self.order:
+            stage = self.stages[name]
+            prev = max(stage.dependencies, key=lambda d: dep_cost(stage, d), default=None)
+            prev_cost = dep_cost(stage, prev) if prev else 0.0
+            best[name] = (prev_cost + durations.get(name, 0.0), prev)
+
+        if not best:
+            return [], 0.0
+        tail = max(best, key=lambda n: best[n][0])
+        total = best[tail][0]
+        path = []
+        while tail:
+            stage = self.stages[tail]
+            path.append(stage.display_name or stage.name)
+            tail = best[tail][1]
+        return list(reversed(path)), total
@@ -0,0 +1,97 @@
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from slais.utils.logging_utils import logger
+
+
+def load_content_list(markdown_dir, stem: str) -> List[Dict[str, Any]]:
+    """
+    读取转换输出目录中的内容列表 (<stem>_content_list.json)。
+    fast 配置档不生成内容列表，文件不存在或无法解析时返回空列表。
+    """
+    path = Path(markdown_dir) / f"{stem}_content_list.json"
+    if not path.is_file():
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            content_list = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"读取内容列表失败: {path} - {e}")
+        return []
+    return content_list if isinstance(content_list, list) else []
+
+
+def block_caption(block: Dict[str, Any]) -> str:
+    """图片/表格块的图注文本（MinerU 把图注存为字符串列表）。"""
+    caption = block.get("img_caption") or block.get("image_caption") or block.get("table_caption") or []
+    if isinstance(caption, str):
+        return caption.strip()
+    return " ".join(str(part).strip() for part in caption if part).strip()
+
+
+def image_captions(content_list: List[Dict[str, Any]]) -> Dict[str, str]:
+    """图片相对路径 (如 images/image_000.jpg) -> 图注文本，仅包含有图注的图片。"""
+    captions = {}
+    for block in content_list:
+        img_path = block.get("img_path")
+        caption = block_caption(block) if img_path else ""
+        if caption:
+            captions[img_path.replace("\\", "/")] = caption
+    return captions
+
+
+# 图注开头的编号，如 "Figure 3."、"Fig. 2b"、"Table 1"、"图3"、"表 2"
+_LABEL_PATTERN = re.compile(r"^\s*(fig(?:ure)?s?\.?|tables?|图|表)\s*(\d+)", re.IGNORECASE)
+_MENTION_PATTERNS = {
+    "figure": r"(?:\bfig(?:ure)?s?\.?|图)\s*{number}(?!\d)",
+    "table": r"(?:\btables?|表)\s*{number}(?!\d)",
+}
+
+
+def _figure_label(caption: str) -> Optional[Tuple[str, str]]:
+    match = _LABEL_PATTERN.match(caption)
+    if not match:
+        return None
+    kind = "table" if match.group(1).lower().startswith("table") or match.group(1) == "表" else "figure"
+    return kind, match.group(2)
+
+
+def image_contexts(content_list: List[Dict[str, Any]], max_chars: int = 1500) -> Dict[str, str]:
+    """
+    为每张图片收集正文中的相关段落：先取引用该图编号（由图注开头的 Figure N / Table N 得出）的段落，
+    再取图片前后相邻的文本块，合计不超过 max_chars 个字符。
+
+    Returns:
+        图片相对路径 -> 相关段落文本，仅包含找到段落的图片
+    """
+    texts = [
+        (idx, block["text"].strip()) for idx, block in enumerate(content_list)
+        if block.get("type") == "text" and isinstance(block.get("text"), str) and block["text"].strip()
+    ]
+    contexts = {}
+    for idx, block in enumerate(content_list):
+        img_path = block.get("img_path")
+        if not img_path:
+            continue
+
+        candidates = []
+        label = _figure_label(block_caption(block))
+        if label:
+            kind, number = label
+            mention = re.compile(_MENTION_PATTERNS[kind].format(number=number), re.IGNORECASE)
+            candidates.extend(text for _, text in texts if mention.search(text))
+        before = [text for text_idx, text in texts if text_idx < idx]
+        after = [text for text_idx, text in texts if text_idx > idx]
+        candidates.extend(before[-1:] + after[:1])
+
+        parts, used = [], 0
+        for text in dict.fromkeys(candidates):
+            if used >= max_chars:
+                break
+            parts.append(text[:max_chars - used])
+            used += len(parts[-1])
+        if parts:
+            contexts[img_path.replace("\\", "/")] = "\n\n".join(parts)
+    return contexts
@@ -0,0 +1,19 @@
+import hashlib
+
+
+def sha256_file(file_path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的 SHA-256 摘要（分块读取，适用于大文件）。
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        十六进制摘要字符串
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
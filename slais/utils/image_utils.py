@@ -0,0 +1,250 @@
+import io
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from slais.utils.logging_utils import logger
+
+# 文件头魔数 -> MIME 类型
+_MAGIC_NUMBERS = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+# 视觉模型接口普遍直接接受的格式，其他格式（BMP、TIFF等）必须转码
+UPLOAD_SAFE_MIME_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+
+_PIL_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+
+def detect_mime_type(data: bytes) -> Optional[str]:
+    """根据文件头判断图片的真实 MIME 类型，无法识别时返回 None。"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime
+    return None
+
+
+def prepare_image_for_upload(data: bytes, max_long_edge: int = 0, target_format: str = "jpeg",
+                             quality: int = 85) -> Tuple[bytes, str]:
+    """
+    把图片规范化为适合上传给视觉模型的大小和格式（同步函数，应在线程中调用）。
+
+    Args:
+        data: 原始图片字节
+        max_long_edge: 长边上限（像素），超过时等比缩小；0 表示不缩放
+        target_format: 目标格式 jpeg/png/webp；original 表示仅在必须时转码（缩放或格式不被接口支持）
+        quality: JPEG/WebP 编码质量
+
+    Returns:
+        (图片字节, MIME 类型)。转码结果不比原图小且原图无需缩放、格式可直接上传时返回原图。
+    """
+    original_mime = detect_mime_type(data)
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            needs_resize = bool(max_long_edge) and max(img.size) > max_long_edge
+            if not needs_resize and original_mime in UPLOAD_SAFE_MIME_TYPES and (
+                target_format == "original" or original_mime == f"image/{target_format}"
+            ):
+                return data, original_mime
+
+            fmt = target_format
+            if fmt == "original":
+                fmt = original_mime.split("/")[1] if original_mime in UPLOAD_SAFE_MIME_TYPES else "png"
+                if fmt == "gif":
+                    fmt = "png"  # 动图只取首帧
+
+            if needs_resize:
+                img.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS)
+            img = _convert_mode(img, fmt)
+
+            buffer = io.BytesIO()
+            save_kwargs = {"optimize": True}
+            if fmt in ("jpeg", "webp"):
+                save_kwargs["quality"] = quality
+            img.save(buffer, format=_PIL_FORMATS[fmt], **save_kwargs)
+            encoded = buffer.getvalue()
+    except Exception as e:
+        logger.warning(f"图片预处理失败，将上传原图: {e}")
+        return data, original_mime or "image/jpeg"
+
+    if not needs_resize and original_mime in UPLOAD_SAFE_MIME_TYPES and len(encoded) >= len(data):
+        return data, original_mime
+    return encoded, f"image/{fmt}"
+
+
+def image_pixels(data: bytes) -> int:
+    """图片像素数（只读文件头），无法解码时返回 0。"""
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+    except Exception:
+        return 0
+    return width * height
+
+
+def _convert_mode(img, fmt: str):
+    """按目标格式转换颜色模式；JPEG 不支持透明通道，透明区域铺白色背景（与论文页面一致）。"""
+    from PIL import Image
+
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if fmt == "jpeg":
+        if img.mode in ("RGBA", "LA"):
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            return background
+        if img.mode not in ("RGB", "L"):
+            return img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        return img.convert("RGB")
+    return img
+
+
+# ---------------------------------------------------------------------------
+# 感知哈希去重
+# ---------------------------------------------------------------------------
+
+_HASH_SIZE = 8
+_PHASH_SAMPLE = 32
+_ENTROPY_SAMPLE = 256
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """n 点 DCT-II 变换矩阵（正交归一化），二维DCT为 M @ X @ M.T。"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_PHASH_SAMPLE)
+
+
+@dataclass
+class ImageFingerprint:
+    """图片的感知哈希（各64位，以布尔数组表示）、原始尺寸和灰度像素熵（比特）。"""
+    ahash: np.ndarray
+    phash: np.ndarray
+    width: int
+    height: int
+    entropy: float = 0.0
+
+
+def image_fingerprint(data: bytes) -> Optional[ImageFingerprint]:
+    """
+    计算图片的 aHash、pHash 和像素熵（灰度缩略图上的向量化运算），无法解码时返回 None。
+    两种哈希都对缩放和重新压缩不敏感，可用于识别同一图片的不同分辨率版本。
+    """
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+            gray = img.convert("L")
+            small = np.asarray(gray.resize((_HASH_SIZE, _HASH_SIZE), Image.BILINEAR), dtype=np.float32)
+            sample = np.asarray(gray.resize((_PHASH_SAMPLE, _PHASH_SAMPLE), Image.BILINEAR), dtype=np.float32)
+            gray.thumbnail((_ENTROPY_SAMPLE, _ENTROPY_SAMPLE))
+            histogram = np.bincount(np.asarray(gray).ravel(), minlength=256).astype(np.float64)
+    except Exception as e:
+        logger.debug(f"计算图片感知哈希失败: {e}")
+        return None
+
+    ahash = (small > small.mean()).ravel()
+    # pHash：取二维DCT的低频 8x8 系数（去掉直流分量后）与中位数比较
+    low_freq = (_DCT @ sample @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    phash = low_freq > np.median(low_freq[1:])
+    probabilities = histogram[histogram > 0] / histogram.sum()
+    entropy = float(-(probabilities * np.log2(probabilities)).sum())
+    return ImageFingerprint(ahash=ahash, phash=phash, width=width, height=height, entropy=entropy)
+
+
+def score_image_relevance(fingerprint: ImageFingerprint, has_caption: bool = False, min_size: int = 100,
+                          max_aspect: float = 8.0, min_entropy: float = 2.0,
+                          caption_bonus: float = 0.5) -> Tuple[float, List[str]]:
+    """
+    估计图片是否值得交给视觉模型分析（0-1，越高越相关）。
+
+    短边、宽高比、像素熵三项各得 0-1 分（达到阈值即满分）后相乘，任一项过差都会拉低总分；
+    有图注的图片另加 caption_bonus。用于识别图标、期刊标志、分隔线和近乎空白的裁剪图。
+
+    Returns:
+        (得分, 未达标项的说明列表)
+    """
+    width, height = fingerprint.width, fingerprint.height
+    reasons = []
+
+    short_edge = min(width, height)
+    size_score = min(1.0, short_edge / min_size) if min_size else 1.0
+    if size_score < 1.0:
+        reasons.append(f"尺寸过小 ({width}x{height})")
+
+    aspect = max(width, height) / max(1, short_edge)
+    aspect_score = min(1.0, max_aspect / aspect) if max_aspect else 1.0
+    if aspect_score < 1.0:
+        reasons.append(f"宽高比异常 ({aspect:.1f}:1)")
+
+    entropy_score = min(1.0, fingerprint.entropy / min_entropy) if min_entropy else 1.0
+    if entropy_score < 1.0:
+        reasons.append(f"像素熵过低 ({fingerprint.entropy:.2f} bit)")
+
+    score = size_score * aspect_score * entropy_score
+    if has_caption:
+        score = min(1.0, score + caption_bonus)
+    return round(score, 3), reasons
+
+
+def find_duplicate_images(fingerprints: List[Optional[ImageFingerprint]], max_distance: int = 6,
+                          max_aspect_diff: float = 0.1) -> List[int]:
+    """
+    按感知哈希把图片聚类，返回每张图片所属簇的代表图片下标（代表为簇中像素最多的图片）。
+
+    两张图片的 aHash 和 pHash 汉明距离都不超过 max_distance、且宽高比相差不超过 max_aspect_diff
+    时视为重复；重复关系传递合并。无法计算哈希的图片只代表自己。
+    """
+    n = len(fingerprints)
+    valid = [i for i, fp in enumerate(fingerprints) if fp is not None]
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(valid) > 1:
+        ahashes = np.stack([fingerprints[i].ahash for i in valid])
+        phashes = np.stack([fingerprints[i].phash for i in valid])
+        aspects = np.array([fingerprints[i].width / max(1, fingerprints[i].height) for i in valid])
+        # 两两汉明距离 (N, N)
+        a_dist = (ahashes[:, None, :] != ahashes[None, :, :]).sum(axis=2)
+        p_dist = (phashes[:, None, :] != phashes[None, :, :]).sum(axis=2)
+        aspect_diff = np.abs(aspects[:, None] - aspects[None, :]) / np.maximum(aspects[:, None], aspects[None, :])
+        similar = (a_dist <= max_distance) & (p_dist <= max_distance) & (aspect_diff <= max_aspect_diff)
+        for a, b in zip(*np.nonzero(np.triu(similar, k=1))):
+            root_a, root_b = find(valid[a]), find(valid[b])
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    representative = {}
+    for i in valid:
+        root = find(i)
+        best = representative.get(root)
+        area = fingerprints[i].width * fingerprints[i].height
+        if best is None or area > fingerprints[best].width * fingerprints[best].height:
+            representative[root] = i
+    return [representative.get(find(i), i) for i in range(n)]
@@ -0,0 +1,52 @@
+import re
+from typing import List, Tuple
+
+# Markdown 标题行 (# 至 ######)
+_HEADING_PATTERN = re.compile(r"^#{1,6}\s+\S", re.MULTILINE)
+
+
+def split_markdown_sections(markdown: str) -> List[Tuple[str, str]]:
+    """
+    按标题行把 Markdown 切分为章节。
+
+    Returns:
+        (标题, 含标题行的章节文本) 列表；第一个标题之前的内容（如题名、摘要）标题为空字符串。
+    """
+    starts = [match.start() for match in _HEADING_PATTERN.finditer(markdown)]
+    if not starts or starts[0] != 0:
+        starts = [0] + starts
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(markdown)]):
+        text = markdown[start:end].strip()
+        if not text:
+            continue
+        first_line = text.split("\n", 1)[0]
+        title = first_line.lstrip("#").strip() if first_line.startswith("#") else ""
+        sections.append((title, text))
+    return sections
+
+
+def chunk_markdown(markdown: str, max_chars: int) -> List[str]:
+    """
+    按章节边界把 Markdown 合并为不超过 max_chars 个字符的分块（相邻小章节合并到同一分块）。
+    单个章节超过上限时按段落切分，单个段落仍超过上限时按字符切分。
+    """
+    pieces = []
+    for _, text in split_markdown_sections(markdown):
+        if len(text) <= max_chars:
+            pieces.append(text)
+            continue
+        for paragraph in text.split("\n\n"):
+            pieces.extend(paragraph[i:i + max_chars] for i in range(0, len(paragraph), max_chars))
+
+    chunks, current = [], ""
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if current and len(candidate) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,36 @@
+import asyncio
+import time
+from typing import Optional
+
+from slais.utils.logging_utils import logger
+
+
+class TokenBucket:
+    """令牌桶限速器：按每分钟速率补充令牌，允许不超过 burst_limit 的突发请求。"""
+
+    def __init__(self, rate_per_minute: float, burst_limit: Optional[int] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst_limit = burst_limit if burst_limit is not None else max(10, int(rate_per_minute / 3))
+        self.tokens = float(self.burst_limit)
+        self.last_update = time.time()
+        self.lock = asyncio.Lock()
+
+    async def get_token(self) -> float:
+        async with self.lock:
+            now = time.time()
+            elapsed = now - self.last_update
+            new_tokens = elapsed * self.rate_per_second
+            self.tokens = min(float(self.burst_limit), self.tokens + new_tokens)
+            self.last_update = now
+        
+            # 无论是否需要等待都预留一个令牌（余额可为负），并发等待者因此依次错开，而不会同时醒来
+            self.tokens -= 1.0
+            if self.tokens >= 0.0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+    async def wait_for_token(self) -> None:
+        wait_time = await self.get_token()
+        if wait_time > 0:
+            logger.debug(f"[TokenBucket] 等待 {wait_time:.2f} 秒")
+            await asyncio.sleep(wait_time)
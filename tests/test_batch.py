@@ -0,0 +1,76 @@
+"""
+测试批处理清单解析与批次汇总 (slais/batch.py)
+"""
+import unittest
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais.batch import load_manifest, collect_pdf_dir, summarize_batch
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp_dir.name)
+
+    def test_load_csv_manifest_resolves_relative_paths(self):
+        """CSV清单中的相对路径应以清单所在目录为基准"""
+        manifest = self.base / "papers.csv"
+        manifest.write_text("pdf_path,doi\na.pdf,10.1000/a\n,10.1000/skip\n/abs/b.pdf,\n", encoding="utf-8")
+        jobs = load_manifest(str(manifest))
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0], {"pdf_path": str(self.base / "a.pdf"), "doi": "10.1000/a"})
+        self.assertEqual(jobs[1], {"pdf_path": "/abs/b.pdf", "doi": ""})
+
+    def test_load_jsonl_manifest_skips_invalid_lines(self):
+        """JSONL清单中无效的行应被跳过"""
+        manifest = self.base / "papers.jsonl"
+        lines = [json.dumps({"pdf_path": "a.pdf", "doi": "10.1000/a"}), "not json", ""]
+        manifest.write_text("\n".join(lines), encoding="utf-8")
+        jobs = load_manifest(str(manifest))
+        self.assertEqual(jobs, [{"pdf_path": str(self.base / "a.pdf"), "doi": "10.1000/a"}])
+
+    def test_collect_pdf_dir_extracts_doi(self):
+        """目录模式应从PDF文本中识别DOI"""
+        import fitz
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), "Published: doi 10.1126/science.aao4593.")
+        doc.save(str(self.base / "paper.pdf"))
+        doc.close()
+
+        jobs = collect_pdf_dir(str(self.base))
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]["doi"], "10.1126/science.aao4593")
+
+    def test_summarize_batch(self):
+        """批次汇总应统计吞吐量、失败数量和Token花费"""
+        records = [
+            {"pdf_path": "a.pdf", "status": "成功", "elapsed_seconds": 100.0,
+             "total_token_usage": {"total_prompt_tokens": 10, "total_completion_tokens": 5, "total_tokens": 15, "total_cost": 0.5}},
+            {"pdf_path": "b.pdf", "status": "成功", "elapsed_seconds": 200.0,
+             "total_token_usage": {"total_prompt_tokens": 20, "total_completion_tokens": 5, "total_tokens": 25, "total_cost": 1.0}},
+            {"pdf_path": "c.pdf", "status": "失败", "error": "boom", "elapsed_seconds": 0.0},
+        ]
+        summary = summarize_batch(records, elapsed_seconds=1800.0)
+        self.assertEqual(summary["papers_succeeded"], 2)
+        self.assertEqual(summary["papers_failed"], 1)
+        self.assertAlmostEqual(summary["papers_per_hour"], 4.0)
+        self.assertEqual(summary["token_usage"]["total_tokens"], 40)
+        self.assertAlmostEqual(summary["token_usage"]["total_cost"], 1.5)
+        self.assertEqual(summary["failures"][0]["error"], "boom")
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
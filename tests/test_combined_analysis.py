@@ -0,0 +1,126 @@
+"""
+测试合并分析智能体：一次请求返回五项分析，无法解析的部分由流程改用各智能体单独生成 (agents/llm_analysis_agent.py)
+"""
+import unittest
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from agents.llm_analysis_agent import CombinedAnalysisAgent
+
+
+def fake_llm(response_text: str, prompts: list):
+    """记录提示词并返回固定回答的LLM"""
+    def respond(prompt_value):
+        prompts.append(prompt_value.to_string())
+        return AIMessage(content=response_text)
+    return RunnableLambda(respond)
+
+
+class TestCombinedAnalysisAgent(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_patch = mock.patch.object(config.settings, "CACHE_DIR", self.tmp_dir.name)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_all_sections_from_one_request(self):
+        """一次请求解析出全部五项，内容只在提示词中出现一次"""
+        response = json.dumps({
+            "methodology_analysis": "## 研究方法评估\n实验研究",
+            "innovation_extraction": "## 核心创新与应用前景\n新方法",
+            "questions": ["问题一？", " 问题二？ ", ""],
+            "story": "从前……",
+            "mindmap": "graph TD\n    A[标题] --> B(引言)",
+        }, ensure_ascii=False)
+        prompts = []
+        agent = CombinedAnalysisAgent(fake_llm("```json\n" + response + "\n```", prompts))
+        results = asyncio.run(agent.analyze_all("独一无二的文献内容"))
+
+        self.assertEqual(set(results), set(CombinedAnalysisAgent.SECTIONS))
+        self.assertEqual(results["questions"], ["问题一？", "问题二？"])
+        self.assertIn("```mermaid", results["mindmap"])
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(prompts[0].count("独一无二的文献内容"), 1)
+
+    def test_unparseable_sections_are_omitted(self):
+        """类型不符或缺失的部分不出现在结果中；整体无法解析时返回空字典"""
+        response = json.dumps({"methodology_analysis": "方法", "questions": "不是列表", "story": ""}, ensure_ascii=False)
+        results = asyncio.run(CombinedAnalysisAgent(fake_llm(response, [])).analyze_all("内容A"))
+        self.assertEqual(results, {"methodology_analysis": "方法"})
+
+        results = asyncio.run(CombinedAnalysisAgent(fake_llm("抱歉，无法完成。", [])).analyze_all("内容B"))
+        self.assertEqual(results, {})
+
+    def test_unparseable_response_is_not_cached(self):
+        """截断或非JSON的回答不写入缓存，下次运行重新请求；可解析的回答被缓存"""
+        broken_prompts = []
+        truncated = '{"methodology_analysis": "方法", "story": "从前'
+        asyncio.run(CombinedAnalysisAgent(fake_llm(truncated, broken_prompts)).analyze_all("内容C"))
+        retry_prompts = []
+        results = asyncio.run(CombinedAnalysisAgent(fake_llm('{"story": "从前"}', retry_prompts)).analyze_all("内容C"))
+        self.assertEqual(len(retry_prompts), 1)
+        self.assertEqual(results, {"story": "从前"})
+
+        cached_prompts = []
+        results = asyncio.run(CombinedAnalysisAgent(fake_llm("不会被调用", cached_prompts)).analyze_all("内容C"))
+        self.assertEqual(cached_prompts, [])
+        self.assertEqual(results, {"story": "从前"})
+
+    def test_pipeline_falls_back_for_missing_sections(self):
+        """流程只对合并分析缺失的部分调用对应智能体"""
+        from app import process_article_pipeline
+        from tests.test_stage_graph import FakeAgent
+
+        class CountingAgent(FakeAgent):
+            def __init__(self):
+                super().__init__(delay=0.01)
+                self.called = []
+
+            def analyze_methodology(self, content, callbacks=None):
+                self.called.append("methodology_analysis")
+                return super().analyze_methodology(content, callbacks)
+
+            def generate_mindmap(self, content, callbacks=None):
+                self.called.append("mindmap")
+                return self._sleep_and_return("脑图")
+
+        class PartialCombined:
+            async def analyze_all(self, content, callbacks=None):
+                return {"innovation_extraction": "创新", "questions": ["问题A"], "story": "故事"}
+
+        fake = CountingAgent()
+        agents = {name: fake for name in [
+            "pdf_parser", "metadata_fetcher", "methodology_analyzer", "innovation_extractor",
+            "qa_generator", "storytelling_agent", "mindmap_agent", "deep_analyzer", "image_agent"
+        ]}
+        agents.update({"llm": None, "image_llm": None, "combined_analyzer": PartialCombined()})
+
+        fake_encoding = mock.Mock(encode=lambda text: text.split())
+        with mock.patch.object(config.settings, "LLM_COMBINED_ANALYSIS", True), \
+                mock.patch("tiktoken.encoding_for_model", return_value=fake_encoding):
+            result = asyncio.run(process_article_pipeline(
+                "no_such_dir/combined_test_paper.pdf", "10.1000/y", "test@example.com", agents=agents
+            ))
+        results = result["analysis_results"]
+        self.assertEqual(sorted(fake.called), ["methodology_analysis", "mindmap"])
+        self.assertEqual((results["story"], results["mindmap"]), ("故事", "脑图"))
+        self.assertEqual(results["qa_pairs"], [{"question": "问题A", "answer": "答"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
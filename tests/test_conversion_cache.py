@@ -0,0 +1,114 @@
+"""
+测试按PDF内容寻址的转换缓存 (agents/cache/conversion_cache.py) 及 PDFParsingAgent 的缓存复用
+"""
+import unittest
+import os
+import sys
+import asyncio
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from agents.cache.conversion_cache import ConversionCache
+from agents.pdf_parsing_agent import PDFParsingAgent
+from slais.pdf_utils import paper_output_dir
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp_dir.name)
+        self.patches = [
+            mock.patch.object(config.settings, "CACHE_DIR", str(self.base / "cache")),
+            mock.patch.object(config.settings, "OUTPUT_BASE_DIR", str(self.base / "output")),
+            mock.patch.object(config, "OUTPUT_BASE_DIR", str(self.base / "output")),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def make_conversion(self, markdown_dir, stem):
+        markdown_dir.mkdir(parents=True, exist_ok=True)
+        (markdown_dir / f"{stem}.md").write_text("# Paper\n\n![](images/image_000.jpg)", encoding="utf-8")
+        (markdown_dir / "images").mkdir(exist_ok=True)
+        (markdown_dir / "images" / "image_000.jpg").write_bytes(b"jpg")
+        (markdown_dir / f"{stem}_content_list.json").write_text("[]", encoding="utf-8")
+
+    def test_store_and_materialize_under_another_name(self):
+        """缓存条目可以以任意文件名恢复到输出目录，debug 条目可满足 standard 请求"""
+        cache = ConversionCache()
+        source_dir = self.base / "output" / "a" / "a_markdown"
+        self.make_conversion(source_dir, "a")
+        cache.store("abc", "debug", source_dir, "a", "a.pdf")
+
+        self.assertIsNone(cache.find("other", "standard"))
+        entry = cache.find("abc", "standard")
+        self.assertIsNotNone(entry)
+
+        target_dir = self.base / "output" / "tmp123" / "tmp123_markdown"
+        md_path = cache.materialize(entry, target_dir, "tmp123")
+        self.assertEqual(md_path, target_dir / "tmp123.md")
+        self.assertTrue((target_dir / "images" / "image_000.jpg").exists())
+        self.assertTrue((target_dir / "tmp123_content_list.json").exists())
+
+    def test_repeat_upload_skips_conversion(self):
+        """内容相同、文件名不同的PDF只转换一次"""
+        pdf_a = self.base / "upload_a.pdf"
+        pdf_b = self.base / "upload_b.pdf"
+        pdf_a.write_bytes(b"%PDF-1.4 same content")
+        pdf_b.write_bytes(b"%PDF-1.4 same content")
+        calls = []
+
+        async def fake_convert(pdf_path, output_dir, profile=None, on_segment=None, lead_budget=None):
+            calls.append(pdf_path)
+            stem = Path(pdf_path).stem
+            markdown_dir = Path(output_dir) / f"{stem}_markdown"
+            self.make_conversion(markdown_dir, stem)
+            return str(markdown_dir / f"{stem}.md")
+
+        agent = PDFParsingAgent()
+        with mock.patch.object(agent, "_convert", fake_convert):
+            first = asyncio.run(agent.extract_content(str(pdf_a)))
+            second = asyncio.run(agent.extract_content(str(pdf_b)))
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue((paper_output_dir(pdf_b) / "upload_b_markdown" / "images" / "image_000.jpg").exists())
+
+    def test_same_named_pdfs_use_separate_output_dirs(self):
+        """不同目录下内容不同的同名PDF各自使用独立的输出目录，图片不会互相覆盖"""
+        (self.base / "a").mkdir()
+        (self.base / "b").mkdir()
+        pdf_a = self.base / "a" / "paper.pdf"
+        pdf_b = self.base / "b" / "paper.pdf"
+        pdf_a.write_bytes(b"%PDF-1.4 first paper")
+        pdf_b.write_bytes(b"%PDF-1.4 second paper")
+
+        async def fake_convert(pdf_path, output_dir, profile=None, on_segment=None, lead_budget=None):
+            markdown_dir = Path(output_dir) / "paper_markdown"
+            self.make_conversion(markdown_dir, "paper")
+            (markdown_dir / "images" / "image_000.jpg").write_bytes(Path(pdf_path).read_bytes())
+            return str(markdown_dir / "paper.md")
+
+        agent = PDFParsingAgent()
+        with mock.patch.object(agent, "_convert", fake_convert):
+            asyncio.run(agent.extract_content(str(pdf_a)))
+            asyncio.run(agent.extract_content(str(pdf_b)))
+        dir_a, dir_b = paper_output_dir(pdf_a), paper_output_dir(pdf_b)
+        self.assertNotEqual(dir_a, dir_b)
+        self.assertTrue(dir_a.name.startswith("paper_"))
+        self.assertEqual((dir_a / "paper_markdown" / "images" / "image_000.jpg").read_bytes(), pdf_a.read_bytes())
+        self.assertEqual((dir_b / "paper_markdown" / "images" / "image_000.jpg").read_bytes(), pdf_b.read_bytes())
+
+    def tearDown(self):
+        """清理测试环境"""
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
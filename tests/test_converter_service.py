@@ -0,0 +1,66 @@
+"""
+测试常驻PDF转换服务 (slais/converter_service.py) 的服务端与客户端
+"""
+import unittest
+import os
+import sys
+import asyncio
+import tempfile
+from unittest import mock
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp.test_utils import TestServer
+from slais import config
+from slais import converter_service
+
+
+def fake_convert(pdf_path, output_dir=None, profile=None):
+    return os.path.join(output_dir, "paper.md")
+
+
+class TestConverterService(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pdf_path = os.path.join(self.tmp_dir.name, "paper.pdf")
+        with open(self.pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+
+    def test_client_uses_running_service(self):
+        """服务运行时客户端可检测到并提交转换任务"""
+        async def scenario():
+            server = TestServer(converter_service.create_app())
+            await server.start_server()
+            try:
+                url = str(server.make_url("")).rstrip("/")
+                with mock.patch.object(config.settings, "PDF_CONVERTER_URL", url):
+                    self.assertTrue(await converter_service.is_converter_available())
+                    md_path = await converter_service.convert_via_service(self.pdf_path, self.tmp_dir.name)
+                    with self.assertRaises(RuntimeError):
+                        await converter_service.convert_via_service(os.path.join(self.tmp_dir.name, "missing.pdf"))
+                return md_path
+            finally:
+                await server.close()
+
+        with mock.patch.object(config.settings, "PDF_CONVERSION_WORKERS", 0), \
+             mock.patch("slais.pdf_utils.preload_models"), \
+             mock.patch("slais.pdf_utils.convert_pdf_to_markdown_sync", fake_convert):
+            md_path = asyncio.run(scenario())
+        self.assertEqual(md_path, os.path.join(os.path.realpath(self.tmp_dir.name), "paper.md"))
+
+    def test_unreachable_service_is_reported_unavailable(self):
+        """未配置或无法连接的服务应视为不可用"""
+        with mock.patch.object(config.settings, "PDF_CONVERTER_URL", ""):
+            self.assertFalse(asyncio.run(converter_service.is_converter_available()))
+        with mock.patch.object(config.settings, "PDF_CONVERTER_URL", "http://127.0.0.1:9"):
+            self.assertFalse(asyncio.run(converter_service.is_converter_available()))
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
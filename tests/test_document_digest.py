@@ -0,0 +1,113 @@
+"""
+测试长文献 map-reduce 模式：按章节分块与分块要点提取 (slais/utils/markdown_utils.py, agents/llm_analysis_agent.py)
+"""
+import unittest
+import asyncio
+import os
+import re
+import sys
+import tempfile
+from unittest import mock
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from slais.utils.markdown_utils import chunk_markdown, split_markdown_sections
+from agents.llm_analysis_agent import DocumentDigestAgent
+
+
+def make_paper(section_chars: int) -> str:
+    sections = ["Title\n\nAbstract text."]
+    for name in ("Introduction", "Methods", "Results", "Discussion"):
+        sections.append(f"# {name}\n\n" + (f"{name} sentence. " * (section_chars // 20)))
+    return "\n\n".join(sections)
+
+
+class SummaryLLM:
+    """返回分块首个章节名作为要点，并记录同时进行的请求数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def respond(self, prompt_value):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.02)
+            fragment = prompt_value.to_string().split("文献片段：", 1)[1]
+            headings = re.findall(r"^# (\w+)", fragment, re.MULTILINE)
+            return AIMessage(content="- 要点：" + ", ".join(headings or ["开头"]))
+        finally:
+            self.active -= 1
+
+    def runnable(self):
+        return RunnableLambda(self.respond)
+
+
+class TestMarkdownChunking(unittest.TestCase):
+    def test_split_sections(self):
+        """按标题切分章节，标题前的内容标题为空"""
+        sections = split_markdown_sections(make_paper(100))
+        self.assertEqual([title for title, _ in sections], ["", "Introduction", "Methods", "Results", "Discussion"])
+
+    def test_chunks_respect_limit_and_section_boundaries(self):
+        """小章节合并到同一分块，超长章节按段落或字符切分，内容不丢失"""
+        chunks = chunk_markdown(make_paper(400), 1000)
+        self.assertLess(len(chunks), 5)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+        self.assertTrue(all(chunk.startswith("# ") for chunk in chunks[1:]))
+
+        long_chunks = chunk_markdown(make_paper(3000), 1000)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in long_chunks))
+        self.assertIn("Discussion sentence.", long_chunks[-1])
+
+
+class TestDocumentDigestAgent(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(config.settings, "CACHE_DIR", self.tmp_dir.name),
+            mock.patch.object(config.settings, "MAX_CONTENT_CHARS_FOR_LLM", 2000),
+            mock.patch.object(config.settings, "LLM_MAP_CHUNK_CHARS", 1500),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_short_content_is_returned_unchanged(self):
+        llm = SummaryLLM()
+        content = make_paper(100)
+        self.assertEqual(asyncio.run(DocumentDigestAgent(llm.runnable()).digest(content)), content)
+        self.assertEqual(llm.calls, 0)
+
+    def test_digest_covers_all_sections_in_parallel_and_is_cached(self):
+        """每个分块并行提取要点（不超过并发上限），摘要覆盖到结尾章节且不超过内容上限；再次处理时使用缓存"""
+        paper = make_paper(1400)
+        llm = SummaryLLM()
+        digest = asyncio.run(DocumentDigestAgent(llm.runnable(), max_concurrency=2).digest(paper))
+
+        chunk_count = len(chunk_markdown(paper, 1500))
+        self.assertEqual(llm.calls, chunk_count)
+        self.assertEqual(llm.max_active, 2)
+        self.assertIn("Discussion", digest)
+        self.assertLessEqual(len(digest), 2000)
+
+        cached_llm = SummaryLLM()
+        self.assertEqual(asyncio.run(DocumentDigestAgent(cached_llm.runnable()).digest(paper)), digest)
+        self.assertEqual(cached_llm.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
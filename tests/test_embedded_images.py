@@ -0,0 +1,56 @@
+"""
+测试用 PyMuPDF 直接导出PDF嵌入图片 (slais/pdf_utils.py: extract_embedded_images)
+"""
+import unittest
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais.pdf_utils import extract_embedded_images, EMBEDDED_IMAGE_INDEX_FILE
+
+
+class TestEmbeddedImages(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp_dir.name)
+
+    def test_exports_images_with_page_and_bbox(self):
+        """导出的图片带有页码和位置，小图标被跳过，重复使用的图片只导出一次"""
+        import fitz
+        figure = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 100), False)
+        figure.set_rect(figure.irect, (200, 30, 30))
+        icon = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 16, 16), False)
+
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(10, 10, 30, 30), pixmap=icon)
+        page = doc.new_page()
+        xref = page.insert_image(fitz.Rect(50, 100, 250, 200), pixmap=figure)
+        doc.new_page().insert_image(fitz.Rect(50, 100, 250, 200), xref=xref)
+        pdf_path = self.base / "figures.pdf"
+        doc.save(str(pdf_path))
+        doc.close()
+
+        out_dir = self.base / "embedded_images"
+        images = extract_embedded_images(str(pdf_path), str(out_dir), min_size=64)
+        self.assertEqual(len(images), 1)
+        self.assertEqual(images[0]["page_idx"], 1)
+        self.assertEqual(images[0]["bbox"], [50.0, 100.0, 250.0, 200.0])
+        self.assertTrue(os.path.exists(images[0]["path"]))
+
+        index = json.loads((out_dir / EMBEDDED_IMAGE_INDEX_FILE).read_text(encoding="utf-8"))
+        self.assertEqual(index[0]["path"], os.path.basename(images[0]["path"]))
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
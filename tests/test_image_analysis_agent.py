@@ -0,0 +1,314 @@
+"""
+测试图片分析智能体的并发限制、限流重试、结果缓存与统计 (agents/image_analysis_agent.py)
+"""
+import unittest
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import openai
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from agents.image_analysis_agent import ImageAnalysisAgent, summarize_image_analysis
+from agents.llm_scheduler import LLMScheduler
+
+
+def rate_limit_error(retry_after: str) -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class FakeVisionLLM:
+    """记录同时进行的请求数；指定的调用序号返回429。"""
+
+    def __init__(self, fail_calls=(), slow_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.slow_calls = set(slow_calls)
+        self.calls = 0
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+
+    async def ainvoke(self, messages, config=None):
+        self.calls += 1
+        self.prompts.append(messages[0].content[0]["text"])
+        call = self.calls
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(5 if call in self.slow_calls else 0.01)
+            if call in self.fail_calls:
+                raise rate_limit_error("0")
+            return SimpleNamespace(content=f"描述{call}")
+        finally:
+            self.active -= 1
+
+
+class FakePackLLM(FakeVisionLLM):
+    """多图请求按编号返回JSON数组，omit 中的编号不返回。"""
+
+    def __init__(self, omit=()):
+        super().__init__()
+        self.omit = set(omit)
+        self.image_counts = []
+
+    async def ainvoke(self, messages, config=None):
+        count = sum(1 for part in messages[0].content if part["type"] == "image_url")
+        self.image_counts.append(count)
+        if count == 1:
+            return await super().ainvoke(messages, config)
+        self.calls += 1
+        items = [{"index": n, "description": f"打包描述{n}"} for n in range(1, count + 1) if n not in self.omit]
+        return SimpleNamespace(content="```json\n" + json.dumps(items, ensure_ascii=False) + "\n```")
+
+
+class TestImageAnalysisAgent(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_patch = mock.patch.object(config.settings, "CACHE_DIR", str(Path(self.tmp_dir.name) / "cache"))
+        self.cache_patch.start()
+        self.image_paths = []
+        for i in range(6):
+            path = Path(self.tmp_dir.name) / f"img{i}.jpg"
+            path.write_bytes(f"fake image bytes {i}".encode())
+            self.image_paths.append(str(path))
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_concurrency_is_bounded(self):
+        """同时进行的图片请求数不超过并发上限"""
+        llm = FakeVisionLLM()
+        agent = ImageAnalysisAgent(llm, max_concurrency=2, requests_per_minute=0)
+        results = asyncio.run(agent.analyze_images(self.image_paths))
+
+        self.assertEqual(len(results), 6)
+        self.assertLessEqual(llm.max_active, 2)
+        self.assertFalse(any(r["failed"] for r in results))
+        self.assertEqual([r["image_path"] for r in results], self.image_paths)
+
+    def test_image_limits_do_not_override_text_lane(self):
+        """文本和图片使用同一模型时，图片的并发与RPM限制设置在独立通道上，不覆盖文本请求的限制"""
+        scheduler = LLMScheduler()
+        llm = FakeVisionLLM()
+        llm.model_name = "multimodal-model"
+        scheduler.configure("multimodal-model", max_concurrency=7, requests_per_minute=0)
+        with mock.patch("agents.image_analysis_agent.get_scheduler", return_value=scheduler):
+            agent = ImageAnalysisAgent(llm, max_concurrency=2, requests_per_minute=5)
+            asyncio.run(agent.analyze_images(self.image_paths[:1]))
+
+        metrics = scheduler.metrics()
+        self.assertEqual(scheduler._lane("multimodal-model").max_concurrency, 7)
+        self.assertEqual(scheduler._lane("multimodal-model").requests_per_minute, 0)
+        vision_lane = scheduler._lane("multimodal-model:vision")
+        self.assertEqual((vision_lane.max_concurrency, vision_lane.requests_per_minute), (2, 5))
+        self.assertEqual(metrics["multimodal-model:vision"]["requests"], 1)
+        self.assertEqual(metrics["multimodal-model"]["requests"], 0)
+
+    def test_rate_limited_request_is_retried(self):
+        """429 按 Retry-After 重试后成功，统计中记录请求与限流次数"""
+        llm = FakeVisionLLM(fail_calls={1})
+        agent = ImageAnalysisAgent(llm, max_concurrency=1, requests_per_minute=0, max_retries=2)
+        results = asyncio.run(agent.analyze_images(self.image_paths[:2]))
+
+        # 文件在线程中读取，哪张图片先发出请求不确定
+        retried = [r for r in results if r["attempts"] == 2]
+        self.assertEqual(len(retried), 1)
+        self.assertEqual(retried[0]["rate_limited"], 1)
+        self.assertFalse(any(r["failed"] for r in results))
+        stats = summarize_image_analysis(results)
+        self.assertEqual(stats["images"], 2)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(stats["attempts"], 3)
+        self.assertEqual(stats["retries"], 1)
+
+    def test_failure_after_retries_is_reported(self):
+        """重试用尽后返回失败描述并计入失败数"""
+        llm = FakeVisionLLM(fail_calls={1, 2})
+        agent = ImageAnalysisAgent(llm, max_concurrency=1, requests_per_minute=0, max_retries=1)
+        results = asyncio.run(agent.analyze_images(self.image_paths[:1]))
+
+        self.assertTrue(results[0]["failed"])
+        self.assertTrue(results[0]["description"].startswith("图片解析失败"))
+        self.assertEqual(summarize_image_analysis(results)["failed"], 1)
+
+    def test_results_are_cached_by_image_content(self):
+        """相同图片内容（即使文件名不同）第二次分析直接使用缓存，不调用LLM"""
+        first_llm = FakeVisionLLM()
+        first = asyncio.run(ImageAnalysisAgent(first_llm, requests_per_minute=0).analyze_images(self.image_paths[:2]))
+
+        copy_path = Path(self.tmp_dir.name) / "renamed.jpg"
+        copy_path.write_bytes(Path(self.image_paths[0]).read_bytes())
+        second_llm = FakeVisionLLM()
+        second = asyncio.run(ImageAnalysisAgent(second_llm, requests_per_minute=0).analyze_images([str(copy_path)]))
+
+        self.assertEqual(second_llm.calls, 0)
+        self.assertTrue(second[0]["cached"])
+        self.assertEqual(second[0]["description"], first[0]["description"])
+        stats = summarize_image_analysis(first + second)
+        self.assertEqual((stats["cache_hits"], stats["cache_misses"]), (1, 2))
+        # 缓存命中的图片没有上传，原图与上传大小都不计入
+        self.assertEqual(stats["original_bytes"], sum(r["original_bytes"] for r in first))
+        self.assertEqual(stats["upload_bytes"], sum(r["upload_bytes"] for r in first))
+        self.assertGreater(second[0]["original_bytes"], 0)
+
+    def test_cache_key_depends_on_model(self):
+        """更换图片模型后不复用旧结果"""
+        llm = FakeVisionLLM()
+        asyncio.run(ImageAnalysisAgent(llm, requests_per_minute=0).analyze_images(self.image_paths[:1]))
+        other_model = FakeVisionLLM()
+        other_model.model_name = "another-vision-model"
+        asyncio.run(ImageAnalysisAgent(other_model, requests_per_minute=0).analyze_images(self.image_paths[:1]))
+        self.assertEqual(other_model.calls, 1)
+
+    def test_failed_results_are_not_cached(self):
+        """失败的分析不写入缓存"""
+        failing = FakeVisionLLM(fail_calls={1})
+        asyncio.run(ImageAnalysisAgent(failing, requests_per_minute=0, max_retries=0).analyze_images(self.image_paths[:1]))
+        llm = FakeVisionLLM()
+        results = asyncio.run(ImageAnalysisAgent(llm, requests_per_minute=0).analyze_images(self.image_paths[:1]))
+        self.assertEqual(llm.calls, 1)
+        self.assertFalse(results[0]["failed"])
+
+    def test_duplicate_images_reuse_description(self):
+        """同一图片的不同分辨率只分析一次，重复图片复用代表图片的描述"""
+        from PIL import Image
+        import numpy as np
+
+        figure = Image.fromarray((np.random.default_rng(1).random((60, 80)) * 255).astype("uint8")).resize((800, 600))
+        large = Path(self.tmp_dir.name) / "figure_large.png"
+        small = Path(self.tmp_dir.name) / "figure_small.jpg"
+        figure.save(large)
+        figure.resize((400, 300)).save(small)
+
+        llm = FakeVisionLLM()
+        results = asyncio.run(ImageAnalysisAgent(llm, requests_per_minute=0).analyze_images([str(small), str(large)]))
+
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(results[0]["duplicate_of"], str(large))
+        self.assertEqual(results[0]["description"], results[1]["description"])
+        self.assertEqual(summarize_image_analysis(results)["duplicates"], 1)
+
+    def test_low_relevance_images_are_skipped(self):
+        """skip 模式下小图标被跳过并记录原因，有图注的小图仍被分析；默认的 defer 模式只把小图标放到最后分析"""
+        from PIL import Image
+        import numpy as np
+
+        rng = np.random.default_rng(2)
+        paths = []
+        for name, size in (("figure.png", (600, 400)), ("icon.png", (40, 40)), ("small_figure.png", (60, 60))):
+            path = Path(self.tmp_dir.name) / name
+            Image.fromarray((rng.random(size[::-1]) * 255).astype("uint8")).save(path)
+            paths.append(str(path))
+
+        llm = FakeVisionLLM()
+        with mock.patch.object(config.settings, "IMAGE_FILTER_MODE", "skip"):
+            agent = ImageAnalysisAgent(llm, requests_per_minute=0)
+        results = asyncio.run(agent.analyze_images(paths, captions={paths[2]: "Figure 2. Inset"}))
+
+        self.assertEqual(llm.calls, 2)
+        self.assertTrue(results[1]["skipped"])
+        self.assertIn("无图注", results[1]["skip_reasons"])
+        self.assertFalse(results[2].get("skipped"))
+        stats = summarize_image_analysis(results)
+        self.assertEqual((stats["succeeded"], stats["skipped"]), (2, 1))
+
+        self.assertEqual(config.Settings.model_fields["IMAGE_FILTER_MODE"].default, "defer")
+        deferred_llm = FakeVisionLLM()
+        with mock.patch.object(config.settings, "IMAGE_FILTER_MODE", "defer"), \
+                mock.patch.object(config.settings, "IMAGE_ANALYSIS_CACHE_ENABLED", False):
+            agent = ImageAnalysisAgent(deferred_llm, requests_per_minute=0)
+        results = asyncio.run(agent.analyze_images(paths, captions={paths[2]: "Figure 2. Inset"}))
+        self.assertEqual(deferred_llm.calls, 3)
+        self.assertFalse(any(r.get("skipped") for r in results))
+        self.assertTrue(results[1]["low_priority"])
+
+    def test_choice_settings_are_validated(self):
+        """IMAGE_FILTER_MODE 和 PDF_IMAGE_SOURCE 统一为小写，拼写错误在加载配置时报错"""
+        from pydantic import ValidationError
+
+        settings = config.Settings(_env_file=None, IMAGE_FILTER_MODE="Skip", PDF_IMAGE_SOURCE="EMBEDDED")
+        self.assertEqual((settings.IMAGE_FILTER_MODE, settings.PDF_IMAGE_SOURCE), ("skip", "embedded"))
+        with self.assertRaises(ValidationError):
+            config.Settings(_env_file=None, IMAGE_FILTER_MODE="skp")
+        with self.assertRaises(ValidationError):
+            config.Settings(_env_file=None, PDF_IMAGE_SOURCE="layouts")
+
+    def test_prompt_uses_caption_and_related_paragraphs(self):
+        """有图注和相关段落时提示词使用它们而不是文档开头；caption-only 模式不调用LLM"""
+        llm = FakeVisionLLM()
+        agent = ImageAnalysisAgent(llm, requests_per_minute=0)
+        asyncio.run(agent.analyze_images(
+            self.image_paths[:2], context="文档开头的摘要",
+            captions={self.image_paths[0]: "Figure 1. Growth curves"},
+            image_contexts={self.image_paths[0]: "As shown in Figure 1, growth rises."}
+        ))
+        prompt_with_caption = next(p for p in llm.prompts if "Growth curves" in p)
+        self.assertIn("As shown in Figure 1", prompt_with_caption)
+        self.assertNotIn("文档开头的摘要", prompt_with_caption)
+        self.assertTrue(any("文档开头的摘要" in p for p in llm.prompts))
+
+        llm = FakeVisionLLM()
+        with mock.patch.object(config.settings, "IMAGE_CAPTION_ONLY_MIN_CHARS", 10):
+            results = asyncio.run(ImageAnalysisAgent(llm, requests_per_minute=0).analyze_images(
+                self.image_paths[2:3], captions={self.image_paths[2]: "Figure 3. Detailed caption of the panel"}
+            ))
+        self.assertEqual(llm.calls, 0)
+        self.assertTrue(results[0]["caption_only"])
+        self.assertIn("Detailed caption", results[0]["description"])
+
+    def test_images_are_packed_into_one_request(self):
+        """打包模式下多张图片一次请求，按编号解析回各图片；未返回的图片单独重新请求"""
+        llm = FakePackLLM(omit={3})
+        with mock.patch.object(config.settings, "IMAGE_PACK_SIZE", 4):
+            results = asyncio.run(ImageAnalysisAgent(llm, requests_per_minute=0).analyze_images(self.image_paths[:5]))
+
+        self.assertEqual(sorted(llm.image_counts), [1, 1, 4])
+        self.assertEqual([r["description"] for r in results[:2]], ["打包描述1", "打包描述2"])
+        self.assertEqual(results[3]["description"], "打包描述4")
+        self.assertNotIn("pack_size", results[2])
+        self.assertFalse(any(r["failed"] for r in results))
+        stats = summarize_image_analysis(results)
+        self.assertEqual((stats["attempts"], stats["packed"]), (3, 3))
+
+        # 打包得到的描述按单张图片写入缓存
+        cached_llm = FakeVisionLLM()
+        cached = asyncio.run(ImageAnalysisAgent(cached_llm, requests_per_minute=0).analyze_images(self.image_paths[:1]))
+        self.assertEqual((cached_llm.calls, cached[0]["description"]), (0, "打包描述1"))
+
+    def test_iter_yields_as_completed_and_times_out_laggards(self):
+        """按完成顺序产出结果，超过时限的图片记为超时而不阻塞其余图片"""
+        llm = FakeVisionLLM(slow_calls={1})
+        agent = ImageAnalysisAgent(llm, max_concurrency=3, requests_per_minute=0, max_retries=0)
+
+        async def collect():
+            return [r async for r in agent.analyze_images_iter(self.image_paths[:3], time_limit=0.3)]
+
+        results = asyncio.run(collect())
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results[-1]["timed_out"])
+        self.assertTrue(results[-1]["failed"])
+        self.assertFalse(any(r.get("timed_out") for r in results[:-1]))
+        self.assertEqual(summarize_image_analysis(results)["timed_out"], 1)
+
+    def test_retry_delay_prefers_retry_after(self):
+        """存在 Retry-After 时按其等待"""
+        agent = ImageAnalysisAgent(FakeVisionLLM(), requests_per_minute=0)
+        self.assertEqual(agent._retry_delay(rate_limit_error("7"), 0), 7.0)
+        self.assertGreater(agent._retry_delay(asyncio.TimeoutError(), 0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
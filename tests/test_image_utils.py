@@ -0,0 +1,168 @@
+"""
+测试上传前的图片规范化 (slais/utils/image_utils.py)
+"""
+import unittest
+import io
+import os
+import sys
+
+from PIL import Image, ImageDraw
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from slais.utils.image_utils import (
+    detect_mime_type, prepare_image_for_upload, image_fingerprint, find_duplicate_images, score_image_relevance
+)
+from slais.utils.content_list_utils import image_captions, image_contexts
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def noisy_image(size, mode="RGB") -> Image.Image:
+    """带噪声的图片，使PNG体积明显大于JPEG（类似照片或显微图像）"""
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+
+class TestImageUtils(unittest.TestCase):
+    def test_detect_mime_type(self):
+        """按文件头识别真实格式，与扩展名无关"""
+        img = Image.new("RGB", (8, 8), "white")
+        self.assertEqual(detect_mime_type(encode(img, "PNG")), "image/png")
+        self.assertEqual(detect_mime_type(encode(img, "JPEG")), "image/jpeg")
+        self.assertEqual(detect_mime_type(encode(img, "BMP")), "image/bmp")
+        self.assertEqual(detect_mime_type(encode(img, "WEBP")), "image/webp")
+        self.assertIsNone(detect_mime_type(b"not an image"))
+
+    def test_large_image_is_downscaled(self):
+        """长边超过上限的图片等比缩小并转码为目标格式"""
+        data = encode(noisy_image((3000, 1500)), "PNG")
+        payload, mime = prepare_image_for_upload(data, max_long_edge=1000, target_format="jpeg", quality=85)
+
+        self.assertEqual(mime, "image/jpeg")
+        self.assertLess(len(payload), len(data))
+        with Image.open(io.BytesIO(payload)) as img:
+            self.assertEqual(img.size, (1000, 500))
+
+    def test_small_chart_keeps_original_when_reencoding_is_larger(self):
+        """无需缩放且转码不能减小体积时上传原图（如线条简单的PNG图表）"""
+        chart = Image.new("RGB", (400, 300), "white")
+        draw = ImageDraw.Draw(chart)
+        draw.line([(40, 260), (40, 20)], fill="black", width=2)
+        draw.line([(40, 260), (380, 260)], fill="black", width=2)
+        draw.line([(40, 240), (150, 120), (260, 160), (370, 40)], fill="blue", width=3)
+        buffer = io.BytesIO()
+        chart.save(buffer, format="PNG", optimize=True)
+        data = buffer.getvalue()
+        payload, mime = prepare_image_for_upload(data, max_long_edge=1000, target_format="jpeg")
+        self.assertEqual((payload, mime), (data, "image/png"))
+
+    def test_unsupported_format_is_converted(self):
+        """接口不支持的格式（BMP）即使选择 original 也会转码"""
+        data = encode(Image.new("RGB", (64, 64), "red"), "BMP")
+        payload, mime = prepare_image_for_upload(data, target_format="original")
+        self.assertEqual(mime, "image/png")
+        self.assertEqual(detect_mime_type(payload), "image/png")
+
+    def test_upload_format_setting_is_validated(self):
+        """IMAGE_UPLOAD_FORMAT 中 jpg 视为 jpeg，不支持的格式在加载配置时报错"""
+        from pydantic import ValidationError
+        from slais.config import Settings
+
+        self.assertEqual(Settings(_env_file=None, IMAGE_UPLOAD_FORMAT="JPG").IMAGE_UPLOAD_FORMAT, "jpeg")
+        self.assertEqual(Settings(_env_file=None, IMAGE_UPLOAD_FORMAT="webp").IMAGE_UPLOAD_FORMAT, "webp")
+        with self.assertRaises(ValidationError):
+            Settings(_env_file=None, IMAGE_UPLOAD_FORMAT="gif")
+
+    def test_transparent_image_to_jpeg(self):
+        """带透明通道的图片转JPEG时铺白色背景"""
+        img = noisy_image((1200, 800), "RGBA")
+        payload, mime = prepare_image_for_upload(encode(img, "PNG"), max_long_edge=600, target_format="jpeg")
+        self.assertEqual(mime, "image/jpeg")
+        with Image.open(io.BytesIO(payload)) as out:
+            self.assertEqual(out.mode, "RGB")
+
+    def test_invalid_data_is_passed_through(self):
+        """无法解码的数据原样返回"""
+        payload, mime = prepare_image_for_upload(b"\xff\xd8\xffbroken", max_long_edge=100)
+        self.assertEqual((payload, mime), (b"\xff\xd8\xffbroken", "image/jpeg"))
+
+
+    def test_duplicates_across_resolutions_are_grouped(self):
+        """同一图片的不同分辨率/格式归为一组，代表为像素最多的一张；不同图片和无法解码的数据各自成组"""
+        rng = np.random.default_rng(0)
+        figure = Image.fromarray((rng.random((60, 80)) * 255).astype("uint8")).resize((800, 600))
+        other = Image.fromarray((rng.random((60, 80)) * 255).astype("uint8")).resize((800, 600))
+        fingerprints = [
+            image_fingerprint(encode(figure.resize((400, 300)), "JPEG")),
+            image_fingerprint(encode(other, "PNG")),
+            image_fingerprint(encode(figure, "PNG")),
+            image_fingerprint(b"not an image"),
+        ]
+        self.assertIsNone(fingerprints[3])
+        self.assertEqual(find_duplicate_images(fingerprints), [2, 1, 2, 3])
+
+    def test_different_aspect_ratio_is_not_duplicate(self):
+        """宽高比不同的图片不视为重复（如纯色的横幅和方形图标）"""
+        fingerprints = [
+            image_fingerprint(encode(Image.new("RGB", (300, 100), "white"), "PNG")),
+            image_fingerprint(encode(Image.new("RGB", (100, 100), "white"), "PNG")),
+        ]
+        self.assertEqual(find_duplicate_images(fingerprints), [0, 1])
+
+    def test_relevance_score(self):
+        """图标、分隔线和空白图得分低并给出原因；有图注的小图仍保留"""
+        figure = image_fingerprint(encode(noisy_image((600, 400)), "PNG"))
+        icon = image_fingerprint(encode(noisy_image((40, 40)), "PNG"))
+        rule = image_fingerprint(encode(noisy_image((1200, 20)), "PNG"))
+        blank = image_fingerprint(encode(Image.new("RGB", (600, 400), "white"), "PNG"))
+
+        self.assertEqual(score_image_relevance(figure), (1.0, []))
+        icon_score, icon_reasons = score_image_relevance(icon)
+        self.assertLess(icon_score, 0.5)
+        self.assertTrue(icon_reasons[0].startswith("尺寸过小"))
+        self.assertTrue(any(r.startswith("宽高比异常") for r in score_image_relevance(rule)[1]))
+        blank_score, blank_reasons = score_image_relevance(blank)
+        self.assertEqual(blank_score, 0.0)
+        self.assertTrue(blank_reasons[0].startswith("像素熵过低"))
+        self.assertGreaterEqual(score_image_relevance(icon, has_caption=True)[0], 0.5)
+
+    def test_image_captions_from_content_list(self):
+        """从内容列表读取图片与表格的图注"""
+        content_list = [
+            {"type": "text", "text": "正文"},
+            {"type": "image", "img_path": "images/image_000.jpg", "img_caption": ["Figure 1.", "Overview"]},
+            {"type": "image", "img_path": "images/image_001.jpg", "img_caption": []},
+            {"type": "table", "img_path": "images/image_002.jpg", "table_caption": ["Table 1. Results"]},
+        ]
+        self.assertEqual(image_captions(content_list), {
+            "images/image_000.jpg": "Figure 1. Overview",
+            "images/image_002.jpg": "Table 1. Results",
+        })
+
+    def test_image_contexts_prefer_referencing_paragraphs(self):
+        """相关段落先取引用该图编号的段落，再取相邻段落；不误匹配 Figure 12"""
+        content_list = [
+            {"type": "text", "text": "Abstract text."},
+            {"type": "text", "text": "As shown in Fig. 2, growth rises."},
+            {"type": "text", "text": "Paragraph before the figure."},
+            {"type": "image", "img_path": "images/image_000.jpg", "img_caption": ["Figure 2. Growth curves"]},
+            {"type": "text", "text": "Paragraph after the figure, see Figure 12."},
+            {"type": "text", "text": "Unrelated discussion."},
+        ]
+        context = image_contexts(content_list)["images/image_000.jpg"]
+        self.assertEqual(context.split("\n\n"), [
+            "As shown in Fig. 2, growth rises.",
+            "Paragraph before the figure.",
+            "Paragraph after the figure, see Figure 12.",
+        ])
+        self.assertEqual(len(image_contexts(content_list, max_chars=20)["images/image_000.jpg"]), 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+测试进程级LLM请求调度器：优先级、并发与RPM/TPM限制、429重试和指标 (agents/llm_scheduler.py)
+"""
+import unittest
+import asyncio
+import os
+import sys
+import time
+from unittest import mock
+
+import httpx
+import openai
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import llm_scheduler
+from agents.llm_scheduler import LLMScheduler, PRIORITY_CRITICAL, PRIORITY_LOW, PRIORITY_NORMAL
+
+
+def rate_limit_error(retry_after: str) -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class TestLLMScheduler(unittest.TestCase):
+    def setUp(self):
+        # 缩短RPM/TPM窗口，使测试无需等待一分钟
+        self.window_patch = mock.patch.object(llm_scheduler, "_WINDOW_SECONDS", 0.3)
+        self.window_patch.start()
+
+    def tearDown(self):
+        self.window_patch.stop()
+
+    def test_waiters_are_served_by_priority(self):
+        """名额释放后，高优先级（关键路径）请求先于先到的低优先级请求获得名额"""
+        scheduler = LLMScheduler()
+        scheduler.configure("m", max_concurrency=1)
+        order = []
+
+        async def request(name, priority, hold=0.0):
+            async with scheduler.slot("m", priority):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        async def run():
+            first = asyncio.create_task(request("first", PRIORITY_NORMAL, hold=0.05))
+            await asyncio.sleep(0.01)
+            low = asyncio.create_task(request("low", PRIORITY_LOW))
+            await asyncio.sleep(0.01)
+            critical = asyncio.create_task(request("critical", PRIORITY_CRITICAL))
+            await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.metrics()["m"]["queue_depth"], 2)
+            await asyncio.gather(first, low, critical)
+
+        asyncio.run(run())
+        self.assertEqual(order, ["first", "critical", "low"])
+        metrics = scheduler.metrics()["m"]
+        self.assertEqual(metrics["requests"], 3)
+        self.assertGreater(metrics["avg_wait_by_priority"][PRIORITY_LOW], metrics["avg_wait_by_priority"][PRIORITY_CRITICAL])
+
+    def test_requests_and_tokens_per_minute(self):
+        """超过RPM或按估算值超过TPM的请求等到窗口内的旧请求过期后再发出"""
+        async def run(scheduler, tokens):
+            started = time.monotonic()
+            sent = []
+
+            async def request():
+                async with scheduler.slot("m", estimated_tokens=tokens):
+                    sent.append(time.monotonic() - started)
+
+            await asyncio.gather(*(request() for _ in range(3)))
+            return sent
+
+        by_rpm = LLMScheduler()
+        by_rpm.configure("m", max_concurrency=10, requests_per_minute=2)
+        sent = asyncio.run(run(by_rpm, 0))
+        self.assertLess(sorted(sent)[1], 0.1)
+        self.assertGreaterEqual(sorted(sent)[2], 0.25)
+
+        by_tpm = LLMScheduler()
+        by_tpm.configure("m", max_concurrency=10, tokens_per_minute=100)
+        sent = asyncio.run(run(by_tpm, 60))
+        self.assertLess(sorted(sent)[0], 0.1)
+        self.assertGreaterEqual(sorted(sent)[1], 0.25)
+
+    def test_rate_limited_call_is_retried_after_retry_after(self):
+        """429 按 Retry-After 等待后重试成功；不可重试的错误直接抛出"""
+        scheduler = LLMScheduler()
+        calls = []
+
+        async def flaky():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise rate_limit_error("0.1")
+            return "ok"
+
+        self.assertEqual(asyncio.run(scheduler.submit("m", flaky, max_retries=2)), "ok")
+        self.assertGreaterEqual(calls[1] - calls[0], 0.1)
+        metrics = scheduler.metrics()["m"]
+        self.assertEqual((metrics["retries"], metrics["rate_limited"]), (1, 1))
+
+        async def bad_request():
+            calls.append(time.monotonic())
+            raise ValueError("400")
+
+        calls.clear()
+        with self.assertRaises(ValueError):
+            asyncio.run(scheduler.submit("m", bad_request, max_retries=2))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(scheduler.metrics()["m"]["failures"], 1)
+
+    def test_shared_scheduler_survives_new_event_loops(self):
+        """事件循环关闭时仍在排队的请求和定时器被丢弃，新的事件循环中请求照常获得名额"""
+        scheduler = LLMScheduler()
+        scheduler.configure("m", max_concurrency=1, requests_per_minute=1)
+
+        async def call():
+            return "ok"
+
+        async def leave_waiter_behind():
+            await scheduler.submit("m", call)
+            # 第二个请求因RPM限制等待定时器；事件循环随后关闭，该请求既未完成也未被取消
+            abandoned = asyncio.ensure_future(scheduler.submit("m", call))
+            abandoned._log_destroy_pending = False
+            await asyncio.sleep(0.05)
+            self.assertEqual(scheduler.metrics()["m"]["queue_depth"], 1)
+
+        old_loop = asyncio.new_event_loop()
+        old_loop.run_until_complete(leave_waiter_behind())
+        old_loop.close()
+
+        self.assertEqual(asyncio.run(scheduler.submit("m", call)), "ok")
+        self.assertEqual(asyncio.run(scheduler.submit("m", call)), "ok")
+        self.assertEqual(scheduler.metrics()["m"]["queue_depth"], 0)
+
+    def test_get_scheduler_across_asyncio_run(self):
+        """通过共享调度器的 submit 连续两次 asyncio.run()"""
+        scheduler = llm_scheduler.get_scheduler()
+
+        async def call():
+            return "ok"
+
+        self.assertEqual(asyncio.run(scheduler.submit("loop-test-model", call)), "ok")
+        self.assertEqual(asyncio.run(scheduler.submit("loop-test-model", call)), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
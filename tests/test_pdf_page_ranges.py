@@ -0,0 +1,115 @@
+"""
+测试长PDF的页段拆分与转换结果合并 (slais/pdf_utils.py)
+"""
+import unittest
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest import mock
+from slais import config
+from slais.pdf_utils import split_pdf_pages, stitch_converted_parts, _plan_page_ranges
+
+
+class TestPdfPageRanges(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp_dir.name)
+
+    def test_split_pdf_pages(self):
+        """按页段拆分并返回每段的起始页"""
+        import fitz
+        pdf_path = self.base / "thesis.pdf"
+        doc = fitz.open()
+        for _ in range(5):
+            doc.new_page()
+        doc.save(str(pdf_path))
+        doc.close()
+
+        parts = split_pdf_pages(str(pdf_path), 2, str(self.base / "_parts"))
+        self.assertEqual([offset for _, offset in parts], [0, 2, 4])
+        with fitz.open(parts[-1][0]) as last:
+            self.assertEqual(last.page_count, 1)
+
+    def test_plan_page_ranges(self):
+        """流式转换先单独转换开头几页，并行转换按固定页数拆分其余页面"""
+        import fitz
+        pdf_path = str(self.base / "long.pdf")
+        doc = fitz.open()
+        for _ in range(20):
+            doc.new_page()
+        doc.save(pdf_path)
+        doc.close()
+
+        with mock.patch.object(config.settings, "PDF_STREAM_LEAD_PAGES", 8), \
+             mock.patch.object(config.settings, "PDF_CONVERSION_WORKERS", 1):
+            self.assertIsNone(_plan_page_ranges(pdf_path))
+            self.assertEqual(_plan_page_ranges(pdf_path, streaming=True), [(0, 8), (8, 20)])
+        with mock.patch.object(config.settings, "PDF_STREAM_LEAD_PAGES", 8), \
+             mock.patch.object(config.settings, "PDF_CONVERSION_WORKERS", 2), \
+             mock.patch.object(config.settings, "PDF_PARALLEL_MIN_PAGES", 10), \
+             mock.patch.object(config.settings, "PDF_PAGES_PER_CHUNK", 5):
+            self.assertEqual(_plan_page_ranges(pdf_path, streaming=True), [(0, 8), (8, 13), (13, 18), (18, 20)])
+
+    def test_lead_range_requires_enough_text_for_llm_budget(self):
+        """开头几页的文本不足以填满LLM的Token预算时不单独转换开头页面"""
+        import fitz
+        from types import SimpleNamespace
+        pdf_path = str(self.base / "text.pdf")
+        doc = fitz.open()
+        for i in range(20):
+            doc.new_page().insert_text((72, 72), " ".join(f"w{i}" for _ in range(10)))
+        doc.save(pdf_path)
+        doc.close()
+
+        def budget(prompt_budget):
+            return SimpleNamespace(count=lambda text: len(text.split()), prompt_budget=prompt_budget)
+
+        with mock.patch.object(config.settings, "PDF_STREAM_LEAD_PAGES", 8), \
+             mock.patch.object(config.settings, "PDF_CONVERSION_WORKERS", 1):
+            self.assertEqual(_plan_page_ranges(pdf_path, streaming=True, lead_budget=budget(80)), [(0, 8), (8, 20)])
+            self.assertIsNone(_plan_page_ranges(pdf_path, streaming=True, lead_budget=budget(81)))
+
+    def make_part(self, index, images, content_list):
+        part_stem = f"thesis_part{index:03d}"
+        part_dir = self.base / "_parts" / f"{part_stem}_markdown"
+        (part_dir / "images").mkdir(parents=True)
+        md = []
+        for name in images:
+            (part_dir / "images" / name).write_bytes(name.encode())
+            md.append(f"![](images/{name})")
+        (part_dir / f"{part_stem}.md").write_text(f"# Part {index}\n\n" + "\n".join(md), encoding="utf-8")
+        (part_dir / f"{part_stem}_content_list.json").write_text(json.dumps(content_list), encoding="utf-8")
+        return str(part_dir / f"{part_stem}.md")
+
+    def test_stitch_renumbers_images_and_offsets_pages(self):
+        """合并后图片全局连续编号，内容列表的页码加上页段偏移"""
+        part0 = self.make_part(0, ["image_000.jpg", "image_001.jpg"],
+                               [{"type": "image", "img_path": "images/image_001.jpg", "page_idx": 1}])
+        part1 = self.make_part(1, ["image_000.jpg"],
+                               [{"type": "text", "text": "x", "page_idx": 0},
+                                {"type": "image", "img_path": "images/image_000.jpg", "page_idx": 1}])
+        out_dir = self.base / "thesis_markdown"
+        md_path = stitch_converted_parts([(part0, 0), (part1, 20)], str(out_dir), "thesis")
+
+        md = Path(md_path).read_text(encoding="utf-8")
+        self.assertLess(md.index("# Part 0"), md.index("# Part 1"))
+        self.assertIn("images/image_002.jpg", md)
+        self.assertEqual((out_dir / "images" / "image_002.jpg").read_bytes(), b"image_000.jpg")
+        content_list = json.loads((out_dir / "thesis_content_list.json").read_text(encoding="utf-8"))
+        self.assertEqual([block["page_idx"] for block in content_list], [1, 20, 21])
+        self.assertEqual(content_list[2]["img_path"], "images/image_002.jpg")
+
+    def tearDown(self):
+        """清理测试环境"""
+        self.tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+测试PDF转换进程池的超时处理 (slais/pdf_worker_pool.py)
+"""
+import unittest
+import asyncio
+import os
+import sys
+import time
+from unittest import mock
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from slais import pdf_worker_pool
+from slais.pdf_worker_pool import run_in_pool, shutdown_pool
+
+
+class TestPoolTimeoutReset(unittest.TestCase):
+    def setUp(self):
+        """两个工作进程的进程池"""
+        self.workers_patch = mock.patch.object(config.settings, "PDF_CONVERSION_WORKERS", 2)
+        self.workers_patch.start()
+
+    def tearDown(self):
+        shutdown_pool(terminate=True)
+        self.workers_patch.stop()
+
+    def test_other_jobs_survive_repeated_pool_resets(self):
+        """其他任务超时导致进程池被重置时，执行中的任务重新提交且不计入重试次数，连续两次重置后仍能完成"""
+        async def run():
+            victim = asyncio.ensure_future(run_in_pool(time.sleep, 3, timeout=0))
+            for _ in range(2):
+                with self.assertRaises(asyncio.TimeoutError):
+                    await run_in_pool(time.sleep, 30, timeout=1)
+            return await victim
+
+        with self.assertLogs(pdf_worker_pool.logger, level="INFO") as logs:
+            self.assertIsNone(asyncio.run(run()))
+        resubmitted = [line for line in logs.output if "因其他任务超时被重置" in line]
+        self.assertEqual(len(resubmitted), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
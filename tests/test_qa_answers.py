@@ -0,0 +1,108 @@
+"""
+测试分组并行生成问答答案、按编号对应问题以及只重新请求缺失的问题 (agents/llm_analysis_agent.py)
+"""
+import unittest
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+from unittest import mock
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from agents.llm_analysis_agent import QAGenerationAgent
+
+
+class AnswerLLM:
+    """按提示词中的问题列表作答；drop 中的问题在第一次被问到时不回答，broken_once 为 True 时第一次请求返回无法解析的文本"""
+
+    def __init__(self, drop=(), broken_once=False):
+        self.drop = set(drop)
+        self.broken_once = broken_once
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    async def respond(self, prompt_value):
+        text = prompt_value.to_string()
+        listed = json.loads(re.search(r"问题列表 \(JSON格式，每个问题带有编号 id\)：\n(.*?)\n\n", text, re.DOTALL).group(1))
+        self.requests.append([item["question"] for item in listed])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            self.active -= 1
+        if self.broken_once:
+            self.broken_once = False
+            return AIMessage(content="抱歉，回答如下：[{\"id\": 1, 答案被截断")
+        items = []
+        for item in listed:
+            if item["question"] in self.drop:
+                self.drop.discard(item["question"])
+                continue
+            items.append({"id": item["id"], "question": item["question"], "answer": f"{item['question']}的答案"})
+        # 打乱顺序，确认按编号而非位置对应
+        return AIMessage(content="```json\n" + json.dumps(items[::-1], ensure_ascii=False) + "\n```")
+
+    def runnable(self):
+        return RunnableLambda(self.respond)
+
+
+class TestShardedAnswers(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(config.settings, "CACHE_DIR", self.tmp_dir.name),
+            mock.patch.object(config.settings, "QA_ANSWER_SHARD_SIZE", 3),
+            mock.patch.object(config.settings, "QA_ANSWER_MAX_RETRIES", 1),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.questions = [f"问题{i}？" for i in range(1, 8)]
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_shards_are_answered_in_parallel_and_matched_by_id(self):
+        """7个问题分为3组并行请求，答案按编号对应回原问题顺序"""
+        llm = AnswerLLM()
+        qa_pairs = asyncio.run(QAGenerationAgent(llm.runnable()).generate_answers_batch(self.questions, "文献A"))
+
+        self.assertEqual([len(request) for request in llm.requests], [3, 3, 1])
+        self.assertEqual(llm.max_active, 3)
+        self.assertEqual(qa_pairs, [{"question": q, "answer": f"{q}的答案"} for q in self.questions])
+
+    def test_only_missing_questions_are_reasked(self):
+        """漏答的问题单独重新请求；无法解析的回答整组重新请求且不被缓存"""
+        llm = AnswerLLM(drop={"问题2？", "问题5？"})
+        qa_pairs = asyncio.run(QAGenerationAgent(llm.runnable()).generate_answers_batch(self.questions, "文献B"))
+        self.assertEqual(llm.requests[3:], [["问题2？", "问题5？"]])
+        self.assertTrue(all(pair["answer"] == f"{pair['question']}的答案" for pair in qa_pairs))
+
+        broken = AnswerLLM(broken_once=True)
+        qa_pairs = asyncio.run(QAGenerationAgent(broken.runnable()).generate_answers_batch(self.questions[:3], "文献C"))
+        self.assertEqual(broken.requests, [self.questions[:3], self.questions[:3]])
+        self.assertTrue(all(not pair["answer"].startswith("错误") for pair in qa_pairs))
+
+    def test_questions_still_missing_after_retries_get_error(self):
+        """重试轮数用尽后仍缺失的问题返回错误说明，其余答案保留"""
+        llm = AnswerLLM(drop={"问题1？"})
+        with mock.patch.object(config.settings, "QA_ANSWER_MAX_RETRIES", 0):
+            qa_pairs = asyncio.run(QAGenerationAgent(llm.runnable()).generate_answers_batch(self.questions[:3], "文献D"))
+        self.assertTrue(qa_pairs[0]["answer"].startswith("错误"))
+        self.assertEqual(qa_pairs[1]["answer"], "问题2？的答案")
+
+
+if __name__ == "__main__":
+    unittest.main()
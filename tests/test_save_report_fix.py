@@ -4,7 +4,10 @@
 """
 
 import sys
+import tempfile
+import unittest
 from pathlib import Path
+from unittest import mock
 
 # 确保项目路径在 sys.path 中
 project_root = Path(__file__).parent.parent.absolute()  # 向上一级到项目根目录
@@ -62,6 +65,31 @@ def test_save_report_import():
         print(f"✗ 导入错误: {e}")
         return False
 
+class TestSaveReportOutputDir(unittest.TestCase):
+    def test_report_is_saved_to_hash_keyed_dir(self):
+        """报告保存到按内容哈希区分的文献输出目录，同名的不同文献互不覆盖"""
+        from app import save_report
+        from slais import config
+        from slais.pdf_utils import paper_output_dir
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base = Path(tmp_dir)
+            pdf_paths = []
+            for name in ("a", "b"):
+                (base / name).mkdir()
+                pdf_path = base / name / "paper.pdf"
+                pdf_path.write_bytes(f"%PDF-1.4 {name}".encode())
+                pdf_paths.append(pdf_path)
+            results = {"metadata": {"pubmed_info": {}, "s2_info": {}}, "story": "故事"}
+            with mock.patch.object(config.settings, "OUTPUT_BASE_DIR", str(base / "output")):
+                for pdf_path in pdf_paths:
+                    save_report(results, str(pdf_path))
+                dirs = [paper_output_dir(pdf_path) for pdf_path in pdf_paths]
+            self.assertNotEqual(dirs[0], dirs[1])
+            for paper_dir in dirs:
+                self.assertEqual(len(list(paper_dir.glob("paper_analysis_report_*.md"))), 1)
+
+
 if __name__ == "__main__":
     success = test_save_report_import()
     if success:
@@ -0,0 +1,310 @@
+"""
+测试按依赖关系调度的流程阶段 (slais/stage_graph.py) 以及 process_article_pipeline 的阶段并发
+"""
+import unittest
+import os
+import sys
+import asyncio
+from unittest import mock
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais.stage_graph import (
+    PipelineStage, StageScheduler, StageOutcome, WALL_CLOCK_KEY, CRITICAL_PATH_KEY, RESTORED_STATUS,
+    PARTIAL_STATUS
+)
+
+
+def make_stage(name, inputs, delay, output=None, display_name=None, log=None):
+    async def run(received):
+        if log is not None:
+            log.append(("start", name, sorted(received)))
+        await asyncio.sleep(delay)
+        return output if output is not None else name
+    return PipelineStage(name, run, inputs, display_name or name)
+
+
+class TestStageScheduler(unittest.TestCase):
+    def test_independent_stages_overlap(self):
+        """互不依赖的阶段应并发执行，墙钟时间接近关键路径时间"""
+        stages = [
+            make_stage("a", [], 0.2),
+            make_stage("b", [], 0.2),
+            make_stage("c", ["a", "b"], 0.1),
+        ]
+        scheduler = StageScheduler(stages)
+        outputs = asyncio.run(scheduler.run())
+        self.assertEqual(outputs, {"a": "a", "b": "b", "c": "c"})
+        self.assertLess(scheduler.stage_costs[WALL_CLOCK_KEY], 0.45)
+        self.assertAlmostEqual(scheduler.stage_costs[CRITICAL_PATH_KEY], 0.3, delta=0.1)
+        path, _ = scheduler.critical_path()
+        self.assertEqual(path[-1], "c")
+        self.assertEqual(len(path), 2)
+
+    def test_inputs_are_passed_and_status_recorded(self):
+        """阶段只接收声明的输入，StageOutcome 的状态被记录"""
+        log = []
+
+        async def skipped(received):
+            return StageOutcome([], "跳过 (无图片)")
+
+        stages = [
+            make_stage("a", [], 0.0, log=log),
+            PipelineStage("b", skipped, ["a"], "阶段B"),
+            make_stage("c", ["b"], 0.0, log=log),
+        ]
+        scheduler = StageScheduler(stages)
+        outputs = asyncio.run(scheduler.run())
+        self.assertEqual(outputs["b"], [])
+        self.assertEqual(scheduler.stage_status["阶段B"], "跳过 (无图片)")
+        self.assertIn(("start", "c", ["b"]), log)
+
+    def test_unhandled_exception_marks_stage_failed(self):
+        """未捕获的异常不应中断流程，阶段输出为 None 且状态为失败"""
+        async def boom(received):
+            raise RuntimeError("boom")
+
+        stages = [PipelineStage("a", boom, [], "A"), make_stage("b", ["a"], 0.0)]
+        scheduler = StageScheduler(stages)
+        outputs = asyncio.run(scheduler.run())
+        self.assertIsNone(outputs["a"])
+        self.assertEqual(scheduler.stage_status["A"], "失败")
+        self.assertEqual(outputs["b"], "b")
+
+    def test_early_inputs_start_on_published_output(self):
+        """early_inputs 依赖在上游发布阶段性输出后即启动，普通依赖仍等待最终输出"""
+        log = []
+
+        async def producer(received):
+            await asyncio.sleep(0.05)
+            scheduler.publish("a", "partial")
+            await asyncio.sleep(0.3)
+            log.append("a done")
+            return "full"
+
+        async def early(received):
+            log.append(("early", received["a"]))
+            return "b"
+
+        stages = [
+            PipelineStage("a", producer, [], "A"),
+            PipelineStage("b", early, [], "B", early_inputs=["a"]),
+            make_stage("c", ["a"], 0.0, log=log),
+        ]
+        scheduler = StageScheduler(stages)
+        outputs = asyncio.run(scheduler.run())
+        self.assertEqual(log[0], ("early", "partial"))
+        self.assertEqual(log[1], "a done")
+        self.assertEqual(outputs["a"], "full")
+        self.assertLess(scheduler.stage_costs[CRITICAL_PATH_KEY], 0.45)
+
+    def test_invalid_graphs_are_rejected(self):
+        """未知依赖或循环依赖应在构建时报错"""
+        with self.assertRaises(ValueError):
+            StageScheduler([make_stage("a", ["missing"], 0)])
+        with self.assertRaises(ValueError):
+            StageScheduler([make_stage("a", ["b"], 0), make_stage("b", ["a"], 0)])
+
+
+class MemoryCheckpoint:
+    """内存中的检查点存储"""
+    def __init__(self):
+        self.data = {}
+
+    def load(self, stage):
+        return self.data.get(stage)
+
+    def save(self, stage, output, status):
+        self.data[stage] = (output, status)
+
+
+class TestStageCheckpoints(unittest.TestCase):
+    def test_resume_reruns_only_failed_stages_and_their_dependents(self):
+        """恢复运行时跳过已完成的阶段，失败阶段及其下游重新执行"""
+        checkpoint = MemoryCheckpoint()
+        calls = []
+        fail = {"b": True}
+
+        def stage(name, inputs):
+            async def run(received):
+                calls.append(name)
+                if fail.get(name):
+                    raise RuntimeError("boom")
+                return name
+            return PipelineStage(name, run, inputs, name.upper())
+
+        def build():
+            return [stage("a", []), stage("b", []), stage("c", ["a"]), stage("d", ["b"])]
+
+        asyncio.run(StageScheduler(build(), checkpoint=checkpoint).run())
+        self.assertEqual(checkpoint.data["b"], (None, "失败"))
+
+        calls.clear()
+        fail["b"] = False
+        scheduler = StageScheduler(build(), checkpoint=checkpoint, resume=True)
+        outputs = asyncio.run(scheduler.run())
+        self.assertEqual(sorted(calls), ["b", "d"])
+        self.assertEqual(outputs, {"a": "a", "b": "b", "c": "c", "d": "d"})
+        self.assertEqual(scheduler.stage_status["A"], RESTORED_STATUS)
+        self.assertEqual(scheduler.stage_status["D"], "完成")
+
+    def test_resume_reuses_skipped_stages(self):
+        """确定的“跳过”结果与“完成”一样从检查点复用，下游不再重新执行；“部分失败”的阶段重新执行"""
+        checkpoint = MemoryCheckpoint()
+        calls = []
+        statuses = {"img": "跳过 (无图片)", "llm": "部分失败"}
+
+        def stage(name, inputs):
+            async def run(received):
+                calls.append(name)
+                return StageOutcome(name, statuses.get(name, "完成"))
+            return PipelineStage(name, run, inputs, name.upper())
+
+        def build():
+            return [stage("pdf", []), stage("img", ["pdf"]), stage("llm", ["pdf"]), stage("deep", ["img"])]
+
+        asyncio.run(StageScheduler(build(), checkpoint=checkpoint).run())
+        calls.clear()
+        statuses["llm"] = "完成"
+        scheduler = StageScheduler(build(), checkpoint=checkpoint, resume=True)
+        asyncio.run(scheduler.run())
+        self.assertEqual(calls, ["llm"])
+        self.assertEqual(scheduler.stage_status["IMG"], "跳过 (无图片) (检查点恢复)")
+        self.assertEqual(scheduler.stage_status["DEEP"], RESTORED_STATUS)
+
+    def test_checkpoint_manager_round_trip(self):
+        """检查点按PDF哈希和DOI区分存储"""
+        import tempfile
+        from slais import config
+        from agents.cache.checkpoint_manager import CheckpointManager
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with mock.patch.object(config.settings, "CACHE_DIR", tmp_dir):
+                manager = CheckpointManager()
+                manager.set_stage("hash", "10.1/x", "metadata", {"pmid": "1"}, "完成")
+                self.assertEqual(manager.get_stage("hash", "10.1/x", "metadata"), ({"pmid": "1"}, "完成"))
+                self.assertIsNone(manager.get_stage("hash", "10.1/y", "metadata"))
+                manager.clear("hash", "10.1/x")
+                self.assertIsNone(manager.get_stage("hash", "10.1/x", "metadata"))
+                manager.close()
+
+
+class FakeAgent:
+    """模拟各智能体，每个调用耗时固定"""
+    def __init__(self, delay=0.2):
+        self.delay = delay
+
+    async def _sleep_and_return(self, value):
+        await asyncio.sleep(self.delay)
+        return value
+
+    def extract_content(self, pdf_path):
+        return self._sleep_and_return("# Title\n\nBody")
+
+    def fetch_metadata(self, doi, email):
+        return self._sleep_and_return({"pubmed_info": {"pmid": "1"}, "s2_info": {"paperId": "p"}})
+
+    def fetch_references(self, paper_id, email):
+        return self._sleep_and_return({"full_references_details": []})
+
+    def fetch_related_articles(self, pmid, email):
+        return self._sleep_and_return([])
+
+    def analyze_methodology(self, content, callbacks=None):
+        return self._sleep_and_return("方法")
+
+    extract_innovations = tell_story = generate_mindmap = analyze_methodology
+
+    def generate_questions(self, content, callbacks=None):
+        return self._sleep_and_return(["问题1"])
+
+    def generate_answers_batch(self, questions, content, callbacks=None):
+        return self._sleep_and_return([{"question": q, "answer": "答"} for q in questions])
+
+    def analyze_deeply(self, **kwargs):
+        return self._sleep_and_return("深度")
+
+
+class TestPipelineStages(unittest.TestCase):
+    def test_pipeline_overlaps_doi_stages_with_pdf_parsing(self):
+        """元数据等仅依赖DOI的阶段应与PDF解析及LLM分析并发"""
+        from app import process_article_pipeline
+
+        fake = FakeAgent()
+        agents = {name: fake for name in [
+            "pdf_parser", "metadata_fetcher", "methodology_analyzer", "innovation_extractor",
+            "qa_generator", "storytelling_agent", "mindmap_agent", "deep_analyzer", "image_agent"
+        ]}
+        agents.update({"llm": None, "image_llm": None})
+
+        # 避免 tiktoken 在测试环境中下载编码表
+        fake_encoding = mock.Mock(encode=lambda text: text.split())
+        with mock.patch("tiktoken.encoding_for_model", return_value=fake_encoding):
+            result = asyncio.run(process_article_pipeline(
+                "no_such_dir/stage_graph_test_paper.pdf", "10.1000/x", "test@example.com", agents=agents
+            ))
+        costs = result["stage_costs"]
+        results = result["analysis_results"]
+        self.assertEqual(results["qa_pairs"], [{"question": "问题1", "answer": "答"}])
+        self.assertEqual(results["deep_analysis"], "深度")
+        self.assertEqual(result["stage_status"]["图片内容分析"], "跳过 (LLM未初始化)")
+        # 串行执行需要约 1.4 秒，并发执行时关键路径约为 0.8 秒
+        self.assertLess(costs[WALL_CLOCK_KEY], 1.2)
+        self.assertLessEqual(costs[CRITICAL_PATH_KEY], costs[WALL_CLOCK_KEY] + 0.05)
+
+    def test_failed_analysis_section_marks_stage_partial(self):
+        """任一分析项出错时LLM初步分析记为部分失败，恢复运行时会重新执行"""
+        from app import process_article_pipeline
+
+        class FailingStoryAgent(FakeAgent):
+            def tell_story(self, content, callbacks=None):
+                return self._sleep_and_return("错误：LLM分析失败 (timeout)")
+
+        fake = FakeAgent(delay=0.01)
+        agents = {name: fake for name in [
+            "pdf_parser", "metadata_fetcher", "methodology_analyzer", "innovation_extractor",
+            "qa_generator", "mindmap_agent", "deep_analyzer", "image_agent"
+        ]}
+        agents.update({"storytelling_agent": FailingStoryAgent(delay=0.01), "llm": None, "image_llm": None})
+
+        fake_encoding = mock.Mock(encode=lambda text: text.split())
+        with mock.patch("tiktoken.encoding_for_model", return_value=fake_encoding):
+            result = asyncio.run(process_article_pipeline(
+                "no_such_dir/stage_graph_partial_paper.pdf", "10.1000/y", "test@example.com", agents=agents
+            ))
+        self.assertEqual(result["stage_status"]["LLM初步分析"], PARTIAL_STATUS)
+        self.assertEqual(result["analysis_results"]["methodology_analysis"], "方法")
+
+    def test_checkpoint_connection_is_closed_after_run(self):
+        """每篇文献的检查点数据库连接在流程结束后关闭"""
+        import tempfile
+        from slais import config
+        from app import process_article_pipeline
+        from agents.cache.checkpoint_manager import CheckpointManager
+
+        fake = FakeAgent(delay=0.01)
+        agents = {name: fake for name in [
+            "pdf_parser", "metadata_fetcher", "methodology_analyzer", "innovation_extractor",
+            "qa_generator", "storytelling_agent", "mindmap_agent", "deep_analyzer", "image_agent"
+        ]}
+        agents.update({"llm": None, "image_llm": None})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pdf_path = os.path.join(tmp_dir, "paper.pdf")
+            with open(pdf_path, "wb") as f:
+                f.write(b"%PDF-1.4 test")
+            fake_encoding = mock.Mock(encode=lambda text: text.split())
+            with mock.patch.object(config.settings, "CACHE_DIR", tmp_dir), \
+                    mock.patch.object(config.settings, "OUTPUT_BASE_DIR", tmp_dir), \
+                    mock.patch.object(config.settings, "PIPELINE_CHECKPOINTS_ENABLED", True), \
+                    mock.patch.object(CheckpointManager, "close", autospec=True,
+                                      side_effect=CheckpointManager.close) as close, \
+                    mock.patch("tiktoken.encoding_for_model", return_value=fake_encoding):
+                asyncio.run(process_article_pipeline(pdf_path, "10.1000/z", "test@example.com", agents=agents))
+            self.assertEqual(close.call_count, 1)
+            self.assertIsNone(close.call_args[0][0].conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
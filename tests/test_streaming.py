@@ -0,0 +1,93 @@
+"""
+测试分析结果的流式输出：智能体的 astream 转发、缓存结果回放与CLI输出 (agents/base_agent.py, app.py)
+"""
+import unittest
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from agents.callbacks import token_usage_from_result
+from agents.llm_analysis_agent import StorytellingAgent
+from app import ConsoleStreamPrinter
+
+
+class TestAgentStreaming(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_patch = mock.patch.object(config.settings, "CACHE_DIR", self.tmp_dir.name)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_partial_output_is_forwarded_and_cached_result_replays(self):
+        """流式生成时回调收到逐步增长的文本；缓存命中时立即以完整结果回调一次"""
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content="从前 有一篇 论文")]))
+        partials = []
+        story = asyncio.run(StorytellingAgent(llm).tell_story("内容", stream_callback=partials.append))
+
+        self.assertEqual(story, "从前 有一篇 论文")
+        self.assertGreater(len(partials), 1)
+        self.assertEqual(partials[-1], story)
+        self.assertTrue(all(later.startswith(earlier) for earlier, later in zip(partials, partials[1:])))
+
+        replayed = []
+        exhausted = GenericFakeChatModel(messages=iter([]))
+        cached = asyncio.run(StorytellingAgent(exhausted).tell_story("内容", stream_callback=replayed.append))
+        self.assertEqual(cached, story)
+        self.assertEqual(replayed, [story])
+
+    def test_failing_callback_does_not_break_analysis(self):
+        """界面回调出错时分析照常完成"""
+        def broken(text):
+            raise RuntimeError("界面已关闭")
+
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content="完整 的 故事")]))
+        self.assertEqual(asyncio.run(StorytellingAgent(llm).tell_story("另一内容", stream_callback=broken)), "完整 的 故事")
+
+    def test_streamed_usage_is_read_from_message(self):
+        """流式调用没有 llm_output 时，从消息的 usage_metadata 读取Token用量"""
+        message = AIMessage(content="答", usage_metadata={
+            "input_tokens": 100, "output_tokens": 20, "total_tokens": 120,
+            "input_token_details": {"cache_read": 60},
+        })
+        usage = token_usage_from_result(LLMResult(generations=[[ChatGeneration(message=message)]]))
+        self.assertEqual(usage["prompt_tokens"], 100)
+        self.assertEqual(usage["completion_tokens"], 20)
+        self.assertEqual(usage["prompt_tokens_details"]["cached_tokens"], 60)
+
+
+class TestConsoleStreamPrinter(unittest.TestCase):
+    def test_sections_are_printed_one_at_a_time(self):
+        """并发生成的部分不交错打印：当前部分完成后再输出缓存的下一部分"""
+        out = io.StringIO()
+        printer = ConsoleStreamPrinter(out)
+        printer("story", "从前", False)
+        printer("deep_analysis", "深度", False)
+        printer("story", "从前有座山", False)
+        printer("deep_analysis", "深度分析", False)
+        self.assertNotIn("深度", out.getvalue())
+
+        printer("story", "从前有座山。", True)
+        printer("deep_analysis", "深度分析完成", True)
+        text = out.getvalue()
+        self.assertIn("从前有座山。\n", text)
+        self.assertLess(text.index("从前有座山。"), text.index("深度分析完成"))
+        self.assertEqual(text.count("从前"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+测试按Token的预算分配与章节边界截断 (agents/token_budget.py, agents/base_agent.py)
+"""
+import unittest
+import asyncio
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slais import config
+from agents import token_budget
+from agents.token_budget import TokenBudget, model_context_window
+from agents.llm_analysis_agent import MethodologyAnalysisAgent
+
+
+def make_paper(sections: int, words_per_section: int) -> str:
+    parts = ["Title\n\nAbstract."]
+    for i in range(sections):
+        parts.append(f"# Section{i}\n\n" + " ".join(f"w{i}" for _ in range(words_per_section)))
+    return "\n\n".join(parts)
+
+
+class TestTokenBudget(unittest.TestCase):
+    def setUp(self):
+        """使用近似估算（不依赖编码表下载），并清空共享的Token数缓存"""
+        self.patches = [
+            mock.patch.object(token_budget, "get_tokenizer", return_value=None),
+            mock.patch.object(config.settings, "LLM_CONTEXT_WINDOW", 0),
+        ]
+        for patch in self.patches:
+            patch.start()
+        token_budget._TOKEN_COUNT_CACHE.clear()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_context_window_lookup(self):
+        """按最长前缀匹配模型名，配置的 LLM_CONTEXT_WINDOW 优先"""
+        self.assertEqual(model_context_window("gpt-4o-mini"), 128000)
+        self.assertEqual(model_context_window("gpt-4-0613"), 8192)
+        self.assertEqual(model_context_window("unknown-model"), token_budget.DEFAULT_CONTEXT_WINDOW)
+        with mock.patch.object(config.settings, "LLM_CONTEXT_WINDOW", 1000):
+            self.assertEqual(model_context_window("gpt-4o"), 1000)
+        self.assertEqual(TokenBudget("gpt-4", output_reserve=1000).prompt_budget, 7192)
+
+    def test_approximate_count(self):
+        """编码器不可用时，中文每字约1个Token，英文约4个字符1个Token"""
+        budget = TokenBudget("gpt-4o")
+        self.assertEqual(budget.count("研究方法"), 4)
+        self.assertEqual(budget.count("abcdefgh"), 2)
+        self.assertEqual(budget.count(""), 0)
+
+    def test_counts_are_memoized_by_content(self):
+        """同一文本只编码一次，不同智能体实例共享缓存"""
+        tokenizer = mock.Mock(name="tokenizer")
+        tokenizer.name = "fake"
+        tokenizer.encode.side_effect = lambda text: text.split()
+        with mock.patch.object(token_budget, "get_tokenizer", return_value=tokenizer):
+            paper = make_paper(3, 50)
+            first = TokenBudget("gpt-4o").count(paper)
+            second = TokenBudget("gpt-4o").count(paper)
+        self.assertEqual(first, second)
+        self.assertEqual(tokenizer.encode.call_count, 1)
+
+    def test_truncate_keeps_whole_sections(self):
+        """截断结果由开头的完整章节组成，不会从章节中间切断"""
+        budget = TokenBudget("gpt-4o")
+        paper = make_paper(5, 100)
+        result = budget.truncate(paper, 320)
+        self.assertLessEqual(budget.count(result), 320)
+        self.assertTrue(paper.startswith(result))
+        self.assertIn("# Section1", result)
+        self.assertNotIn("# Section3", result)
+        self.assertTrue(result.endswith("w2") or result.endswith("w1"))
+        self.assertEqual(budget.truncate(paper, 100000), paper)
+
+    def test_allocate_redistributes_unused_budget(self):
+        """较短部分只占用实际长度，剩余预算按权重分给其他部分"""
+        budget = TokenBudget("gpt-4o")
+        parts = {"content": "a" * 4000, "image_analysis": "b" * 40, "references_summary": "c" * 4000}
+        limits = budget.allocate(parts, {"content": 3, "image_analysis": 1, "references_summary": 1}, 610)
+        self.assertEqual(limits["image_analysis"], 10)
+        self.assertEqual(limits["content"], 450)
+        self.assertEqual(limits["references_summary"], 150)
+
+        fitted = budget.fit(parts, {"content": 3, "image_analysis": 1, "references_summary": 1}, 610)
+        self.assertEqual(fitted["image_analysis"], parts["image_analysis"])
+        self.assertLessEqual(budget.count(fitted["content"]), 450)
+
+
+class TestAgentFitsContextWindow(unittest.TestCase):
+    def setUp(self):
+        """设置测试环境"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(config.settings, "CACHE_DIR", self.tmp_dir.name),
+            mock.patch.object(token_budget, "get_tokenizer", return_value=None),
+            mock.patch.object(config.settings, "LLM_CONTEXT_WINDOW", 2000),
+            mock.patch.object(config.settings, "LLM_OUTPUT_TOKEN_RESERVE", 500),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_prompt_is_cut_at_section_boundary(self):
+        """超过上下文窗口的文献在发送前按章节截断，提示词总长度不超过预算"""
+        prompts = []
+
+        def respond(prompt_value):
+            prompts.append(prompt_value.to_string())
+            return AIMessage(content="方法学分析")
+
+        agent = MethodologyAnalysisAgent(RunnableLambda(respond))
+        paper = make_paper(20, 200)
+        self.assertEqual(asyncio.run(agent.analyze_methodology(paper)), "方法学分析")
+
+        sent = prompts[0]
+        self.assertLessEqual(agent.token_budget.count(sent), 1500)
+        self.assertIn("# Section0", sent)
+        self.assertNotIn("# Section19", sent)
+
+    def test_large_window_model_keeps_more_than_char_limit(self):
+        """大上下文窗口的模型不再按 MAX_CONTENT_CHARS_FOR_LLM 预先截断，完整发送超过该字符数的文献"""
+        prompts = []
+
+        def respond(prompt_value):
+            prompts.append(prompt_value.to_string())
+            return AIMessage(content="方法学分析")
+
+        paper = make_paper(20, 200)
+        with mock.patch.object(config.settings, "LLM_CONTEXT_WINDOW", 0), \
+                mock.patch.object(config.settings, "OPENAI_API_MODEL", "gpt-4o"), \
+                mock.patch.object(config.settings, "MAX_CONTENT_CHARS_FOR_LLM", 5000):
+            agent = MethodologyAnalysisAgent(RunnableLambda(respond))
+            self.assertEqual(asyncio.run(agent.analyze_methodology(paper)), "方法学分析")
+
+        self.assertGreater(len(paper), 5000)
+        self.assertIn(paper, prompts[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+测试提示词的共享前缀和Token统计中的缓存命中计费 (agents/prompts.py, agents/callbacks.py)
+"""
+import unittest
+import os
+import sys
+from unittest import mock
+
+from langchain_core.outputs import LLMResult
+from langchain.prompts import PromptTemplate
+
+# 将项目根目录添加到sys.path，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import callbacks, prompts
+from agents.callbacks import TokenUsageCallbackHandler, cached_prompt_tokens
+
+
+class TestPromptPrefix(unittest.TestCase):
+    def test_analysis_prompts_share_leading_content_block(self):
+        """各分析提示词渲染后，文献内容和图片分析之前的部分完全相同"""
+        values = {
+            "content": "文献全文", "image_analysis": "图片描述", "num_questions": 5,
+            "questions_json_list_string": "[]", "references_summary": "参考", "related_articles_summary": "相关",
+        }
+        shared = PromptTemplate.from_template(prompts.PAPER_CONTEXT_PREFIX).format(content="文献全文", image_analysis="图片描述")
+        for name in ("METHODOLOGY_ANALYSIS_PROMPT", "INNOVATION_EXTRACTION_PROMPT", "QA_GENERATION_PROMPT",
+                     "BATCH_ANSWER_GENERATION_PROMPT", "STORYTELLING_PROMPT", "MINDMAP_PROMPT",
+                     "COMBINED_ANALYSIS_PROMPT", "DEEP_ANALYSIS_PROMPT"):
+            template = PromptTemplate.from_template(getattr(prompts, name))
+            rendered = template.format(**{k: v for k, v in values.items() if k in template.input_variables})
+            self.assertTrue(rendered.startswith(shared), name)
+
+
+class TestTokenUsageCallback(unittest.TestCase):
+    def setUp(self):
+        fake_encoding = mock.Mock(encode=lambda text: text.split())
+        with mock.patch("tiktoken.encoding_for_model", return_value=fake_encoding):
+            self.handler = TokenUsageCallbackHandler(model_name="priced-model")
+        self.costs_patch = mock.patch.dict(callbacks.MODEL_COST_PER_TOKEN, {
+            "priced-model": {"prompt": 0.01, "completion": 0.02}
+        })
+        self.costs_patch.start()
+
+    def tearDown(self):
+        self.costs_patch.stop()
+
+    def test_cached_tokens_are_read_from_both_formats(self):
+        """OpenAI 的 prompt_tokens_details 与 DeepSeek 的 prompt_cache_hit_tokens 均可识别"""
+        self.assertEqual(cached_prompt_tokens({"prompt_tokens_details": {"cached_tokens": 128}}), 128)
+        self.assertEqual(cached_prompt_tokens({"prompt_cache_hit_tokens": 64}), 64)
+        self.assertEqual(cached_prompt_tokens({"prompt_tokens_details": None}), 0)
+
+    def test_cached_tokens_are_discounted(self):
+        """缓存命中的提示Token按折扣单价计费，并统计节省的金额"""
+        usage = {"prompt_tokens": 1000, "completion_tokens": 100, "prompt_tokens_details": {"cached_tokens": 800}}
+        with mock.patch.object(callbacks, "CACHED_PROMPT_COST_RATIO", 0.25):
+            self.handler.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": usage}))
+        totals = self.handler.get_total_usage_and_cost()
+
+        self.assertEqual(totals["total_cached_prompt_tokens"], 800)
+        # 200 * 0.01 + 800 * 0.0025 + 100 * 0.02
+        self.assertAlmostEqual(totals["total_cost"], 6.0)
+        self.assertAlmostEqual(totals["cache_savings"], 6.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 import streamlit as st
 import asyncio
+import time
 import nest_asyncio
 from pathlib import Path
 
-from app import process_article_pipeline
+from app import process_article_pipeline, STREAM_SECTION_TITLES
 from slais import config
 # 从 slais.utils.logging_utils 导入 get_log_file_path 和 logger
 from slais.utils.logging_utils import get_log_file_path, logger
@@ -11,6 +12,30 @@ from slais.utils.logging_utils import get_log_file_path, logger
 # 确保nest_asyncio在导入其他模块前应用
 nest_asyncio.apply()
 
+# 同一部分两次渲染之间的最短间隔（秒），避免每个Token都重绘页面
+STREAM_RENDER_INTERVAL = 0.2
+
+class StreamingSections:
+    """
+    把各项分析的流式输出逐步渲染到页面：每个部分在首次输出时创建标题和占位符，
+    之后按 STREAM_RENDER_INTERVAL 节流刷新，部分完成时渲染最终结果。
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self.placeholders = {}
+        self.last_render = {}
+
+    def __call__(self, section: str, text: str, finished: bool = False):
+        now = time.monotonic()
+        if section not in self.placeholders:
+            self.container.markdown(f"#### {STREAM_SECTION_TITLES.get(section, section)}")
+            self.placeholders[section] = self.container.empty()
+        elif not finished and now - self.last_render[section] < STREAM_RENDER_INTERVAL:
+            return
+        self.last_render[section] = now
+        self.placeholders[section].markdown(text if finished else text + " ▌")
+
 def run_analysis(analyze_button, article_doi, ncbi_email, pdf_path, pdf_stem, progress_bar, step_text, result_placeholder):
     if analyze_button:
         # 重置状态，开始新的分析
@@ -38,6 +63,9 @@ def run_analysis(analyze_button, article_doi, ncbi_email, pdf_path, pdf_stem, pr
 
         loop = asyncio.get_event_loop()
 
+        # 各项分析生成过程中的实时输出
+        stream_sections = StreamingSections(st.container())
+
         async def run_pipeline_with_progress():
             def update_ui_progress(percentage: int, text: str):
                 progress_bar.progress(percentage, text=text)
@@ -48,7 +76,8 @@ def run_analysis(analyze_button, article_doi, ncbi_email, pdf_path, pdf_stem, pr
                 pdf_path=pdf_path,
                 article_doi=article_doi,
                 ncbi_email=ncbi_email,
-                progress_callback=update_ui_progress
+                progress_callback=update_ui_progress,
+                stream_callback=stream_sections
             )
             return pipeline_result
 
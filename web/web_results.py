@@ -13,7 +13,8 @@ from io import BytesIO
 
 from app import save_report
 from web.web_ui import get_log_file_path
-from slais import config
+from slais.pdf_utils import paper_output_dir
+from slais.stage_graph import WALL_CLOCK_KEY, CRITICAL_PATH_KEY
 from web.web_ui import load_css_file
 from slais.utils.logging_utils import logger
 
@@ -120,7 +121,8 @@ def display_results():
 """, unsafe_allow_html=True)
         st.markdown("### 各阶段完成时间与耗时")
         # 合并所有阶段的键，确保显示所有阶段
-        all_stages = set(stage_times.keys()) | set(stage_status.keys()) | set(stage_costs.keys())
+        summary_keys = [WALL_CLOCK_KEY, CRITICAL_PATH_KEY]
+        all_stages = (set(stage_times.keys()) | set(stage_status.keys()) | set(stage_costs.keys())) - set(summary_keys)
         if all_stages:
             st.markdown(
                 "<table class='slais-stage-table'>"
@@ -129,6 +131,10 @@ def display_results():
                     f"<tr><td>{k}</td><td>{stage_times.get(k, '未完成')}</td><td>{stage_costs.get(k, 0.0):.2f}</td><td>{stage_status.get(k, '未开始')}</td></tr>"
                     for k in sorted(all_stages)
                 )
+                + "".join(
+                    f"<tr><td><b>{k}</b></td><td>-</td><td><b>{stage_costs[k]:.2f}</b></td><td>-</td></tr>"
+                    for k in summary_keys if k in stage_costs
+                )
                 + "</tbody></table>",
                 unsafe_allow_html=True
             )
@@ -140,12 +146,9 @@ def display_results():
             result_placeholder.success("解析完成！")
             # 保存报告
             save_report(results, pdf_path)
-            # 预览Markdown报告
-            output_base_dir = Path(config.settings.OUTPUT_BASE_DIR)
-            all_md_files = sorted(output_base_dir.glob("**/*_analysis_report_*.md"), key=os.path.getmtime, reverse=True)
-            md_files = [f for f in all_md_files if pdf_stem in f.parent.name or pdf_stem in f.name]
-            if not md_files and all_md_files:
-                md_files = all_md_files[:1]
+            # 预览Markdown报告：只在本文献的输出目录（按内容哈希区分同名文献）中查找最新的报告
+            paper_dir = paper_output_dir(pdf_path)
+            md_files = sorted(paper_dir.glob(f"{pdf_stem}_analysis_report_*.md"), key=os.path.getmtime, reverse=True)
             
             if md_files:
                 with open(md_files[0], "r", encoding="utf-8") as f: